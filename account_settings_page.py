@@ -3,16 +3,27 @@
 """
 アカウント/権限設定タブ
 """
-import json
 import os
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QGroupBox, QFormLayout, QLineEdit,
     QCheckBox, QPushButton, QMessageBox, QHBoxLayout
 )
+from record_codec import load_json_file, save_json_file
 
 ACCOUNT_CONFIG_FILE = "account_settings.json"
 
 
+def load_account_settings(path=ACCOUNT_CONFIG_FILE):
+    """アカウント設定を読み込む（未設定の場合は空の辞書）"""
+    return load_json_file(path) or {}
+
+
+def has_permission(key, settings=None):
+    """権限が付与されているか（key は "update"・"delete" など）"""
+    settings = load_account_settings() if settings is None else settings
+    return bool(settings.get("permissions", {}).get(key, False))
+
+
 class AccountSettingsPage(QWidget):
     """簡易的な権限管理設定ウィジェット"""
 
@@ -76,8 +87,7 @@ class AccountSettingsPage(QWidget):
         if not os.path.exists(ACCOUNT_CONFIG_FILE):
             return
 
-        with open(ACCOUNT_CONFIG_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = load_json_file(ACCOUNT_CONFIG_FILE)
 
         self.account_name_input.setText(data.get("display_name", ""))
         self.role_input.setText(data.get("role", ""))
@@ -92,8 +102,7 @@ class AccountSettingsPage(QWidget):
             "permissions": {key: cb.isChecked() for key, cb in self.permission_checks.items()}
         }
 
-        with open(ACCOUNT_CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        save_json_file(ACCOUNT_CONFIG_FILE, data)
 
         QMessageBox.information(self, "成功", "アカウント設定を保存しました。")
 
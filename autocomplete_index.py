@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+入力補完用インデックスモジュール
+登録履歴から品種・製造ロット番号の前方一致候補を高速に検索する
+
+値はソート済みリストで保持し、二分探索で前方一致の先頭を求める。
+検索は O(log n + 候補数) のため、100万件のロット番号でも1ms未満で候補を返す。
+
+一括インポートなどで一度に多くの値を追加する場合は、追記通知の中（登録の処理）で全体を並べ直さず、
+追加分だけのソート済みリストに置いて検索時に両方を見る。別スレッドで本体のリストに統合する。
+"""
+import threading
+from bisect import bisect_left, insort
+from heapq import merge
+from itertools import islice
+
+DEFAULT_LIMIT = 20
+
+# これより多くの値を一度に追加する場合は挿入せず、別スレッドで統合する
+_MERGE_THRESHOLD = 64
+
+
+def _prefix_range(values, prefix, limit):
+    """ソート済みリストから前方一致する値を最大 limit 件返す"""
+    start = bisect_left(values, prefix)
+    end = min(start + limit, len(values))
+    result = []
+    for i in range(start, end):
+        value = values[i]
+        if not value.startswith(prefix):
+            break
+        result.append(value)
+    return result
+
+
+class PrefixIndex:
+    """前方一致検索用のソート済みインデックス"""
+
+    def __init__(self, values=()):
+        self._lock = threading.Lock()
+        self._set = {v for v in values if v}
+        # (本体, 統合待ちの追加分)。検索中に差し替わっても組がずれないよう1つの組で持つ
+        self._lists = (sorted(self._set), [])
+        self._merging = False
+
+    def __len__(self):
+        values, pending = self._lists
+        return len(values) + len(pending)
+
+    def add(self, value):
+        """1件追加（登録済みの値は無視）"""
+        self.update([value])
+
+    def update(self, values):
+        """複数件をまとめて追加"""
+        with self._lock:
+            new_values = {v for v in values if v} - self._set
+            if not new_values:
+                return
+            self._set |= new_values
+            current, pending = self._lists
+            if not pending and not self._merging and len(new_values) <= _MERGE_THRESHOLD:
+                for value in new_values:
+                    insort(current, value)
+                return
+            # 追加分だけを並べ、本体への統合は別スレッドで行う
+            self._lists = (current, list(merge(pending, sorted(new_values))))
+            if not self._merging:
+                self._merging = True
+                threading.Thread(target=self._merge_pending, name="prefix-index-merge", daemon=True).start()
+
+    def _merge_pending(self):
+        """統合待ちの追加分を本体に統合する（検索中のリストは書き換えず、新しいリストに差し替える）"""
+        while True:
+            with self._lock:
+                values, pending = self._lists
+                if not pending:
+                    self._merging = False
+                    return
+            merged = list(merge(values, pending))
+            with self._lock:
+                rest = self._lists[1]
+                if rest is not pending:
+                    # 統合中に追加された分は次の統合に回す
+                    done = set(pending)
+                    rest = [v for v in rest if v not in done]
+                else:
+                    rest = []
+                self._lists = (merged, rest)
+
+    def search(self, prefix, limit=DEFAULT_LIMIT):
+        """前方一致する値を辞書順に最大 limit 件返す"""
+        values, pending = self._lists
+        result = _prefix_range(values, prefix, limit)
+        if pending:
+            result = list(islice(merge(result, _prefix_range(pending, prefix, limit)), limit))
+        return result
+
+
+class HistoryIndex:
+    """品種・製造ロット番号の入力補完用インデックス
+
+    store に登録すると、以降の登録（画面・一括インポート・測定器）で自動的に更新される。
+    """
+
+    def __init__(self):
+        self.products = PrefixIndex()
+        self.lots = PrefixIndex()
+        self.ready = False
+
+    def attach(self, store, background=True):
+        """保存先の履歴からインデックスを作成し、以降の追記を反映する"""
+        # 作成中に追記されたデータも取りこぼさないよう、先に通知を受け取る
+        store.add_listener(self.add_records)
+        if background:
+            threading.Thread(target=self._build, args=(store,), daemon=True).start()
+        else:
+            self._build(store)
+
+    def _build(self, store):
+        records = store.load_records()
+        self.add_records(records)
+        self.ready = True
+
+    def add_records(self, records):
+        """登録データを追加"""
+        self.products.update([r.get("product_name", "") for r in records])
+        self.lots.update([r.get("lot_no", "") for r in records])
+
+    def suggest_products(self, prefix, limit=DEFAULT_LIMIT):
+        """品種の候補"""
+        return self.products.search(prefix, limit) if prefix else []
+
+    def suggest_lots(self, prefix, limit=DEFAULT_LIMIT):
+        """製造ロット番号の候補"""
+        return self.lots.search(prefix, limit) if prefix else []
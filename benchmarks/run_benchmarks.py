@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能計測スクリプト
+Qtをオフスクリーンで動かし、合成したフォーム設定・登録履歴で主要な処理の所要時間を計測する
+
+計測対象:
+- InputPage.reload_config / InputPage.register_data
+- DataViewPage.load_registered_data
+- ConfigPage.update_table
+- Streamlit版の読み込み関数 (load_form_config / load_input_data)
+- RecordStore の読み込み・追記
+- 保存形式ごとの変換速度とサイズ (json / orjson / msgpack / packed)
+
+結果はJSONで出力し、--compare で以前の結果と比較できる。
+
+使い方:
+    python benchmarks/run_benchmarks.py -o bench_results.json
+    python benchmarks/run_benchmarks.py --full -o bench_full.json       # 100万件まで
+    python benchmarks/run_benchmarks.py -o new.json --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Qtを画面なしで動かす（PySide6の import より前に設定する）
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+DATA_TYPES = ["文字列", "数値", "日付", "日付時刻", "時刻", "パスワード"]
+
+FIELD_COUNTS = [10, 100, 1000]
+RECORD_COUNTS = [1000, 10000, 100000]
+FULL_RECORD_COUNTS = [1000, 10000, 100000, 1000000]
+
+# 1回の計測に時間がかかる処理は繰り返し回数を減らす
+SLOW_THRESHOLD = 5.0  # 秒
+
+
+def make_form_config(field_count, seed=0):
+    """項目数 field_count のフォーム設定を生成"""
+    rng = random.Random(seed)
+    config = []
+    for i in range(field_count):
+        data_type = DATA_TYPES[i % len(DATA_TYPES)]
+        field = {
+            "label_name": f"項目{i + 1:04d}",
+            "data_type": data_type,
+            "unit": rng.choice(["", "mm", "V", "kg"]),
+            "is_required": False,
+            "display_order": i + 1,
+            "column_position": 1,
+            "new_row": False,
+            "placeholder": "",
+            "help_text": "",
+        }
+        if data_type == "数値":
+            field["min_value"] = -1000.0
+            field["max_value"] = 1000.0
+        if data_type in ["文字列", "パスワード"]:
+            field["regex_pattern"] = ""
+            field["max_length"] = 255
+        config.append(field)
+    return config
+
+
+def make_detail_value(field, rng, day):
+    """項目のデータ型に応じた値を生成"""
+    data_type = field["data_type"]
+    if data_type == "数値":
+        return round(rng.gauss(10.0, 0.5), 2)
+    if data_type == "日付":
+        return day.strftime("%Y-%m-%d")
+    if data_type == "日付時刻":
+        return day.strftime("%Y-%m-%d %H:%M:%S")
+    if data_type == "時刻":
+        return day.strftime("%H:%M")
+    return rng.choice(["良好", "キズあり", "汚れ", ""])
+
+
+def make_records(record_count, config, seed=0):
+    """登録データを record_count 件生成"""
+    rng = random.Random(seed)
+    products = [f"製品{chr(ord('A') + i)}" for i in range(20)]
+    start = datetime(2024, 1, 1, 8, 0, 0)
+    records = []
+    for i in range(record_count):
+        day = start + timedelta(minutes=i)
+        records.append({
+            "entry_date": day.strftime("%Y-%m-%d"),
+            "product_name": rng.choice(products),
+            "lot_no": f"LOT-{day:%Y%m%d}-{i:07d}",
+            "details": {f["label_name"]: make_detail_value(f, rng, day) for f in config},
+            "registered_at": day.isoformat()
+        })
+    return records
+
+
+def write_json(path, data):
+    """アプリと同じ形式でJSONを書き出す"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+class BenchmarkRunner:
+    """計測の実行と結果の保持"""
+
+    def __init__(self, repeats):
+        self.repeats = repeats
+        self.results = []
+
+    def measure(self, name, params, func, setup=None):
+        """func の所要時間を repeats 回計測する（setup は計測に含めない）"""
+        times = []
+        for _ in range(self.repeats):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - started)
+            if times[-1] > SLOW_THRESHOLD:
+                break
+
+        result = {
+            "name": name,
+            "params": params,
+            "repeats": len(times),
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.mean(times),
+        }
+        self.results.append(result)
+        print(f"{name:45s} {format_params(params):30s} median {result['median'] * 1000:10.2f} ms")
+        return result
+
+    def skip(self, name, reason):
+        """計測できなかった処理を記録"""
+        self.results.append({"name": name, "skipped": reason})
+        print(f"{name:45s} スキップ: {reason}")
+
+
+def format_params(params):
+    return ", ".join(f"{k}={v}" for k, v in params.items())
+
+
+def prepare_files(config, records):
+    """作業ディレクトリにフォーム設定と登録データを書き出す"""
+    write_json("form_config.json", config)
+    write_json("input_data.json", records)
+
+
+def reset_store():
+    """共有の保存先を作り直す（作業ディレクトリの変更を反映）"""
+    import record_store
+    record_store._default_store = None
+
+
+def bench_storage(runner, record_counts):
+    """保存先の読み込み・追記"""
+    from record_store import RecordStore
+
+    config = make_form_config(10)
+    for count in record_counts:
+        prepare_files(config, make_records(count, config))
+        store = RecordStore()
+        runner.measure("RecordStore.load_records", {"records": count}, store.load_records)
+        record = make_records(1, config, seed=1)[0]
+        runner.measure("RecordStore.append_record", {"records": count},
+                       lambda: store.append_record(record))
+
+
+def bench_streamlit(runner, field_counts, record_counts):
+    """Streamlit版の読み込み関数"""
+    try:
+        import input_page
+    except ImportError as e:
+        runner.skip("streamlit.load_form_config", str(e))
+        runner.skip("streamlit.load_input_data", str(e))
+        return
+
+    for fields in field_counts:
+        prepare_files(make_form_config(fields), [])
+        # 読み込み結果はファイルが変わるまでキャッシュされるため、毎回破棄してから計測する
+        runner.measure("streamlit.load_form_config", {"fields": fields}, input_page.load_form_config,
+                       setup=input_page.clear_caches)
+
+    config = make_form_config(10)
+    for count in record_counts:
+        prepare_files(config, make_records(count, config))
+        runner.measure("streamlit.load_input_data", {"records": count}, input_page.load_input_data,
+                       setup=input_page.clear_caches)
+
+
+def bench_codecs(runner, record_counts):
+    """保存形式ごとの変換（1件ずつ）の速度とサイズ"""
+    from record_codec import CODEC_NAMES, PackedCodec, get_codec
+
+    for fields in [10, 100]:
+        config = make_form_config(fields)
+        schema = PackedCodec.from_form_config(config).schema
+        for count in record_counts:
+            if count > 100000:
+                continue
+            records = make_records(count, config)
+
+            # 現在の入力データファイルの形（インデント付きJSON配列）
+            pretty_size = len(json.dumps(records, ensure_ascii=False, indent=2).encode("utf-8"))
+            print(f"{'codec.json_indent2':45s} {format_params({'fields': fields, 'records': count}):30s} "
+                  f"size {pretty_size / 1024:10.1f} KB")
+            runner.results.append({
+                "name": "codec.json_indent2.size", "params": {"fields": fields, "records": count},
+                "bytes": pretty_size,
+            })
+
+            for name in CODEC_NAMES:
+                params = {"fields": fields, "records": count}
+                try:
+                    codec = get_codec(name, schema)
+                except RuntimeError as e:
+                    runner.skip(f"codec.{name}.encode", str(e))
+                    runner.skip(f"codec.{name}.decode", str(e))
+                    continue
+
+                encoded = [codec.dumps(r) for r in records]
+                size = sum(len(data) for data in encoded)
+                result = runner.measure(f"codec.{name}.encode", params,
+                                        lambda: [codec.dumps(r) for r in records])
+                result["bytes"] = size
+                result["records_per_sec"] = count / result["median"] if result["median"] else None
+                result = runner.measure(f"codec.{name}.decode", params,
+                                        lambda: [codec.loads(data) for data in encoded])
+                result["bytes"] = size
+                result["records_per_sec"] = count / result["median"] if result["median"] else None
+                print(f"{'':45s} {'':30s} size {size / 1024:10.1f} KB")
+
+
+def bench_qt(runner, field_counts, record_counts):
+    """PySide6版の画面処理"""
+    qt_names = ["InputPage.reload_config", "InputPage.register_data",
+                "DataViewPage.load_registered_data", "ConfigPage.update_table"]
+    try:
+        from PySide6.QtWidgets import QApplication, QMessageBox
+    except ImportError as e:
+        for name in qt_names:
+            runner.skip(name, str(e))
+        return
+
+    app = QApplication.instance() or QApplication([])
+
+    # 登録時のメッセージボックスで止まらないようにする
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.warning = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.Yes)
+
+    from input_page_qt import InputPage
+    from data_view_page import DataViewPage
+    from config_page_qt import ConfigPage
+
+    # フォームの再生成・設定一覧の表示（項目数）
+    for fields in field_counts:
+        config = make_form_config(fields)
+        prepare_files(config, [])
+        reset_store()
+        page = InputPage()
+        runner.measure("InputPage.reload_config", {"fields": fields}, page.reload_config,
+                       setup=app.processEvents)
+        config_page = ConfigPage()
+        runner.measure("ConfigPage.update_table", {"fields": fields},
+                       lambda: config_page.update_table(config), setup=app.processEvents)
+        page.deleteLater()
+        config_page.deleteLater()
+        app.processEvents()
+
+    # データ登録・データ閲覧（履歴件数）
+    config = make_form_config(10)
+    for count in record_counts:
+        prepare_files(config, make_records(count, config))
+        reset_store()
+        page = InputPage()
+        page.key_index._ready.wait()
+        lot_counter = iter(range(10 ** 9))
+
+        def fill_header():
+            page.product_input.setText("製品A")
+            page.lot_input.setText(f"BENCH-{next(lot_counter)}")
+
+        runner.measure("InputPage.register_data", {"records": count}, page.register_data,
+                       setup=fill_header)
+
+        view = DataViewPage()
+        runner.measure("DataViewPage.load_registered_data", {"records": count},
+                       view.load_registered_data, setup=app.processEvents)
+        page.deleteLater()
+        view.deleteLater()
+        app.processEvents()
+
+
+def git_revision():
+    """計測したソースのリビジョン"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare_results(old, new):
+    """以前の結果と比較して中央値の比を表示"""
+    old_map = {(r["name"], format_params(r["params"])): r for r in old["results"] if "median" in r}
+    print()
+    print(f"比較: {old['meta'].get('revision', '?')} → {new['meta'].get('revision', '?')}")
+    for result in new["results"]:
+        if "median" not in result:
+            continue
+        key = (result["name"], format_params(result["params"]))
+        before = old_map.get(key)
+        if not before or not before["median"]:
+            continue
+        ratio = result["median"] / before["median"]
+        mark = "  ⚠ 遅くなりました" if ratio > 1.2 else ""
+        print(f"{key[0]:45s} {key[1]:30s} x{ratio:6.2f}{mark}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="主要な処理の所要時間を計測します。")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="結果の出力先(JSON)")
+    parser.add_argument("--full", action="store_true", help="100万件の履歴まで計測する")
+    parser.add_argument("--repeats", type=int, default=5, help="1条件あたりの計測回数")
+    parser.add_argument("--compare", metavar="JSON", help="比較対象の以前の結果")
+    args = parser.parse_args(argv)
+
+    record_counts = FULL_RECORD_COUNTS if args.full else RECORD_COUNTS
+    output_path = os.path.abspath(args.output)
+    runner = BenchmarkRunner(args.repeats)
+
+    # 作業用の一時ディレクトリで計測（アプリは相対パスでファイルを読み書きする）
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            bench_storage(runner, record_counts)
+            bench_codecs(runner, record_counts)
+            bench_streamlit(runner, FIELD_COUNTS, record_counts)
+            bench_qt(runner, FIELD_COUNTS, record_counts)
+        finally:
+            os.chdir(original_dir)
+
+    result = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "qt_platform": os.environ.get("QT_QPA_PLATFORM", ""),
+            "repeats": args.repeats,
+        },
+        "results": runner.results,
+    }
+    write_json(output_path, result)
+    print(f"\n結果を出力しました: {output_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare_results(json.load(f), result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+一括インポートモジュール
+測定器が出力したCSV/Excelファイルを読み込み、フォーム項目に対応付けて登録する
+
+ファイルは一定行数ごとのチャンクに分けて読み込み、プロセスプールで解析・検証する。
+同時に処理中のチャンク数を制限するため、メモリに載らない大きさのファイルも扱える。
+
+使い方:
+    python bulk_import.py data.csv --map 測定日=entry_date --map 品名=product_name \\
+        --map ロット=lot_no --map 電圧V=電圧
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import deque
+from datetime import date, datetime, time as time_of_day
+from concurrent.futures import ProcessPoolExecutor
+
+from record_store import get_store, load_form_config
+from record_validation import build_record
+
+# 基本情報の取込先（ファイル列の対応付けに使うキーと表示名）
+HEADER_TARGETS = {
+    "entry_date": "日付",
+    "product_name": "品種",
+    "lot_no": "製造ロット番号",
+}
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def read_csv_header(path, encoding="utf-8-sig"):
+    """CSVファイルの見出し行を読み込む"""
+    with open(path, "r", encoding=encoding, newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def iter_csv_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, encoding="utf-8-sig"):
+    """CSVファイルを (先頭行番号, 行リスト) のチャンク単位で読み込む"""
+    with open(path, "r", encoding=encoding, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # 見出し行
+        chunk = []
+        start_row = 2
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield start_row, chunk
+                start_row += len(chunk)
+                chunk = []
+        if chunk:
+            yield start_row, chunk
+
+
+def _load_openpyxl():
+    """Excel読み込み用ライブラリを読み込む"""
+    try:
+        import openpyxl
+    except ImportError:
+        raise RuntimeError("Excelファイルの取込には openpyxl が必要です。(pip install openpyxl)")
+    return openpyxl
+
+
+def read_excel_header(path):
+    """Excelファイル(先頭シート)の見出し行を読み込む"""
+    workbook = _load_openpyxl().load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        for row in sheet.iter_rows(max_row=1, values_only=True):
+            return ["" if v is None else str(v) for v in row]
+        return []
+    finally:
+        workbook.close()
+
+
+def iter_excel_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Excelファイル(先頭シート)を読み取り専用モードでチャンク単位に読み込む"""
+    workbook = _load_openpyxl().load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        chunk = []
+        start_row = 2
+        for row in sheet.iter_rows(min_row=2, values_only=True):
+            # 日付・数値のセルは型付きの値のまま渡し、解析時に項目の書式に合わせる
+            chunk.append(["" if v is None else v for v in row])
+            if len(chunk) >= chunk_size:
+                yield start_row, chunk
+                start_row += len(chunk)
+                chunk = []
+        if chunk:
+            yield start_row, chunk
+    finally:
+        workbook.close()
+
+
+def is_excel_file(path):
+    """拡張子からExcelファイルかどうかを判定"""
+    return os.path.splitext(path)[1].lower() in [".xlsx", ".xlsm"]
+
+
+def read_header(path):
+    """ファイル形式に応じて見出し行を読み込む"""
+    return read_excel_header(path) if is_excel_file(path) else read_csv_header(path)
+
+
+def iter_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ファイル形式に応じてチャンク単位で読み込む"""
+    if is_excel_file(path):
+        return iter_excel_chunks(path, chunk_size)
+    return iter_csv_chunks(path, chunk_size)
+
+
+def cell_value(value, data_type="文字列"):
+    """セルの値を取込先のデータ型の入力値にする
+
+    Excelの日付・時刻のセルは datetime などで読み込まれるため、取込先の書式の文字列にする。
+    数値項目の数値はそのまま使い、それ以外は文字列にする。
+    """
+    if isinstance(value, datetime):
+        if data_type == "日付時刻":
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        if data_type == "時刻":
+            return value.strftime("%H:%M")
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, time_of_day):
+        return value.strftime("%H:%M")
+    if data_type == "数値" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return "" if value is None else str(value)
+
+
+def guess_mapping(header, config):
+    """見出しと項目名・基本情報名が一致する列を自動で対応付ける"""
+    labels = {field.get("label_name", "") for field in config}
+    mapping = {}
+    for column in header:
+        name = column.strip()
+        for key, display_name in HEADER_TARGETS.items():
+            if name in (key, display_name):
+                mapping[column] = key
+        if name in labels:
+            mapping[column] = name
+    return mapping
+
+
+def parse_chunk(config, header, mapping, start_row, rows):
+    """チャンクを解析・検証する（プロセスプールで実行）
+
+    戻り値は (登録データのリスト, 却下行のリスト)。
+    却下行は (行番号, 元の行, エラーメッセージのリスト)。
+    """
+    column_index = {column: idx for idx, column in enumerate(header)}
+    data_types = {field.get("label_name", ""): field.get("data_type", "文字列") for field in config}
+    data_types["entry_date"] = "日付"
+    data_types["product_name"] = data_types["lot_no"] = "文字列"
+    targets = [(column_index[column], target, data_types.get(target, "文字列"))
+               for column, target in mapping.items() if column in column_index]
+
+    records = []
+    rejected = []
+    for offset, row in enumerate(rows):
+        values = {}
+        for idx, target, data_type in targets:
+            values[target] = cell_value(row[idx], data_type) if idx < len(row) else ""
+
+        record, errors = build_record(
+            config,
+            values.pop("entry_date", ""),
+            values.pop("product_name", ""),
+            values.pop("lot_no", ""),
+            values
+        )
+        if errors:
+            rejected.append((start_row + offset, row, errors))
+        else:
+            records.append(record)
+    return records, rejected
+
+
+def default_reject_path(path):
+    """却下行レポートの既定の出力先"""
+    base, _ = os.path.splitext(path)
+    return f"{base}_rejected.csv"
+
+
+def import_file(path, mapping, store=None, config=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                workers=None, reject_path=None, progress=None, cancelled=None):
+    """ファイルを一括インポートし、結果の集計を返す
+
+    progress: 各チャンク登録後に (処理行数, 登録件数, 却下件数) で呼ばれる
+    cancelled: True を返すと残りのチャンクを読み込まずに終了する
+    """
+    store = store or get_store()
+    config = load_form_config() if config is None else config
+    reject_path = reject_path or default_reject_path(path)
+    header = read_header(path)
+    unknown = [column for column in mapping if column not in header]
+    if unknown:
+        raise ValueError(f"ファイルに存在しない列が指定されています: {', '.join(unknown)}")
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2  # 先読みするチャンク数の上限
+    summary = {"total": 0, "imported": 0, "rejected": 0, "report": None, "elapsed": 0.0}
+    started = time.perf_counter()
+
+    reject_file = None
+    reject_writer = None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            chunks = iter_chunks(path, chunk_size)
+
+            def collect():
+                nonlocal reject_file, reject_writer
+                records, rejected = pending.popleft().result()
+                # チャンクの順番どおりに登録する
+                store.append_records(records)
+                if rejected:
+                    if reject_writer is None:
+                        reject_file = open(reject_path, "w", encoding="utf-8-sig", newline="")
+                        reject_writer = csv.writer(reject_file)
+                        reject_writer.writerow(["行番号", "エラー内容"] + header)
+                    for row_no, row, errors in rejected:
+                        reject_writer.writerow([row_no, " / ".join(errors)] + list(row))
+                summary["total"] += len(records) + len(rejected)
+                summary["imported"] += len(records)
+                summary["rejected"] += len(rejected)
+                if progress:
+                    progress(summary["total"], summary["imported"], summary["rejected"])
+
+            for start_row, rows in chunks:
+                if cancelled and cancelled():
+                    break
+                pending.append(executor.submit(parse_chunk, config, header, mapping, start_row, rows))
+                if len(pending) >= max_pending:
+                    collect()
+            while pending:
+                collect()
+    finally:
+        if reject_file:
+            reject_file.close()
+
+    summary["report"] = reject_path if summary["rejected"] else None
+    summary["elapsed"] = time.perf_counter() - started
+    return summary
+
+
+def parse_mapping_args(values):
+    """「列名=項目名」形式の引数を辞書に変換"""
+    mapping = {}
+    for value in values or []:
+        if "=" not in value:
+            raise ValueError(f"対応付けは「列名=項目名」で指定してください: {value}")
+        column, target = value.split("=", 1)
+        mapping[column.strip()] = target.strip()
+    return mapping
+
+
+def main(argv=None):
+    """コマンドラインから一括インポートを実行"""
+    parser = argparse.ArgumentParser(description="CSV/Excelファイルを一括インポートします。")
+    parser.add_argument("path", help="取込むCSV/Excelファイル")
+    parser.add_argument("--map", action="append", metavar="列名=項目名",
+                        help="ファイルの列とフォーム項目の対応付け（entry_date / product_name / lot_no も指定可）")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="1チャンクの行数")
+    parser.add_argument("--workers", type=int, default=None, help="解析に使うプロセス数")
+    parser.add_argument("--reject-report", default=None, help="却下行レポートの出力先")
+    args = parser.parse_args(argv)
+
+    config = load_form_config()
+    header = read_header(args.path)
+    mapping = guess_mapping(header, config)
+    mapping.update(parse_mapping_args(args.map))
+
+    missing = [key for key in HEADER_TARGETS if key not in mapping.values()]
+    if missing:
+        names = ", ".join(HEADER_TARGETS[key] for key in missing)
+        parser.error(f"基本情報の列が対応付けられていません: {names}")
+
+    def report_progress(total, imported, rejected):
+        print(f"\r処理済み: {total}行 (登録 {imported} / 却下 {rejected})", end="", flush=True)
+
+    summary = import_file(
+        args.path, mapping, config=config, chunk_size=args.chunk_size,
+        workers=args.workers, reject_path=args.reject_report, progress=report_progress
+    )
+    print()
+    print(f"登録: {summary['imported']}件 / 却下: {summary['rejected']}件 "
+          f"({summary['elapsed']:.1f}秒)")
+    if summary["report"]:
+        print(f"却下行レポート: {summary['report']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
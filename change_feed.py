@@ -0,0 +1,595 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+変更フィード（アウトボックス）モジュール
+登録・編集・削除を通し番号付きの変更として順に記録し、MES・データウェアハウスなどの
+下流のシステムへ、保存済みの位置（カーソル）から続きをまとめて渡す
+
+    {"seq": 12, "op": "insert", "record_id": "...", "revision": 0, "record": {...}, "captured_at": "..."}
+    op: insert（登録）/ update（編集・上書き登録）/ delete（削除）/ reset（取り込めない範囲があった）
+    上書き登録は、置き換えた条件（品種・ロット番号・日付）を "replaces" に入れた update になる
+
+変更は保存先の書き込みのロックの中で（RecordStore.add_write_hook()）、書き込んだ内容から作るため、
+登録・上書き登録の処理が戻った時点でフィードにも同じ順で記録されている。入力データファイルの
+どこまでを変更にしたかをフィードの状態 (changes/state.json) に記録し、他のプロセスの登録や、
+変更を書く前に停止した分は、次に書き込むとき・開いたときに続きから取り込む。
+状態とフィードは「予定の記録 → 変更の書き込み → 確定」の順に書くため、途中で停止しても
+変更が抜けたり二重に記録されたりしない。記録に失敗した場合は診断タブに表示し、次の書き込みで取り込み直す。
+
+書庫への移動・整理で入力データファイルが書き直された場合は、最後に取り込んだデータの位置を
+探して、その後に追記された分を取り込む。最後に取り込んだデータがすべて整理・移動されていると
+同じ変更をもう一度渡すことがあるため、下流では record_id と revision で重複を除く。
+最後に取り込んだデータが見つからない場合は、その間の変更を渡せないため "reset" の変更を記録する。
+下流では reset を受け取ったら、登録データAPIの検索などで全件を取り込み直す。
+
+設定ファイル (change_feed_config.json) があるとアプリ・登録受付サーバーが変更を記録する:
+    {"port": 8766}     # 省略すると通知用のソケットを開かない
+
+フィードに書き込むのはアプリまたは登録受付サーバー（保存先に attach() したプロセス）だけで、
+下流のシステムへの渡し方のコマンドは書き込まれたフィードを読むだけ:
+    python change_feed.py --consumer mes --drop outbox/mes --follow   # まとめてファイルに出力し続ける
+    python change_feed.py --serve --port 8766                         # ソケットで待ち受ける
+
+ソケットでは1行1件のJSONで {"consumer": "mes", "limit": 500} を送ると、未読の変更を
+{"changes": [...], "cursor": 12} で返す。{"ack": 12} を送るとカーソルを保存して次をまとめて返す。
+未読の変更がない間は新しい変更が記録されるまで待つ（問い合わせを繰り返す必要はない）。
+"""
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime
+
+import metrics
+from record_store import RecordStore, get_store
+from record_archive import get_archive
+from record_codec import json_codec, load_json_file, save_json_file
+from record_snapshot import source_state, is_source_current
+from record_log import OP_DELETE, OP_UPDATE, current_version, record_id
+from sharded_store import ShardedRecordStore
+
+CHANGE_FEED_CONFIG_FILE = "change_feed_config.json"
+CHANGES_DIR = "changes"
+STATE_FILE = "state.json"
+CURSORS_DIR = "cursors"
+
+# 1ファイルあたりの変更の件数（これを超えたら次のファイルに書く）
+SEGMENT_ENTRIES = 100000
+
+# 入力データファイルが書き直された場合に位置を探すため、最後に取り込んだデータの識別キーを覚えておく件数
+ANCHOR_COUNT = 200
+
+# 1回に渡す変更の件数
+DEFAULT_BATCH_SIZE = 500
+
+# ファイル出力・ソケットで新しい変更を待つ間隔（秒。他のプロセスの登録の取り込みにも使う）
+DEFAULT_WAIT_SECONDS = 5
+
+# 読むだけの場合に状態のファイルを読み直す間隔（秒）
+POLL_INTERVAL_SECONDS = 0.5
+
+DEFAULT_HOST = "127.0.0.1"
+
+OP_INSERT = "insert"
+OP_RESET = "reset"
+
+ERROR_SOURCE = "変更フィードの記録"
+
+
+def load_change_feed_config(path=CHANGE_FEED_CONFIG_FILE):
+    """変更フィードの設定を読み込む（未設定の場合は None）"""
+    return load_json_file(path)
+
+
+def _entry_key(entry):
+    """入力データファイルの要素の識別キー（書き直された後に同じ要素を探すのに使う）"""
+    return f"{record_id(entry)}:{entry.get('revision', 0)}:{entry.get('op', '')}"
+
+
+def to_change(entry):
+    """入力データファイルの要素を変更の形にする"""
+    op = entry.get("op")
+    if op == OP_DELETE:
+        change_op, record = OP_DELETE, current_version(entry)
+    elif op == OP_UPDATE:
+        change_op, record = OP_UPDATE, current_version(entry)
+    else:
+        change_op, record = OP_INSERT, entry
+    return {"op": change_op, "record_id": record_id(entry), "revision": entry.get("revision", 0), "record": record}
+
+
+def reset_change(path):
+    """取り込めない範囲があったことを下流に知らせる変更"""
+    return {"op": OP_RESET, "record_id": None, "revision": None, "record": None, "source": os.path.basename(path)}
+
+
+def _segment_name(first_seq):
+    return f"changes-{first_seq:012d}.jsonl"
+
+
+class ChangeFeed:
+    """変更フィード
+
+    attach() した保存先への登録・編集・削除・上書き登録を、書き込みのロックの中でフィードに書き込む。
+    attach() しない場合は、他のプロセスが書き込んだフィードを読むだけに使う。
+    """
+
+    def __init__(self, directory=CHANGES_DIR):
+        self.directory = directory
+        self.store = None
+        self.last_error = None
+        self._state = None
+        self._segment_count = None
+        self._lock = threading.RLock()
+        self._changed = threading.Condition()
+
+    def attach(self, store):
+        """保存先への登録を記録する（入力データファイルを直接扱う保存先のみ）
+
+        初めて使う場合は、それまでの登録データは変更にしない（既存のデータはAPIなどで取り込む）。
+        """
+        if not isinstance(store, (RecordStore, ShardedRecordStore)):
+            raise ValueError("変更フィードは入力データファイルを直接扱う保存先でのみ使えます。")
+        self.store = store
+        store.add_write_hook(self._on_write)
+        self.sync()
+
+    def _on_write(self, source, entries, start, end, match):
+        """保存先の書き込みのロックの中で、書き込んだ内容を変更として記録する
+
+        前回の記録より後に記録していない書き込みがあれば（他のプロセスの登録・記録の失敗）、
+        先に入力データファイルから取り込む。記録に失敗しても書き込みは止めない。
+        """
+        try:
+            with self._lock:
+                state = self._load()
+                known = state["sources"].get(source.path)
+                if known is None or start is None or known["position"] != start or \
+                        (match is None and os.stat(source.path).st_ino != known["inode"]):
+                    self.sync()
+                    if match is None:
+                        return  # 今回の追記も取り込んだ
+                    state = self._state
+                if match is None:
+                    changes = [to_change(entry) for entry in entries]
+                    keys = [_entry_key(entry) for entry in entries]
+                else:
+                    changes = [
+                        {**to_change(entry), "replaces": match} if entry.get("op") == OP_UPDATE else to_change(entry)
+                        for entry in entries
+                    ]
+                    keys = [_entry_key(current_version(entry)) for entry in entries if entry.get("op") == OP_UPDATE]
+                sources = dict(state["sources"])
+                anchors = dict(state["anchors"])
+                sources[source.path] = source_state(source, get_archive(), end)
+                anchors[source.path] = (anchors.get(source.path, []) + keys)[-ANCHOR_COUNT:]
+                self._write(changes, sources, anchors)
+            self._clear_error()
+        except Exception as e:
+            self._report_error(e)
+
+    def _report_error(self, error):
+        self.last_error = error
+        metrics.report_error(ERROR_SOURCE, error)
+
+    def _clear_error(self):
+        if self.last_error is not None:
+            self.last_error = None
+            metrics.clear_error(ERROR_SOURCE)
+
+    def _sources(self):
+        if isinstance(self.store, ShardedRecordStore):
+            return self.store.shards()
+        return [self.store]
+
+    # --- 書き込み ---
+
+    def sync(self):
+        """入力データファイルに追記された分を変更として記録し、記録した件数を返す"""
+        with self._lock:
+            state = self._load()
+            first_sync = not state.get("initialized")
+            archive = get_archive()
+            sources = dict(state["sources"])
+            anchors = dict(state["anchors"])
+            changes = []
+            for source in self._sources():
+                path = source.path
+                known = sources.get(path)
+                if not os.path.exists(path):
+                    continue
+                if known is None:
+                    records, position = source.load_records_with_position()
+                    if first_sync:
+                        records = records[-ANCHOR_COUNT:]
+                        anchors[path] = [_entry_key(r) for r in records]
+                        records = []
+                elif is_source_current(known, source, archive):
+                    records, position = source.load_records_after(known["position"])
+                else:
+                    records, position = self._after_anchor(source, anchors.get(path) or [])
+                    if records is None:
+                        # 最後に取り込んだデータがすべて書庫へ移された・整理された（間の変更は渡せない）
+                        print(f"変更フィード: {path} の変更を取り込めない範囲がありました（reset を記録します）",
+                              file=sys.stderr)
+                        changes.append(reset_change(path))
+                        records, _ = source.load_records_with_position()
+                        anchors[path] = [_entry_key(r) for r in records[-ANCHOR_COUNT:]]
+                        records = []
+                if position is None:
+                    continue
+                if records:
+                    changes.extend(to_change(r) for r in records)
+                    anchors[path] = (anchors.get(path, []) + [_entry_key(r) for r in records])[-ANCHOR_COUNT:]
+                sources[path] = source_state(source, archive, position)
+            if sources == state["sources"] and not changes and not first_sync:
+                return 0
+            return self._write(changes, sources, anchors)
+
+    def _after_anchor(self, source, anchors):
+        """書き直された入力データファイルで、最後に取り込んだデータより後の要素と終わりの位置
+
+        最後に取り込んだデータが見つからない場合、要素は None。
+        """
+        records, position = source.load_records_with_position()
+        keys = set(anchors)
+        # 整理で記録を反映した元のデータ（同じIDと版番号）は変更として記録済み
+        versions = {key.rsplit(":", 1)[0] for key in keys}
+        for i in range(len(records) - 1, -1, -1):
+            if _entry_key(records[i]) in keys:
+                return [r for r in records[i + 1:] if _entry_key(r).rsplit(":", 1)[0] not in versions], position
+        return None, position
+
+    def _write(self, changes, sources, anchors):
+        """変更を書き込み、状態を確定する（途中で停止した場合は次に開いたときに片付ける）"""
+        state = self._state
+        now = datetime.now().isoformat()
+        seq = state["seq"]
+        lines = []
+        for change in changes:
+            seq += 1
+            lines.append(json_codec().dumps({"seq": seq, **change, "captured_at": now}))
+        committed = {"seq": seq, "sources": sources, "anchors": anchors, "pending": None, "initialized": True}
+        if lines:
+            pending = {"seq": seq, "sources": sources, "anchors": anchors, "initialized": True}
+            self._save_state({**state, "pending": pending})
+            self._append_lines(state["seq"] + 1, lines)
+        self._save_state(committed)
+        self._state = committed
+        if lines:
+            with self._changed:
+                self._changed.notify_all()
+        return len(lines)
+
+    def _append_lines(self, first_seq, lines):
+        segments = self.segment_paths()
+        if segments and self._segment_count is None:
+            self._segment_count = _count_lines(segments[-1])
+        if not segments or self._segment_count >= SEGMENT_ENTRIES:
+            segments.append(os.path.join(self.directory, _segment_name(first_seq)))
+            self._segment_count = 0
+        with open(segments[-1], "ab") as f:
+            f.write(b"".join(line + b"\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self._segment_count += len(lines)
+
+    def _load(self):
+        if self._state is None:
+            os.makedirs(self.directory, exist_ok=True)
+            state = load_json_file(self._state_path()) or {"seq": 0, "sources": {}, "anchors": {}, "pending": None}
+            pending = state.get("pending")
+            if pending:
+                # 前回は変更の書き込み中に停止した
+                if self.last_seq() == pending["seq"]:
+                    state = {**pending, "pending": None}
+                else:
+                    self._truncate(state["seq"])
+                    state["pending"] = None
+                self._save_state(state)
+            self._state = state
+        return self._state
+
+    def _truncate(self, seq):
+        """seq より後の（確定していない）変更を消す"""
+        for path in reversed(self.segment_paths()):
+            kept = [line for line in _read_lines(path) if _line_seq(line) is not None and _line_seq(line) <= seq]
+            if kept:
+                with open(path, "wb") as f:
+                    f.write(b"".join(line + b"\n" for line in kept))
+                break
+            os.remove(path)
+        self._segment_count = None
+
+    def _state_path(self):
+        return os.path.join(self.directory, STATE_FILE)
+
+    def _save_state(self, state):
+        path = self._state_path()
+        with open(path + ".tmp", "wb") as f:
+            f.write(json_codec().dumps(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    # --- 読み込み ---
+
+    def segment_paths(self):
+        """変更のファイル（古い順）"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("changes-") and n.endswith(".jsonl"))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def last_seq(self):
+        """ファイルに書かれている最後の変更の番号（書き込み途中の行は数えない）"""
+        for path in reversed(self.segment_paths()):
+            for line in reversed(_read_lines(path)):
+                seq = _line_seq(line)
+                if seq is not None:
+                    return seq
+        return 0
+
+    def committed_seq(self):
+        """確定した最後の変更の番号（読むだけの場合は書き込むプロセスの状態を読み直す）"""
+        if self.store is None:
+            return (load_json_file(self._state_path()) or {}).get("seq", 0)
+        with self._lock:
+            return self._load()["seq"]
+
+    def read(self, cursor=0, limit=DEFAULT_BATCH_SIZE):
+        """cursor より後の変更を最大 limit 件返す"""
+        end = self.committed_seq()
+        segments = self.segment_paths()
+        # cursor より後の変更を含む最初のファイルから読む（ファイル名が最初の番号）
+        start = 0
+        for i, path in enumerate(segments):
+            if int(os.path.basename(path)[len("changes-"):-len(".jsonl")]) <= cursor + 1:
+                start = i
+        changes = []
+        for path in segments[start:]:
+            with open(path, "rb") as f:
+                for line in f:
+                    seq = _line_seq(line)
+                    if seq is None or seq <= cursor:
+                        continue
+                    if seq > end or len(changes) >= limit:
+                        return changes
+                    changes.append(json_codec().loads(line))
+        return changes
+
+    def wait(self, cursor, timeout=DEFAULT_WAIT_SECONDS):
+        """cursor より後の変更が記録されるまで最大 timeout 秒待ち、記録されたかを返す
+
+        書き込むプロセスでは記録を通知で待ち、待ち終わっても記録がなければ他のプロセスの登録を取り込む。
+        読むだけの場合は状態のファイルを一定間隔で読み直す。
+        """
+        if self.store is None:
+            deadline = time.monotonic() + timeout
+            while self.committed_seq() <= cursor and time.monotonic() < deadline:
+                time.sleep(min(POLL_INTERVAL_SECONDS, max(deadline - time.monotonic(), 0)))
+            return self.committed_seq() > cursor
+        with self._changed:
+            # 通知の待ち合わせ中は書き込みのロックを取らない（状態は置き換えるだけのため、そのまま読める）
+            if self._state["seq"] <= cursor:
+                self._changed.wait(timeout)
+        if self._state["seq"] <= cursor:
+            try:
+                self.sync()
+                self._clear_error()
+            except Exception as e:
+                self._report_error(e)
+        return self._state["seq"] > cursor
+
+    def prune(self):
+        """すべての読み手が読み終えたファイルを削除し、削除したファイル数を返す"""
+        cursors = [Consumer(self, name).cursor for name in self.consumers()]
+        if not cursors:
+            return 0
+        low = min(cursors)
+        segments = self.segment_paths()
+        removed = 0
+        # 次のファイルの最初の番号が low 以下なら、そのファイルはすべて読まれている
+        for path, next_path in zip(segments, segments[1:]):
+            if int(os.path.basename(next_path)[len("changes-"):-len(".jsonl")]) - 1 > low:
+                break
+            os.remove(path)
+            removed += 1
+        return removed
+
+    def consumers(self):
+        """カーソルを保存している読み手"""
+        directory = os.path.join(self.directory, CURSORS_DIR)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def _read_lines(path):
+    with open(path, "rb") as f:
+        return f.read().splitlines()
+
+
+def _line_seq(line):
+    """変更1行の番号（書き込み途中の行は None）"""
+    try:
+        return json_codec().loads(line)["seq"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+class Consumer:
+    """下流のシステム1つ分の読み手（カーソルを changes/cursors/<名前>.json に保存する）"""
+
+    def __init__(self, feed, name):
+        if not name or os.sep in name or name.startswith("."):
+            raise ValueError(f"読み手の名前が正しくありません: {name}")
+        self.feed = feed
+        self.name = name
+        self.path = os.path.join(feed.directory, CURSORS_DIR, f"{name}.json")
+        self.cursor = (load_json_file(self.path) or {}).get("cursor", 0)
+
+    def poll(self, limit=DEFAULT_BATCH_SIZE):
+        """未読の変更を最大 limit 件返す（commit() するまで同じ変更を返す）"""
+        return self.feed.read(self.cursor, limit)
+
+    def commit(self, seq):
+        """seq まで処理したことを保存する"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        save_json_file(self.path + ".tmp", {"cursor": seq, "committed_at": datetime.now().isoformat()})
+        os.replace(self.path + ".tmp", self.path)
+        self.cursor = seq
+
+
+def drop_batch(consumer, directory, limit=DEFAULT_BATCH_SIZE):
+    """未読の変更を1ファイルにまとめて出力し、出力したファイル（なければ None）を返す
+
+    出力先には書き終えたファイルだけが現れる（書き込み中は .tmp）。出力してからカーソルを保存するため、
+    途中で停止した場合は同じ範囲のファイルをもう一度出力する（ファイル名が同じになる）。
+    """
+    changes = consumer.poll(limit)
+    if not changes:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    first, last = changes[0]["seq"], changes[-1]["seq"]
+    path = os.path.join(directory, f"changes-{first:012d}-{last:012d}.jsonl")
+    with open(path + ".tmp", "wb") as f:
+        f.write(b"".join(json_codec().dumps(change) + b"\n" for change in changes))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    consumer.commit(last)
+    return path
+
+
+class _FeedHandler(socketserver.StreamRequestHandler):
+    """ソケットの読み手1つ分の処理"""
+
+    def handle(self):
+        feed = self.server.feed
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+            consumer = Consumer(feed, request.get("consumer", ""))
+            limit = int(request.get("limit") or DEFAULT_BATCH_SIZE)
+        except (ValueError, TypeError) as e:
+            self._send({"ok": False, "error": str(e)})
+            return
+        while True:
+            changes = consumer.poll(limit)
+            if not changes:
+                feed.wait(consumer.cursor)
+                continue
+            self._send({"ok": True, "changes": changes, "cursor": changes[-1]["seq"]})
+            line = self.rfile.readline()
+            if not line:
+                return
+            try:
+                ack = json.loads(line).get("ack")
+            except (ValueError, AttributeError):
+                ack = None
+            if isinstance(ack, int) and consumer.cursor < ack <= changes[-1]["seq"]:
+                consumer.commit(ack)
+
+    def _send(self, message):
+        self.wfile.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class _TcpFeedServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_feed_server(feed, host=DEFAULT_HOST, port=None, unix_path=None):
+    """ソケットでの受け渡しを別スレッドで開始し、サーバーを返す"""
+    if unix_path:
+        server_class = type("_UnixFeedServer", (socketserver.ThreadingUnixStreamServer,), {"daemon_threads": True})
+        server = server_class(unix_path, _FeedHandler)
+    else:
+        server = _TcpFeedServer((host, port), _FeedHandler)
+    server.feed = feed
+    threading.Thread(target=server.serve_forever, name="change-feed-server", daemon=True).start()
+    return server
+
+
+_default_feed = None
+
+
+def get_change_feed():
+    """アプリ全体で共有する変更フィードを取得（設定がない・入力データファイルを直接扱わない場合は None）"""
+    global _default_feed
+    if _default_feed is None:
+        config = load_change_feed_config()
+        store = get_store()
+        if config is None or not isinstance(store, (RecordStore, ShardedRecordStore)):
+            return None
+        _default_feed = ChangeFeed()
+        _default_feed.attach(store)
+        if config.get("port"):
+            start_feed_server(_default_feed, config.get("host", DEFAULT_HOST), config["port"])
+    return _default_feed
+
+
+def main(argv=None):
+    """変更フィードの確認・受け渡し"""
+    config = load_change_feed_config() or {}
+    parser = argparse.ArgumentParser(description="登録・編集・削除の変更を下流のシステムへ渡します。")
+    parser.add_argument("--consumer", help="読み手の名前（カーソルの保存先）")
+    parser.add_argument("--drop", metavar="DIR", help="未読の変更をまとめてファイルに出力する")
+    parser.add_argument("--follow", action="store_true", help="--drop で新しい変更を待って出力し続ける")
+    parser.add_argument("--serve", action="store_true", help="ソケットで待ち受ける")
+    parser.add_argument("--host", default=config.get("host", DEFAULT_HOST), help="待ち受けるアドレス")
+    parser.add_argument("--port", type=int, default=config.get("port"), help="待ち受けるポート番号")
+    parser.add_argument("--unix", metavar="PATH", help="TCPの代わりにUnixソケットで待ち受ける")
+    parser.add_argument("--limit", type=int, default=DEFAULT_BATCH_SIZE, help="1回に渡す件数")
+    parser.add_argument("--prune", action="store_true", help="すべての読み手が読み終えたファイルを削除する")
+    args = parser.parse_args(argv)
+
+    feed = ChangeFeed()
+    if args.prune:
+        print(f"{feed.prune()}個のファイルを削除しました。")
+        return 0
+
+    if args.serve:
+        if not args.port and not args.unix:
+            parser.error("--port または --unix を指定してください。")
+        start_feed_server(feed, args.host, args.port, args.unix)
+        print(f"変更フィードを待ち受けています ({args.unix or f'{args.host}:{args.port}'})。Ctrl+C で終了します。")
+        try:
+            while True:
+                feed.wait(feed.committed_seq())
+        except KeyboardInterrupt:
+            return 0
+
+    if args.drop:
+        if not args.consumer:
+            parser.error("--drop には --consumer を指定してください。")
+        consumer = Consumer(feed, args.consumer)
+        try:
+            while True:
+                path = drop_batch(consumer, args.drop, args.limit)
+                if path:
+                    print(f"出力しました: {path}")
+                    continue
+                if not args.follow:
+                    return 0
+                feed.wait(consumer.cursor)
+        except KeyboardInterrupt:
+            return 0
+
+    print(f"記録した変更: {feed.committed_seq()}件")
+    for name in feed.consumers():
+        print(f"  {name}: {Consumer(feed, name).cursor}件目まで処理済み")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,665 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数値項目の列ストアモジュール
+傾向グラフ・工程能力の計算用に、数値項目ごとの値を連続した配列としてファイルに保存する
+
+登録データは1件ずつの辞書のため、1つの項目の値を集めるには全件をたどる必要がある。
+列ストアは (フォームの版, 数値項目) ごとに1ファイルを持ち、値・登録日時・品種・ロット番号の
+列をそれぞれ連続した配列で保存する。読み込みはメモリマップから行い、NumPy がある場合は
+ndarray にコピーして返す（NumPy は必須ではない）。
+
+登録データは、その登録日時に使われていたフォームの版に振り分ける。フォームの版が変わったことを
+検出したときに、フォーム設定ファイルの更新日時を版の切り替わった時刻として管理情報に記録し、
+作り直す場合もこの履歴に従う
+（列ストアを作る前の登録データは、最初に記録した版に入れる）。
+
+入力データファイルのどこまでを取り込んだかを記録し、登録のたびに追記分だけを取り込む。
+編集・削除の記録（record_log.py）は、record_id ごとの行の表 (rows.txt) から前の版の行を引いて
+値を NaN にし（読み込み時に除く）、新しい版を追記する。上書き登録でファイルが書き直された場合も、
+書き込み時に受け取った置き換えの内容を同じように反映する（取り込みが追いついている場合）。
+書庫への移動・整理などそれ以外でファイルが書き直された場合は作り直す。
+入力データファイルを直接扱う保存先（アプリ単体、または登録受付サーバー）でのみ使える。
+
+ファイルの構成（列ごとに容量分の領域を確保し、足りなくなったら倍の容量の新しいファイルに移す）:
+    ヘッダー(64バイト) | 値 float64 × 容量 | 登録日時 float64 × 容量 | 品種番号 uint32 × 容量 | ロット番号 uint32 × 容量
+
+使い方:
+    python column_store.py --rebuild     # 作り直す
+    python column_store.py               # 項目ごとの件数を表示
+"""
+import argparse
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+
+import metrics
+from record_store import CONFIG_FILE, RecordStore, get_store, load_form_config
+from record_archive import get_archive
+from record_codec import json_codec, load_json_file
+from record_snapshot import source_state, is_source_current
+from record_log import OP_DELETE, current_version, get_record_index, is_log_entry, record_id
+from sharded_store import ShardedRecordStore, open_store, warn_unsupported
+
+COLUMNS_DIR = "columns"
+MANIFEST_FILE = "manifest.json"
+PRODUCTS_FILE = "products.txt"
+LOTS_FILE = "lots.txt"
+ROWS_FILE = "rows.txt"
+
+MAGIC = b"EFCOL001"
+_HEADER = struct.Struct("<8sQQ")
+HEADER_SIZE = 64
+# 1行あたりのバイト数（値・登録日時・品種番号・ロット番号）
+_ROW_BYTES = 8 + 8 + 4 + 4
+INITIAL_CAPACITY = 4096
+# 編集・削除で除いた行の値
+_REMOVED = struct.pack("<d", math.nan)
+# 書き込み時に受け取った上書き登録の内容を、取り込むまで保持する件数
+_MAX_REWRITES = 16
+
+ERROR_SOURCE = "列ストアの更新"
+
+
+def form_version(config):
+    """フォーム設定の版（項目名・データ型・単位から求める）"""
+    fields = [[f.get("label_name", ""), f.get("data_type", "文字列"), f.get("unit", "")] for f in config]
+    return hashlib.sha1(json_codec().dumps(fields)).hexdigest()[:10]
+
+
+def numeric_fields(config):
+    """フォーム設定の数値項目名"""
+    return [f.get("label_name", "") for f in config if f.get("data_type") == "数値"]
+
+
+def record_timestamp(record):
+    """登録日時（なければ日付）をUNIX時間で返す"""
+    for key in ("registered_at", "entry_date"):
+        value = record.get(key)
+        if value:
+            try:
+                return datetime.fromisoformat(value).timestamp()
+            except (TypeError, ValueError):
+                continue
+    return float("nan")
+
+
+def _time_order(point):
+    """登録日時順に並べるキー（登録日時がない点は最後）"""
+    return point[0] if point[0] == point[0] else float("inf")
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("列ストアを配列として扱うには numpy が必要です。pip install numpy を実行してください。")
+    return numpy
+
+
+class ColumnData:
+    """列ストア1ファイル分の読み込み結果（メモリマップ上の配列をコピーせずに参照する）
+
+    開いている間は列ファイルを置き換え・削除できないため、使い終わったら close() する。
+    """
+
+    def __init__(self, path, count):
+        self.count = count
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, capacity = _HEADER.unpack_from(self._mmap, 0)
+        self._view = memoryview(self._mmap)
+        offset = HEADER_SIZE
+        self.values = self._view[offset:offset + 8 * count].cast("d")
+        offset += 8 * capacity
+        self.timestamps = self._view[offset:offset + 8 * count].cast("d")
+        offset += 8 * capacity
+        self.product_ids = self._view[offset:offset + 4 * count].cast("I")
+        offset += 4 * capacity
+        self.lot_ids = self._view[offset:offset + 4 * count].cast("I")
+
+    def __len__(self):
+        return self.count
+
+    def to_numpy(self, product_id=None):
+        """(登録日時, 値, ロット番号) の ndarray（product_id を指定するとその品種の分だけ。除いた行は含めない）
+
+        メモリマップを参照しないようコピーして返すため、close() した後も使える。
+        """
+        np = _numpy()
+        timestamps = np.frombuffer(self.timestamps, dtype=np.float64)
+        values = np.frombuffer(self.values, dtype=np.float64)
+        lot_ids = np.frombuffer(self.lot_ids, dtype=np.uint32)
+        mask = ~np.isnan(values)  # 編集・削除で除いた行
+        if product_id is not None:
+            mask &= np.frombuffer(self.product_ids, dtype=np.uint32) == product_id
+        return timestamps[mask], values[mask], lot_ids[mask]
+
+    def close(self):
+        for view in (self.values, self.timestamps, self.product_ids, self.lot_ids, self._view):
+            view.release()
+        self._mmap.close()
+
+
+def _create_column_file(path, capacity, source=None, count=0):
+    """容量 capacity の列ファイルを作る（source があれば count 行を移す）"""
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, count, capacity).ljust(HEADER_SIZE, b"\0"))
+        f.truncate(HEADER_SIZE + _ROW_BYTES * capacity)
+        if source is not None and count:
+            offset = HEADER_SIZE
+            for column, size in ((source.values, 8), (source.timestamps, 8),
+                                 (source.product_ids, 4), (source.lot_ids, 4)):
+                f.seek(offset)
+                f.write(column.tobytes())
+                offset += size * capacity
+
+
+def _append_rows(path, start, rows):
+    """列ファイルの start 行目から rows を書き込む（容量は呼び出し側で確保する）"""
+    with open(path, "r+b") as f:
+        _, _, capacity = _HEADER.unpack(f.read(_HEADER.size))
+        offset = HEADER_SIZE
+        for index, fmt, size in ((0, "d", 8), (1, "d", 8), (2, "I", 4), (3, "I", 4)):
+            f.seek(offset + size * start)
+            f.write(struct.pack(f"<{len(rows)}{fmt}", *(row[index] for row in rows)))
+            offset += size * capacity
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, start + len(rows), capacity))
+
+
+class _Dictionary:
+    """品種・ロット番号の辞書（1行1値の追記ファイル、行番号が番号）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.values = []
+        self.ids = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._add(line.rstrip("\n"))
+
+    def _add(self, value):
+        self.ids.setdefault(value, len(self.values))
+        self.values.append(value)
+
+    def encode_all(self, values):
+        """値を番号にする（新しい値はファイルに追記する）"""
+        new_values = []
+        ids = []
+        for value in values:
+            value = str(value or "").replace("\n", " ")
+            value_id = self.ids.get(value)
+            if value_id is None:
+                value_id = len(self.values)
+                self._add(value)
+                new_values.append(value)
+            ids.append(value_id)
+        if new_values:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(v + "\n" for v in new_values))
+        return ids
+
+
+def _remove_row(path, row):
+    """列ファイルの row 行目の値を NaN にする（読み込み時に除かれる）"""
+    with open(path, "r+b") as f:
+        f.seek(HEADER_SIZE + 8 * row)
+        f.write(_REMOVED)
+
+
+class _RowMap:
+    """record_id から列ファイルの行を引く表（1行に「ID・列ファイル・行番号」をタブ区切りで持つ追記ファイル）
+
+    管理情報に記録した件数より後の行（保存前に中断した分）は読み込まない。
+    """
+
+    def __init__(self, path, files):
+        self.path = path
+        self.rows = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 3:
+                        continue  # 書き込み途中で中断した行
+                    rid, key, row = parts[0], parts[1], int(parts[2])
+                    entry = files.get(key)
+                    if entry is not None and row < entry["count"]:
+                        self.rows.setdefault(rid, []).append((key, row))
+
+    def add(self, key, start, rids):
+        """列ファイル key の start 行目から順に rids の行を記録する"""
+        lines = []
+        for i, rid in enumerate(rids):
+            self.rows.setdefault(rid, []).append((key, start + i))
+            lines.append(f"{rid}\t{key}\t{start + i}\n")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+    def pop(self, rid):
+        """record_id の行を表から除いて返す"""
+        return self.rows.pop(rid, [])
+
+
+class ColumnStore:
+    """数値項目の列ストア
+
+    attach() した保存先への登録は、別スレッドで列ストアに取り込む。
+    """
+
+    def __init__(self, directory=COLUMNS_DIR):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._manifest = None
+        self._products = None
+        self._lots = None
+        self._rows = None
+        self._rewrites = []  # 上書き登録 (書き直す前の位置, 書き直した後の状態, 置き換えの内容)
+        self._rewrites_lock = threading.Lock()
+        self._pending = threading.Event()
+        self.store = None
+        self.last_error = None
+
+    # --- 取り込み ---
+
+    def attach(self, store, background=True):
+        """保存先への登録を取り込む（入力データファイルを直接扱う保存先のみ）"""
+        if not isinstance(store, RecordStore):
+            raise ValueError("列ストアは入力データファイルを直接扱う保存先でのみ使えます。")
+        self.store = store
+        store.add_write_hook(self._on_write)
+        store.add_listener(lambda records: self._pending.set())
+        if background:
+            self._pending.set()
+            threading.Thread(target=self._sync_loop, name="column-store", daemon=True).start()
+        else:
+            self.sync()
+
+    def _sync_loop(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            try:
+                self.sync()
+                self.last_error = None
+                metrics.clear_error(ERROR_SOURCE)
+            except Exception as e:
+                self.last_error = e
+                metrics.report_error(ERROR_SOURCE, e)
+
+    def _on_write(self, store, entries, start, end, match):
+        """上書き登録で書き直した内容を記録する（保存先の書き込みのロックの中で呼ばれる）
+
+        取り込み中の処理は保存先を読むため、列ストアのロックではなく専用のロックだけを使う。
+        """
+        if match is None or start is None:
+            return
+        after = source_state(store, get_archive(), end)
+        with self._rewrites_lock:
+            self._rewrites.append((start, after, entries))
+            del self._rewrites[:-_MAX_REWRITES]
+
+    def sync(self):
+        """入力データファイルに追記された分を取り込む（追記以外で書き直されていれば作り直す）"""
+        with self._lock:
+            store = self.store
+            archive = get_archive()
+            manifest = self._load()
+            source = manifest.get("source")
+            if not os.path.exists(store.path):
+                return
+            rewritten = source is not None and not is_source_current(source, store, archive)
+            if rewritten:
+                source = self._apply_rewrites(source, store, archive)
+            if source is None:
+                self.rebuild()
+                return
+            records, position = store.load_records_after(source["position"])
+            if not records and not rewritten:
+                return
+            self._append(records)
+            manifest["source"] = source_state(store, archive, position) if records else source
+            self._save()
+
+    def _apply_rewrites(self, source, store, archive):
+        """上書き登録による書き直しを、置き換えの内容から反映する（反映できなければ None）
+
+        取り込み済みの位置が書き直す前の終わりの位置と同じ場合だけ反映できる。
+        """
+        with self._rewrites_lock:
+            rewrites, self._rewrites = self._rewrites, []
+        for start, after, entries in rewrites:
+            if start != source["position"]:
+                continue
+            # 書き直す前の終わりまで取り込んでいた（その後は上書きしか書かれていない）
+            self._append(entries)
+            source = after
+            if is_source_current(source, store, archive):
+                return source
+        return None
+
+    def rebuild(self):
+        """書庫と入力データファイルの全件から作り直す（フォームの版の履歴は引き継ぐ）"""
+        with self._lock:
+            store = self.store
+            archive = get_archive()
+            index = get_record_index(store, archive)
+            history = self._load().get("history", [])
+            with self._rewrites_lock:
+                self._rewrites = []  # 作り直す内容に含まれる
+            self._clear()
+            self._manifest["history"] = history
+            self._append(index.resolve(archive.iter_records()))
+            records, position = store.load_records_with_position()
+            self._append(index.resolve(records))
+            if position is not None:
+                self._manifest["source"] = source_state(store, archive, position)
+            self._save()
+
+    def _clear(self):
+        """列ストアのファイルをすべて削除"""
+        if os.path.isdir(self.directory):
+            for root, dirs, files in os.walk(self.directory, topdown=False):
+                for name in files:
+                    try:
+                        os.remove(os.path.join(root, name))
+                    except OSError:
+                        pass  # 開いている間は削除できない環境があるため残す（使われない）
+                for name in dirs:
+                    try:
+                        os.rmdir(os.path.join(root, name))
+                    except OSError:
+                        pass
+        os.makedirs(self.directory, exist_ok=True)
+        self._manifest = {"versions": {}, "files": {}, "history": []}
+        self._products = _Dictionary(os.path.join(self.directory, PRODUCTS_FILE))
+        self._lots = _Dictionary(os.path.join(self.directory, LOTS_FILE))
+        self._rows = _RowMap(os.path.join(self.directory, ROWS_FILE), {})
+
+    def _form_history(self):
+        """フォームの版の履歴 [{"since": UNIX時間, "version": 版, "labels": 数値項目名}, ...]
+
+        現在のフォームの版が最後の版と違えば、フォーム設定を保存した時刻からの版として追加する。
+        """
+        config = load_form_config()
+        version = form_version(config)
+        history = self._manifest.setdefault("history", [])
+        if not history or history[-1]["version"] != version:
+            try:
+                since = os.path.getmtime(CONFIG_FILE)
+            except OSError:
+                since = time.time()
+            if history:
+                since = max(since, history[-1]["since"])
+            history.append({"since": since, "version": version, "labels": numeric_fields(config)})
+        return history
+
+    def _append(self, records, batch_size=10000):
+        """登録データの数値項目を、登録日時に使われていたフォームの版に追記
+
+        編集・削除の記録は、前の版の行を除いてから新しい版を追記する。
+        """
+        history = self._form_history()
+        starts = [entry["since"] for entry in history]
+        batches = {}
+
+        def flush():
+            for index, batch in batches.items():
+                if batch:
+                    self._append_batch(history[index]["version"], history[index]["labels"], batch)
+            batches.clear()
+
+        for record in records:
+            rid = record_id(record)
+            if is_log_entry(record):
+                flush()  # 前の版がまだ書き込んでいない分にあっても除けるようにする
+                self._remove(rid)
+                if record.get("op") == OP_DELETE:
+                    continue
+                record = current_version(record)
+            elif rid in self._rows.rows:
+                self._remove(rid)  # 取り込みが途中で中断した分を取り込み直す場合
+            timestamp = record_timestamp(record)
+            if math.isnan(timestamp):
+                index = len(history) - 1
+            else:
+                index = max(bisect_right(starts, timestamp) - 1, 0)
+            batch = batches.setdefault(index, [])
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self._append_batch(history[index]["version"], history[index]["labels"], batch)
+                batches[index] = []
+        flush()
+
+    def _remove(self, rid):
+        """登録データの行を除く（値を NaN にする）"""
+        files = self._manifest["files"]
+        for key, row in self._rows.pop(rid):
+            entry = files.get(key)
+            if entry is not None and row < entry["count"]:
+                _remove_row(self._path(entry), row)
+
+    def _append_batch(self, version, labels, records):
+        manifest = self._manifest
+        versions = manifest["versions"]
+        if version not in versions:
+            versions[version] = {"fields": {}}
+            os.makedirs(os.path.join(self.directory, version), exist_ok=True)
+        fields = versions[version]["fields"]
+
+        product_ids = self._products.encode_all(r.get("product_name") for r in records)
+        lot_ids = self._lots.encode_all(r.get("lot_no") for r in records)
+        timestamps = [record_timestamp(r) for r in records]
+
+        for label in labels:
+            rows = []
+            rids = []
+            for i, record in enumerate(records):
+                value = (record.get("details") or {}).get(label)
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+                    rows.append((float(value), timestamps[i], product_ids[i], lot_ids[i]))
+                    rids.append(record_id(record))
+            if not rows:
+                continue
+            if label not in fields:
+                fields[label] = f"f{len(fields) + 1:04d}"
+            self._append_rows(version, fields[label], rows, rids)
+
+    def _append_rows(self, version, file_id, rows, rids):
+        files = self._manifest["files"]
+        key = f"{version}/{file_id}"
+        entry = files.get(key)
+        if entry is None:
+            entry = files[key] = {"name": f"{version}/{file_id}.g1.col", "count": 0, "capacity": 0, "generation": 1}
+            _create_column_file(self._path(entry), INITIAL_CAPACITY)
+            entry["capacity"] = INITIAL_CAPACITY
+
+        needed = entry["count"] + len(rows)
+        if needed > entry["capacity"]:
+            # 倍の容量の新しいファイルに移す（読み込み中のファイルは書き換えない）
+            capacity = entry["capacity"]
+            while capacity < needed:
+                capacity *= 2
+            old = ColumnData(self._path(entry), entry["count"])
+            generation = entry["generation"] + 1
+            new_name = f"{version}/{file_id}.g{generation}.col"
+            try:
+                _create_column_file(os.path.join(self.directory, new_name), capacity, old, entry["count"])
+            finally:
+                old.close()
+            old_path = self._path(entry)
+            entry.update(name=new_name, capacity=capacity, generation=generation)
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+        _append_rows(self._path(entry), entry["count"], rows)
+        self._rows.add(key, entry["count"], rids)
+        entry["count"] = needed
+
+    def _path(self, entry):
+        return os.path.join(self.directory, entry["name"])
+
+    def _load(self):
+        if self._manifest is None:
+            manifest = load_json_file(os.path.join(self.directory, MANIFEST_FILE))
+            if manifest is None:
+                self._clear()
+            else:
+                self._manifest = manifest
+                self._products = _Dictionary(os.path.join(self.directory, PRODUCTS_FILE))
+                self._lots = _Dictionary(os.path.join(self.directory, LOTS_FILE))
+                self._rows = _RowMap(os.path.join(self.directory, ROWS_FILE), manifest["files"])
+        return self._manifest
+
+    def _save(self):
+        """管理情報を保存する（ここに記録した件数までが有効なデータ）"""
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json_codec().dumps_pretty(self._manifest))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # --- 読み込み ---
+
+    def versions(self):
+        """フォームの版ごとの数値項目 {版: [項目名, ...]}"""
+        with self._lock:
+            return {v: list(info["fields"]) for v, info in self._load()["versions"].items()}
+
+    def products(self):
+        """品種番号から品種名を引くリスト"""
+        with self._lock:
+            self._load()
+            return list(self._products.values)
+
+    def lot_name(self, lot_id):
+        with self._lock:
+            self._load()
+            return self._lots.values[lot_id]
+
+    def read(self, label, version=None):
+        """数値項目の列を開く（version を省略すると現在のフォームの版）。使い終わったら close() する"""
+        version = version or form_version(load_form_config())
+        with self._lock:
+            manifest = self._load()
+            file_id = manifest["versions"].get(version, {}).get("fields", {}).get(label)
+            if file_id is None:
+                return None
+            entry = manifest["files"][f"{version}/{file_id}"]
+            return ColumnData(self._path(entry), entry["count"])
+
+    def points(self, label, product=None):
+        """全版の数値項目の (登録日時, 値) を登録日時順のリストで返す（NumPy を使わない）"""
+        with self._lock:
+            self._load()
+            product_id = None
+            if product is not None:
+                product_id = self._products.ids.get(product)
+                if product_id is None:
+                    return []
+            points = []
+            for version, fields in self.versions().items():
+                if label not in fields:
+                    continue
+                column = self.read(label, version)
+                try:
+                    # 値が NaN の行は編集・削除で除いたもの
+                    if product_id is None:
+                        points.extend((t, v) for t, v in zip(column.timestamps, column.values) if v == v)
+                    else:
+                        points.extend(
+                            (t, v) for t, v, p in zip(column.timestamps, column.values, column.product_ids)
+                            if p == product_id and v == v
+                        )
+                finally:
+                    column.close()
+        # 版をまたぐ場合と、編集した新しい版が末尾に追記されている場合があるため並べ直す
+        points.sort(key=_time_order)
+        return points
+
+    def series(self, label, product=None):
+        """全版の数値項目の値を登録日時順に返す (登録日時, 値, ロット番号) の ndarray（NumPy が必要）
+
+        列ファイルを開いたままにしないよう、配列はコピーして返す。
+        """
+        np = _numpy()
+        with self._lock:
+            product_id = None
+            if product is not None:
+                self._load()
+                product_id = self._products.ids.get(product)
+                if product_id is None:
+                    empty = np.empty(0)
+                    return empty, empty, np.empty(0, dtype=np.uint32)
+            parts = []
+            for version, fields in self.versions().items():
+                if label not in fields:
+                    continue
+                column = self.read(label, version)
+                try:
+                    parts.append(column.to_numpy(product_id))
+                finally:
+                    column.close()
+
+        if not parts:
+            empty = np.empty(0)
+            return empty, empty, np.empty(0, dtype=np.uint32)
+        timestamps, values, lot_ids = (np.concatenate(columns) for columns in zip(*parts))
+        order = np.argsort(timestamps, kind="stable")
+        return timestamps[order], values[order], lot_ids[order]
+
+
+_default_column_store = None
+
+
+def get_column_store():
+    """アプリ全体で共有する列ストアを取得（入力データファイルを直接扱わない場合は None）"""
+    global _default_column_store
+    if _default_column_store is None:
+        store = get_store()
+        if not isinstance(store, RecordStore):
+            if isinstance(store, ShardedRecordStore):
+                warn_unsupported("column_store")
+            return None
+        _default_column_store = ColumnStore()
+        _default_column_store.attach(store)
+    return _default_column_store
+
+
+def main(argv=None):
+    """列ストアの作成・確認"""
+    parser = argparse.ArgumentParser(description="数値項目の列ストアを作成・確認します。")
+    parser.add_argument("--rebuild", action="store_true", help="全件から作り直す")
+    args = parser.parse_args(argv)
+
+    column_store = ColumnStore()
+    try:
+        column_store.attach(open_store(), background=False)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.rebuild:
+        column_store.rebuild()
+    for version, labels in column_store.versions().items():
+        for label in labels:
+            column = column_store.read(label, version)
+            print(f"{version}  {label}: {len(column)}件")
+            column.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録データのメモリ上の省スペース表現
+大量の履歴を画面に表示するとき、登録データを辞書のまま持たずに配列へ詰めて保持する
+
+登録データを辞書のまま持つと、1件ごとに辞書・項目名・値の文字列オブジェクトができ、
+100万件では数GBになる。ここでは次のように保持する:
+- 日付・品種: 値の一覧と番号の配列（同じ文字列は1つだけ持つ）
+- ロット番号・登録日時: 1つのバイト列と位置の配列
+- 詳細データ: フォーム設定に合わせて詰めたバイト列（項目名は持たない）。参照したときに辞書に戻す
+"""
+from array import array
+
+from record_codec import PackedCodec
+
+
+class _CodeColumn:
+    """同じ値が繰り返される列（値の一覧と番号の配列）"""
+
+    __slots__ = ("values", "ids", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+        self.codes = array("I")
+
+    def append(self, value):
+        code = self.ids.get(value)
+        if code is None:
+            code = self.ids[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+
+class _BytesColumn:
+    """値ごとに異なる列（1つのバイト列と各値の終わりの位置）"""
+
+    __slots__ = ("data", "ends")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array("Q")
+
+    def append(self, value):
+        self.data += value
+        self.ends.append(len(self.data))
+
+    def __getitem__(self, i):
+        start = self.ends[i - 1] if i else 0
+        return bytes(self.data[start:self.ends[i]])
+
+
+class CompactRecordList:
+    """登録データを省スペースで保持するリスト
+
+    record_snapshot.RecordList と同じく row() / record() で参照する。
+    row() は表示用の基本情報だけを返し、詳細データは record() を呼んだときに戻す。
+    """
+
+    __slots__ = ("codec", "_dates", "_products", "_lots", "_registered", "_details", "_extras")
+
+    def __init__(self, config=None, records=()):
+        if config is None:
+            from record_store import load_form_config
+            config = load_form_config()
+        self.codec = PackedCodec.from_form_config(config)
+        self._dates = _CodeColumn()
+        self._products = _CodeColumn()
+        self._lots = _BytesColumn()
+        self._registered = _BytesColumn()
+        self._details = _BytesColumn()
+        # 基本情報・詳細データ以外の項目や文字列でない値（通常は空）
+        self._extras = {}
+        self.extend(records)
+
+    def __len__(self):
+        return len(self._details.ends)
+
+    def append(self, record):
+        """1件追加"""
+        i = len(self)
+        extra = {}
+        for key, value in record.items():
+            if key == "details" or (key in ("entry_date", "product_name", "lot_no", "registered_at")
+                                    and isinstance(value, str)):
+                continue
+            extra[key] = value
+        if "details" not in record:
+            extra["details"] = None
+        if extra:
+            self._extras[i] = extra
+
+        self._dates.append(_text(record.get("entry_date")))
+        self._products.append(_text(record.get("product_name")))
+        self._lots.append(_text(record.get("lot_no")).encode("utf-8"))
+        self._registered.append(_text(record.get("registered_at")).encode("utf-8"))
+        self._details.append(self.codec.dumps_details(record.get("details") or {}))
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def row(self, i):
+        """表示用の項目 (日付, 品種, ロット番号, 登録日時)"""
+        return (
+            self._dates[i],
+            self._products[i],
+            self._lots[i].decode("utf-8"),
+            self._registered[i].decode("utf-8"),
+        )
+
+    def record(self, i):
+        """登録データ全体（辞書に戻す）"""
+        entry_date, product_name, lot_no, registered_at = self.row(i)
+        record = {
+            "entry_date": entry_date,
+            "product_name": product_name,
+            "lot_no": lot_no,
+            "registered_at": registered_at,
+            "details": self.codec.loads_details(self._details[i]),
+        }
+        extra = self._extras.get(i)
+        if extra:
+            record.update(extra)
+            if record["details"] is None:
+                del record["details"]
+        return record
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def close(self):
+        pass
+
+
+def _text(value):
+    return value if isinstance(value, str) else ""
@@ -3,22 +3,21 @@
 入力項目を動的に設定できる画面
 """
 import streamlit as st
-import json
 import os
 
-CONFIG_FILE = "form_config.json"
+import input_page
+from record_codec import save_json_file
+
+CONFIG_FILE = input_page.CONFIG_FILE
 
 def load_form_config():
-    """フォーム設定を読み込む"""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+    """フォーム設定を読み込む（入力画面と同じキャッシュを使う）"""
+    return input_page.load_form_config()
 
 def save_form_config(config):
     """フォーム設定を保存する"""
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
+    save_json_file(CONFIG_FILE, config)
+    input_page.clear_caches()
 
 def render_config_page():
     """設定画面をレンダリング"""
@@ -150,6 +149,7 @@ def render_config_page():
             st.session_state.form_fields = []
             if os.path.exists(CONFIG_FILE):
                 os.remove(CONFIG_FILE)
+                input_page.clear_caches()
             st.success("設定をリセットしました!")
             st.rerun()
 
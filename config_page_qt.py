@@ -4,7 +4,6 @@
 設定画面モジュール (PySide6版)
 入力項目を動的に設定できる画面（拡張版）
 """
-import json
 import os
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
@@ -13,6 +12,9 @@ from PySide6.QtWidgets import (
     QDialog, QDialogButtonBox, QFormLayout, QScrollArea
 )
 from PySide6.QtCore import Signal, Qt
+from duplicate_index import DUPLICATE_POLICIES, DEFAULT_DUPLICATE_POLICY
+from record_store import load_form_settings, save_form_settings
+from record_codec import load_json_file, save_json_file
 
 CONFIG_FILE = "form_config.json"
 
@@ -261,6 +263,18 @@ class ConfigPage(QWidget):
         table_group.setLayout(table_layout)
         layout.addWidget(table_group)
 
+        # フォーム単位の設定
+        settings_group = QGroupBox("登録時の設定")
+        settings_layout = QFormLayout()
+        self.duplicate_policy_combo = QComboBox()
+        for key, name in DUPLICATE_POLICIES.items():
+            self.duplicate_policy_combo.addItem(name, key)
+        self.duplicate_policy_combo.setToolTip("品種・製造ロット番号・日付が同じデータを登録しようとしたときの動作")
+        self.duplicate_policy_combo.currentIndexChanged.connect(self.save_form_settings)
+        settings_layout.addRow("重複登録時の動作:", self.duplicate_policy_combo)
+        settings_group.setLayout(settings_layout)
+        layout.addWidget(settings_group)
+
         # ボタンエリア
         button_layout = QHBoxLayout()
 
@@ -285,10 +299,16 @@ class ConfigPage(QWidget):
 
     def load_config(self):
         """設定ファイルを読み込んでテーブルに表示"""
+        policy = load_form_settings().get("duplicate_policy", DEFAULT_DUPLICATE_POLICY)
+        index = self.duplicate_policy_combo.findData(policy)
+        if index >= 0:
+            self.duplicate_policy_combo.blockSignals(True)
+            self.duplicate_policy_combo.setCurrentIndex(index)
+            self.duplicate_policy_combo.blockSignals(False)
+
         if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
-                self.update_table(config)
+            config = load_json_file(CONFIG_FILE)
+            self.update_table(config)
 
     def update_table(self, config):
         """テーブルを更新"""
@@ -329,13 +349,18 @@ class ConfigPage(QWidget):
             delete_btn.clicked.connect(lambda checked, row=idx: self.delete_field(row))
             self.table.setCellWidget(idx, 6, delete_btn)
 
+    def save_form_settings(self):
+        """フォーム単位の設定を保存"""
+        settings = load_form_settings()
+        settings["duplicate_policy"] = self.duplicate_policy_combo.currentData()
+        save_form_settings(settings)
+
     def add_field(self):
         """新規項目を追加"""
         # 現在の設定を読み込んで次の表示順を計算
         config = []
         if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
+            config = load_json_file(CONFIG_FILE)
 
         next_order = max([f.get("display_order", 0) for f in config], default=0) + 1
 
@@ -353,8 +378,7 @@ class ConfigPage(QWidget):
             config.append(field_data)
 
             # 一時保存
-            with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            save_json_file(CONFIG_FILE, config)
 
             # テーブルを更新
             self.update_table(config)
@@ -364,8 +388,7 @@ class ConfigPage(QWidget):
     def edit_field(self, row):
         """項目を編集"""
         if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
+            config = load_json_file(CONFIG_FILE)
 
             if 0 <= row < len(config):
                 # 編集ダイアログを開く
@@ -381,8 +404,7 @@ class ConfigPage(QWidget):
                     config[row] = field_data
 
                     # 保存
-                    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                        json.dump(config, f, ensure_ascii=False, indent=2)
+                    save_json_file(CONFIG_FILE, config)
 
                     # テーブルを更新
                     self.update_table(config)
@@ -400,16 +422,14 @@ class ConfigPage(QWidget):
         if reply == QMessageBox.Yes:
             # 現在の設定を読み込み
             if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                    config = json.load(f)
+                config = load_json_file(CONFIG_FILE)
 
                 # 項目を削除
                 if 0 <= row < len(config):
                     config.pop(row)
 
                     # 保存
-                    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                        json.dump(config, f, ensure_ascii=False, indent=2)
+                    save_json_file(CONFIG_FILE, config)
 
                     # テーブルを更新
                     self.update_table(config)
@@ -422,15 +442,13 @@ class ConfigPage(QWidget):
     def save_config(self):
         """設定を保存"""
         if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
+            config = load_json_file(CONFIG_FILE)
 
             # 表示順でソート
             config.sort(key=lambda x: x.get("display_order", 0))
 
             # 保存
-            with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            save_json_file(CONFIG_FILE, config)
 
             QMessageBox.information(self, "成功", "設定を保存しました。")
 
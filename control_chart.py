@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+管理図の計算モジュール
+数値項目の X̄-R 管理図・I-MR 管理図の打点と管理限界を求める（画面は control_chart_page.py）
+
+- X̄-R : 登録順に subgroup_size 件ずつの群にまとめ、群の平均 (X̄) と範囲 (R) を打点する
+- I-MR: 1件ずつの値 (I) と、前の値との差の絶対値 (MR) を打点する
+
+打点は追記のたびに増やし、管理限界は累計から求め直すため、全件を計算し直さない。
+表示用には打点の最小値・最大値を段階的にまとめた表（MinMaxPyramid）を持ち、
+表示範囲の点数によらず画面の幅に比例した点数だけを描く。
+"""
+import math
+from array import array
+
+from record_store import RecordStore
+from record_query import normalize_query
+from query_cache import get_query_cache
+
+CHART_TYPES = ["X̄-R", "I-MR"]
+
+# 群の大きさごとの係数 (A2, D3, D4)
+XBAR_R_CONSTANTS = {
+    2: (1.880, 0.0, 3.267),
+    3: (1.023, 0.0, 2.574),
+    4: (0.729, 0.0, 2.282),
+    5: (0.577, 0.0, 2.114),
+    6: (0.483, 0.0, 2.004),
+    7: (0.419, 0.076, 1.924),
+    8: (0.373, 0.136, 1.864),
+    9: (0.337, 0.184, 1.816),
+    10: (0.308, 0.223, 1.777),
+}
+# I-MR 管理図の係数（移動範囲は2件の範囲）
+IMR_E2 = 2.660
+IMR_D4 = 3.267
+
+# まとめ表の1段あたりにまとめる点数
+PYRAMID_FACTOR = 4
+# この打点数以上をまとめて追加するときはまとめ表を作り直す
+BULK_THRESHOLD = 1000
+
+
+class MinMaxPyramid:
+    """打点の最小値・最大値を PYRAMID_FACTOR 点ずつ段階的にまとめた表
+
+    追記は各段の最後の区間を更新するだけで済む。NaN の点は最小値・最大値に含めない。
+    """
+
+    def __init__(self):
+        self.values = array("d")
+        self.levels = []  # [(最小値, 最大値), ...]  段 k は PYRAMID_FACTOR**(k+1) 点ずつ
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value):
+        self.values.append(value)
+        n = len(self.values)
+        low, high = (value, value) if value == value else (math.inf, -math.inf)
+        size = 1
+        k = 0
+        # 1つ下の段が2区間以上になったら上の段を使う
+        while n > size:
+            size *= PYRAMID_FACTOR
+            index = (n - 1) // size
+            if k == len(self.levels):
+                self.levels.append(self._build_level(k))
+            else:
+                mins, maxs = self.levels[k]
+                if index == len(mins):
+                    mins.append(low)
+                    maxs.append(high)
+                else:
+                    mins[index] = min(mins[index], low)
+                    maxs[index] = max(maxs[index], high)
+            mins, maxs = self.levels[k]
+            low, high = mins[index], maxs[index]
+            k += 1
+
+    def extend(self, values):
+        """まとめて追加（まとめ表は作り直す）"""
+        self.values.extend(values)
+        self.levels = []
+        size = 1
+        while len(self.values) > size:
+            size *= PYRAMID_FACTOR
+            self.levels.append(self._build_level(len(self.levels)))
+
+    def _build_level(self, k):
+        """段 k を1つ下の段から作る"""
+        if k == 0:
+            lows = [v if v == v else math.inf for v in self.values]
+            highs = [v if v == v else -math.inf for v in self.values]
+        else:
+            lows, highs = self.levels[k - 1]
+        step = PYRAMID_FACTOR
+        mins = array("d", [min(lows[i:i + step]) for i in range(0, len(lows), step)])
+        maxs = array("d", [max(highs[i:i + step]) for i in range(0, len(highs), step)])
+        return mins, maxs
+
+    def query(self, start, stop, max_points):
+        """start から stop の手前までの点を、最大 max_points 区間にまとめて返す
+
+        [(区間の中央の位置, 最小値, 最大値), ...] を返す。まとめない場合は最小値と最大値が同じ。
+        """
+        start = max(0, int(start))
+        stop = min(len(self.values), int(math.ceil(stop)))
+        if stop <= start:
+            return []
+        k = -1
+        size = 1
+        while (stop - start) / size > max_points and k + 1 < len(self.levels):
+            k += 1
+            size *= PYRAMID_FACTOR
+        if k < 0:
+            values = self.values
+            return [(i, values[i], values[i]) for i in range(start, stop) if values[i] == values[i]]
+        mins, maxs = self.levels[k]
+        result = []
+        for block in range(start // size, (stop - 1) // size + 1):
+            if mins[block] <= maxs[block]:
+                center = min(block * size + size / 2, len(self.values)) - 0.5
+                result.append((center, mins[block], maxs[block]))
+        return result
+
+
+class ControlChart:
+    """管理図の打点と管理限界（追記で更新する）"""
+
+    def __init__(self, chart_type="X̄-R", subgroup_size=5):
+        if chart_type not in CHART_TYPES:
+            raise ValueError(f"未対応の管理図です: {chart_type}")
+        if chart_type == "X̄-R" and subgroup_size not in XBAR_R_CONSTANTS:
+            raise ValueError(f"群の大きさは {min(XBAR_R_CONSTANTS)}〜{max(XBAR_R_CONSTANTS)} で指定してください。")
+        self.chart_type = chart_type
+        self.subgroup_size = subgroup_size if chart_type == "X̄-R" else 1
+        self.upper = MinMaxPyramid()   # X̄ または I
+        self.lower = MinMaxPyramid()   # R または MR（I-MR の最初の点は NaN）
+        self.timestamps = array("d")   # 打点ごとの登録日時（群の最後の1件）
+        self._group = []
+        self._last_value = None
+        self._upper_sum = 0.0
+        self._lower_sum = 0.0
+        self._lower_count = 0
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add(self, timestamp, value):
+        """1件追加（群がそろったら打点する）"""
+        plot = self._next_plot(timestamp, value)
+        if plot is not None:
+            self._plot(*plot)
+
+    def extend(self, points):
+        """(登録日時, 値) を順に追加（打点はまとめて追加する）"""
+        plots = [plot for plot in (self._next_plot(t, v) for t, v in points) if plot is not None]
+        if len(plots) < BULK_THRESHOLD:
+            for plot in plots:
+                self._plot(*plot)
+            return
+        timestamps, uppers, lowers = zip(*plots)
+        self.timestamps.extend(timestamps)
+        self.upper.extend(uppers)
+        self.lower.extend(lowers)
+        valid = [v for v in lowers if v == v]
+        self._upper_sum += math.fsum(uppers)
+        self._lower_sum += math.fsum(valid)
+        self._lower_count += len(valid)
+
+    def _next_plot(self, timestamp, value):
+        """1件を加え、打点がそろえば (登録日時, 上の管理図の値, 下の管理図の値) を返す"""
+        if self.chart_type == "I-MR":
+            moving_range = abs(value - self._last_value) if self._last_value is not None else math.nan
+            self._last_value = value
+            return timestamp, value, moving_range
+        self._group.append(value)
+        if len(self._group) < self.subgroup_size:
+            return None
+        group = self._group
+        self._group = []
+        return timestamp, sum(group) / len(group), max(group) - min(group)
+
+    def _plot(self, timestamp, upper, lower):
+        self.timestamps.append(timestamp)
+        self.upper.append(upper)
+        self.lower.append(lower)
+        self._upper_sum += upper
+        if lower == lower:
+            self._lower_sum += lower
+            self._lower_count += 1
+
+    def limits(self):
+        """管理限界 {"upper": (LCL, CL, UCL), "lower": (LCL, CL, UCL)}（打点がなければ None）"""
+        if not self._lower_count:
+            return None
+        center = self._upper_sum / len(self.timestamps)
+        range_mean = self._lower_sum / self._lower_count
+        if self.chart_type == "I-MR":
+            width = IMR_E2 * range_mean
+            d3, d4 = 0.0, IMR_D4
+        else:
+            a2, d3, d4 = XBAR_R_CONSTANTS[self.subgroup_size]
+            width = a2 * range_mean
+        return {
+            "upper": (center - width, center, center + width),
+            "lower": (d3 * range_mean, range_mean, d4 * range_mean),
+        }
+
+    def chart_labels(self):
+        """上下の管理図の名前"""
+        return ("X̄", "R") if self.chart_type == "X̄-R" else ("I", "MR")
+
+
+def numeric_value(record, label):
+    """登録データの数値項目の値（数値でなければ None）"""
+    value = (record.get("details") or {}).get(label)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return None
+
+
+def load_points(store, label, product=None):
+    """数値項目の (登録日時, 値) を登録日時順に読み込む
+
+    入力データファイルを直接扱う場合は列ストア（column_store.py）から読み、それ以外は全件をたどる。
+    """
+    from column_store import get_column_store, record_timestamp
+
+    if isinstance(store, RecordStore):
+        column_store = get_column_store()
+        if column_store is not None and column_store.store is store:
+            column_store.sync()
+            return column_store.points(label, product)
+
+    query = normalize_query(product_name=product) if product else None
+    points = []
+    for record in get_query_cache(store).query(query):
+        value = numeric_value(record, label)
+        if value is not None:
+            points.append((record_timestamp(record), value))
+    return points
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+管理図タブ
+数値項目・品種を選んで X̄-R 管理図または I-MR 管理図を表示する（計算は control_chart.py）
+
+ホイールで拡大・縮小、ドラッグで左右に移動できる。描く点数は画面の幅に比例するため、
+1年分のデータでも操作は重くならない。登録されたデータは全体を描き直さずに打点を追加する。
+"""
+import threading
+from datetime import datetime
+
+from PySide6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QSpinBox, QPushButton, QSizePolicy
+)
+from PySide6.QtCore import Qt, QPointF, Signal
+from PySide6.QtGui import QPainter, QPen, QColor, QPolygonF
+
+from record_store import get_store, load_form_config
+from column_store import get_column_store, numeric_fields, record_timestamp
+from control_chart import CHART_TYPES, ControlChart, load_points, numeric_value
+from record_log import is_log_entry
+
+ALL_PRODUCTS = "（すべての品種）"
+# 1画素あたりに描く区間の数
+POINTS_PER_PIXEL = 1
+# 拡大したときに表示する最小の打点数
+MIN_VIEW_SPAN = 10
+# 打点の印を付ける最大の点数（これより多い場合は線だけ描く）
+MARKER_LIMIT = 300
+
+LIMIT_COLOR = QColor("#d32f2f")
+CENTER_COLOR = QColor("#388e3c")
+LINE_COLOR = QColor("#1565c0")
+
+
+class ChartPlot(QWidget):
+    """管理図1枚分の描画（表示範囲は打点の番号で持つ）"""
+
+    # 表示範囲 (先頭の打点の番号, 打点数) が操作で変わった
+    view_changed = Signal(float, float)
+
+    MARGIN_LEFT = 70
+    MARGIN_RIGHT = 16
+    MARGIN_TOP = 24
+    MARGIN_BOTTOM = 8
+    AXIS_HEIGHT = 22
+
+    def __init__(self, show_time_axis=False, parent=None):
+        super().__init__(parent)
+        self.show_time_axis = show_time_axis
+        self.title = ""
+        self.pyramid = None
+        self.limits = None
+        self.timestamps = None
+        self.view_start = 0.0
+        self.view_span = 1.0
+        self._drag_x = None
+        self.setMinimumHeight(160)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+    def set_data(self, title, pyramid, limits, timestamps):
+        self.title = title
+        self.pyramid = pyramid
+        self.limits = limits
+        self.timestamps = timestamps
+        self.update()
+
+    def set_view(self, start, span):
+        self.view_start = start
+        self.view_span = span
+        self.update()
+
+    def _plot_rect(self):
+        bottom = self.MARGIN_BOTTOM + (self.AXIS_HEIGHT if self.show_time_axis else 0)
+        return (
+            self.MARGIN_LEFT,
+            self.MARGIN_TOP,
+            max(1, self.width() - self.MARGIN_LEFT - self.MARGIN_RIGHT),
+            max(1, self.height() - self.MARGIN_TOP - bottom),
+        )
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        left, top, width, height = self._plot_rect()
+        painter.setPen(QPen(QColor("#999999")))
+        painter.drawRect(left, top, width, height)
+        painter.setPen(Qt.black)
+        painter.drawText(left, 4, width, self.MARGIN_TOP - 6, Qt.AlignLeft | Qt.AlignVCenter, self.title)
+        if self.pyramid is None or not len(self.pyramid):
+            painter.drawText(left, top, width, height, Qt.AlignCenter, "データがありません")
+            return
+
+        start = self.view_start
+        stop = start + self.view_span
+        blocks = self.pyramid.query(start - 1, stop + 1, width * POINTS_PER_PIXEL)
+
+        # 縦軸は表示中の打点と管理限界が収まる範囲
+        values = [v for _, low, high in blocks for v in (low, high)]
+        if self.limits:
+            values.extend(self.limits)
+        y_min, y_max = (min(values), max(values)) if values else (0.0, 1.0)
+        if y_max - y_min < 1e-12:
+            y_min, y_max = y_min - 1, y_max + 1
+        pad = (y_max - y_min) * 0.08
+        y_min, y_max = y_min - pad, y_max + pad
+
+        def to_x(i):
+            return left + (i + 0.5 - start) / self.view_span * width
+
+        def to_y(v):
+            return top + (y_max - v) / (y_max - y_min) * height
+
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setClipRect(left, top, width, height)
+
+        # 管理限界と中心線
+        if self.limits:
+            lcl, cl, ucl = self.limits
+            for value, color, style in ((ucl, LIMIT_COLOR, Qt.DashLine), (cl, CENTER_COLOR, Qt.SolidLine),
+                                        (lcl, LIMIT_COLOR, Qt.DashLine)):
+                painter.setPen(QPen(color, 1, style))
+                y = to_y(value)
+                painter.drawLine(QPointF(left, y), QPointF(left + width, y))
+
+        # 打点（まとめた区間は最小値と最大値を結ぶ）
+        polygon = QPolygonF()
+        for x, low, high in blocks:
+            px = to_x(x)
+            polygon.append(QPointF(px, to_y(low)))
+            if high != low:
+                polygon.append(QPointF(px, to_y(high)))
+        painter.setPen(QPen(LINE_COLOR, 1.2))
+        painter.drawPolyline(polygon)
+
+        if len(blocks) <= MARKER_LIMIT and all(low == high for _, low, high in blocks):
+            lcl, ucl = (self.limits[0], self.limits[2]) if self.limits else (None, None)
+            for x, value, _ in blocks:
+                out = lcl is not None and (value < lcl or value > ucl)
+                color = LIMIT_COLOR if out else LINE_COLOR
+                painter.setPen(QPen(color, 1))
+                painter.setBrush(color)
+                radius = 3.5 if out else 2.5
+                painter.drawEllipse(QPointF(to_x(x), to_y(value)), radius, radius)
+        painter.setClipping(False)
+
+        # 縦軸の目盛り（管理限界の値）
+        painter.setPen(Qt.black)
+        if self.limits:
+            for label, value in zip(("LCL", "CL", "UCL"), self.limits):
+                y = to_y(value)
+                painter.drawText(2, int(y) - 8, left - 6, 16, Qt.AlignRight | Qt.AlignVCenter,
+                                 f"{label} {value:.4g}")
+
+        # 横軸の目盛り（打点の登録日）
+        if self.show_time_axis and self.timestamps:
+            axis_top = top + height + 4
+            for k in range(5):
+                i = int(start + self.view_span * k / 4)
+                if 0 <= i < len(self.timestamps) and self.timestamps[i] == self.timestamps[i]:
+                    text = datetime.fromtimestamp(self.timestamps[i]).strftime("%Y-%m-%d")
+                    x = to_x(i)
+                    painter.drawText(int(x) - 50, axis_top, 100, self.AXIS_HEIGHT - 4, Qt.AlignCenter, text)
+
+    def _total(self):
+        return len(self.pyramid) if self.pyramid is not None else 0
+
+    def wheelEvent(self, event):
+        """マウス位置を中心に拡大・縮小"""
+        total = self._total()
+        if not total:
+            return
+        left, _, width, _ = self._plot_rect()
+        ratio = min(max((event.position().x() - left) / width, 0.0), 1.0)
+        anchor = self.view_start + self.view_span * ratio
+        factor = 0.8 if event.angleDelta().y() > 0 else 1.25
+        span = min(max(self.view_span * factor, MIN_VIEW_SPAN), max(total, MIN_VIEW_SPAN))
+        start = anchor - span * ratio
+        self.view_changed.emit(*clamp_view(start, span, total))
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag_x = event.position().x()
+
+    def mouseMoveEvent(self, event):
+        if self._drag_x is None:
+            return
+        _, _, width, _ = self._plot_rect()
+        dx = event.position().x() - self._drag_x
+        self._drag_x = event.position().x()
+        start = self.view_start - dx / width * self.view_span
+        self.view_changed.emit(*clamp_view(start, self.view_span, self._total()))
+
+    def mouseReleaseEvent(self, event):
+        self._drag_x = None
+
+
+def clamp_view(start, span, total):
+    """表示範囲をデータの範囲内に収める"""
+    start = min(max(start, 0.0), max(total - span, 0.0))
+    return start, span
+
+
+class ControlChartPage(QWidget):
+    """管理図表示用ウィジェット"""
+
+    # 保存先への追記通知（受信スレッドからGUIスレッドへ渡す）
+    store_changed = Signal()
+
+    def __init__(self):
+        super().__init__()
+        self.store = get_store()
+        self.chart = None
+        self.label = None
+        self.product = None
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self.store_changed.connect(self.append_new_points)
+        self.store.add_listener(self.on_records_appended)
+
+        self.init_ui()
+        self.reload_fields()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        layout.setSpacing(10)
+
+        title = QLabel("管理図")
+        title.setStyleSheet("font-size: 18px; font-weight: bold;")
+        layout.addWidget(title)
+
+        control_layout = QHBoxLayout()
+        control_layout.addWidget(QLabel("項目:"))
+        self.field_combo = QComboBox()
+        self.field_combo.setMinimumWidth(160)
+        control_layout.addWidget(self.field_combo)
+
+        control_layout.addWidget(QLabel("品種:"))
+        self.product_combo = QComboBox()
+        self.product_combo.setEditable(True)
+        self.product_combo.setMinimumWidth(160)
+        control_layout.addWidget(self.product_combo)
+
+        control_layout.addWidget(QLabel("種類:"))
+        self.type_combo = QComboBox()
+        self.type_combo.addItems(CHART_TYPES)
+        self.type_combo.currentTextChanged.connect(
+            lambda text: self.subgroup_spin.setEnabled(text == "X̄-R"))
+        control_layout.addWidget(self.type_combo)
+
+        control_layout.addWidget(QLabel("群の大きさ:"))
+        self.subgroup_spin = QSpinBox()
+        self.subgroup_spin.setRange(2, 10)
+        self.subgroup_spin.setValue(5)
+        control_layout.addWidget(self.subgroup_spin)
+
+        show_btn = QPushButton("📈 表示")
+        show_btn.clicked.connect(self.load_chart)
+        control_layout.addWidget(show_btn)
+
+        all_btn = QPushButton("全体")
+        all_btn.clicked.connect(self.show_all)
+        control_layout.addWidget(all_btn)
+        control_layout.addStretch()
+        layout.addLayout(control_layout)
+
+        self.status_label = QLabel("項目を選んで「表示」を押してください。ホイールで拡大・縮小、ドラッグで移動できます。")
+        layout.addWidget(self.status_label)
+
+        self.upper_plot = ChartPlot()
+        self.lower_plot = ChartPlot(show_time_axis=True)
+        for plot in (self.upper_plot, self.lower_plot):
+            plot.view_changed.connect(self.set_view)
+        layout.addWidget(self.upper_plot, 3)
+        layout.addWidget(self.lower_plot, 2)
+        self.setLayout(layout)
+
+    def reload_fields(self):
+        """フォーム設定の数値項目と、品種の候補を読み直す"""
+        current = self.field_combo.currentText()
+        self.field_combo.clear()
+        self.field_combo.addItems(numeric_fields(load_form_config()))
+        if current:
+            self.field_combo.setCurrentText(current)
+
+        product = self.product_combo.currentText()
+        self.product_combo.clear()
+        self.product_combo.addItem(ALL_PRODUCTS)
+        column_store = get_column_store()
+        if column_store is not None:
+            self.product_combo.addItems(sorted(p for p in column_store.products() if p))
+        if product:
+            self.product_combo.setCurrentText(product)
+
+    def load_chart(self):
+        """選んだ項目・品種の管理図を読み込んで表示"""
+        label = self.field_combo.currentText()
+        if not label:
+            self.status_label.setText("数値項目がありません。フォーム設定で「数値」の項目を追加してください。")
+            return
+        product = self.product_combo.currentText().strip()
+        product = None if product in ("", ALL_PRODUCTS) else product
+
+        with self._pending_lock:
+            self._pending = []
+        try:
+            chart = ControlChart(self.type_combo.currentText(), self.subgroup_spin.value())
+            chart.extend(load_points(self.store, label, product))
+        except (OSError, ValueError) as e:
+            self.status_label.setText(f"読み込みに失敗しました: {e}")
+            return
+
+        self.chart = chart
+        self.label = label
+        self.product = product
+        self.update_plots()
+        self.show_all()
+
+    def show_all(self):
+        """全期間を表示"""
+        total = len(self.chart) if self.chart else 0
+        self.set_view(0.0, float(max(total, MIN_VIEW_SPAN)))
+
+    def set_view(self, start, span):
+        """上下の管理図の表示範囲をそろえる"""
+        for plot in (self.upper_plot, self.lower_plot):
+            plot.set_view(start, span)
+
+    def update_plots(self):
+        chart = self.chart
+        limits = chart.limits()
+        upper_name, lower_name = chart.chart_labels()
+        name = f"{self.label}（{self.product or 'すべての品種'}）"
+        self.upper_plot.set_data(f"{upper_name} 管理図: {name}", chart.upper,
+                                 limits["upper"] if limits else None, chart.timestamps)
+        self.lower_plot.set_data(f"{lower_name} 管理図", chart.lower,
+                                 limits["lower"] if limits else None, chart.timestamps)
+        self.status_label.setText(f"打点数: {len(chart)}")
+
+    def on_records_appended(self, records):
+        """追記されたデータを受け取る（登録したスレッドから呼ばれる）"""
+        with self._pending_lock:
+            self._pending.extend(records)
+        self.store_changed.emit()
+
+    def append_new_points(self):
+        """追記されたデータの打点を追加（全体は描き直さない）"""
+        with self._pending_lock:
+            records = self._pending
+            self._pending = []
+        if self.chart is None or not records:
+            return
+        if any(is_log_entry(r) for r in records):
+            # 編集・削除された打点は位置を特定できないため読み込み直す
+            self.load_chart()
+            return
+
+        before = len(self.chart)
+        for record in records:
+            if self.product is not None and record.get("product_name") != self.product:
+                continue
+            value = numeric_value(record, self.label)
+            if value is not None:
+                self.chart.add(record_timestamp(record), value)
+        if len(self.chart) == before:
+            return
+
+        # 最新の打点を表示していた場合は表示範囲を新しい打点に合わせて進める
+        start, span = self.upper_plot.view_start, self.upper_plot.view_span
+        self.update_plots()
+        if start + span >= before:
+            start = max(len(self.chart) - span, 0.0)
+        self.set_view(start, span)
@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日次集計モジュール
+日付・品種ごとの件数・合否と、数値項目ごとの件数・合計・二乗和・最小値・最大値を保持する
+
+集計の表示のたびに全件をたどらないよう、登録のたびに追記分だけを集計に加える。保存先の追記通知の中で
+更新するため、登録の処理が戻った時点で集計にも反映されている。平均・標準偏差は件数・合計・二乗和から求める。
+
+集計は daily_summary.json に保存し、登録ごとの変更は変わった日付・品種の集計だけを
+daily_summary.json.log に1行ずつ追記する（集計ファイル全体は書き直さない）。追記した行が
+COMPACT_LINES を超えたら集計ファイルにまとめる。集計ファイルと追記ファイルの行には世代番号を持たせ、
+まとめる途中で中断しても古い行を重ねて反映しない。追記ファイルはいつでも作り直せる集計のため
+fsync しない（失われた行の分は、行と一緒に記録した入力データファイルの位置から読み直す）。
+
+合否はフォーム設定の数値項目の規格（最小値・最大値）で判定し、規格外の値が1つでもあれば不合格とする。
+
+他のプロセスの登録は次に集計を読むときに追記分を取り込む。編集・削除の記録（record_log.py）は、
+別スレッドで前の版を集計から差し引いてから新しい版を加える。前の版は、最近集計したデータ・
+「登録データ」タブのスナップショット・集計済みの位置までの登録データの順に探す。差し引いた値が
+最小値・最大値だった日付・品種は、その日付・品種の登録データから集計し直す。
+上書き登録・書庫への移動・整理で入力データファイルが書き直された場合は、別スレッドで全件から作り直す。
+フォーム設定の規格を変えた場合は --rebuild で作り直す。
+
+使い方:
+    python daily_summary.py --rebuild    # 作り直す
+    python daily_summary.py              # 日付・品種ごとの件数を表示
+"""
+import argparse
+import math
+import os
+import sys
+import threading
+from collections import OrderedDict
+from itertools import chain
+
+import metrics
+from record_store import RecordStore, get_store, load_form_config
+from record_archive import get_archive
+from record_codec import json_codec, load_json_file
+from record_snapshot import RecordSnapshot, snapshot_path, source_state, is_source_current
+from record_log import (
+    OP_DELETE, archive_overrides, collect_overrides, current_version, get_record_index, is_log_entry, record_id,
+    resolve,
+)
+from sharded_store import ShardedRecordStore
+
+SUMMARY_FILE = "daily_summary.json"
+JOURNAL_SUFFIX = ".log"
+
+# 追記ファイルの行数がこれを超えたら集計ファイルにまとめる
+COMPACT_LINES = 1000
+
+# 編集・削除の前の版を探すために覚えておく、最近集計した登録データの件数
+RECENT_RECORDS = 10000
+
+ERROR_SOURCE = "日次集計の更新"
+
+# 数値項目の集計値の並び
+_COUNT, _SUM, _SUMSQ, _MIN, _MAX = range(5)
+
+
+def field_specs(config):
+    """数値項目の規格 {項目名: (最小値, 最大値)}"""
+    return {
+        f.get("label_name", ""): (f.get("min_value"), f.get("max_value"))
+        for f in config if f.get("data_type") == "数値"
+    }
+
+
+def _numeric(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return None
+
+
+def record_group(record):
+    """集計の日付・品種"""
+    return record.get("entry_date", ""), record.get("product_name", "")
+
+
+def _passed(details, specs):
+    """規格外の値が1つもないか"""
+    for label, (low, high) in specs.items():
+        value = _numeric(details.get(label))
+        if value is not None and ((low is not None and value < low) or (high is not None and value > high)):
+            return False
+    return True
+
+
+def add_records(days, records, specs):
+    """登録データを集計 {日付: {品種: {...}}} に加える"""
+    for record in records:
+        if is_log_entry(record):
+            continue
+        day = days.setdefault(record.get("entry_date", ""), {})
+        summary = day.get(record.get("product_name", ""))
+        if summary is None:
+            summary = day[record.get("product_name", "")] = {"count": 0, "pass": 0, "fail": 0, "fields": {}}
+        summary["count"] += 1
+        details = record.get("details") or {}
+        for label in specs:
+            value = _numeric(details.get(label))
+            if value is None:
+                continue
+            stats = summary["fields"].get(label)
+            if stats is None:
+                summary["fields"][label] = [1, value, value * value, value, value]
+                continue
+            stats[_COUNT] += 1
+            stats[_SUM] += value
+            stats[_SUMSQ] += value * value
+            stats[_MIN] = min(stats[_MIN], value)
+            stats[_MAX] = max(stats[_MAX], value)
+        summary["pass" if _passed(details, specs) else "fail"] += 1
+    return days
+
+
+def remove_record(days, record, specs):
+    """集計に加えた登録データを差し引く（最小値・最大値を求め直す必要がある場合は True）"""
+    day_key, product = record_group(record)
+    day = days.get(day_key)
+    summary = day.get(product) if day else None
+    if summary is None:
+        return False
+    stale = False
+    details = record.get("details") or {}
+    for label in specs:
+        value = _numeric(details.get(label))
+        stats = summary["fields"].get(label)
+        if value is None or stats is None:
+            continue
+        stats[_COUNT] -= 1
+        if stats[_COUNT] <= 0:
+            del summary["fields"][label]
+            continue
+        stats[_SUM] -= value
+        stats[_SUMSQ] -= value * value
+        if value <= stats[_MIN] or value >= stats[_MAX]:
+            stale = True
+    summary["count"] -= 1
+    summary["pass" if _passed(details, specs) else "fail"] -= 1
+    if summary["count"] <= 0:
+        del day[product]
+        if not day:
+            del days[day_key]
+        return False
+    return stale
+
+
+def summarize(records, config=None):
+    """登録データから集計を作る（集計ファイルを使わない場合）"""
+    config = load_form_config() if config is None else config
+    return add_records({}, records, field_specs(config))
+
+
+def field_statistics(stats):
+    """数値項目の集計値から {件数, 平均, 標準偏差, 最小値, 最大値} を求める（標準偏差は不偏）"""
+    count, total, sumsq, low, high = stats
+    mean = total / count
+    std = None
+    if count > 1:
+        std = math.sqrt(max(sumsq - total * total / count, 0.0) / (count - 1))
+    return {"count": count, "mean": mean, "std": std, "min": low, "max": high}
+
+
+def summary_rows(days, date_from=None, date_to=None, product=None):
+    """集計を日付・品種順の行 [{date, product, count, pass, fail, fields}, ...] にする"""
+    rows = []
+    for day in sorted(days):
+        if (date_from and day < date_from) or (date_to and day > date_to):
+            continue
+        for name in sorted(days[day]):
+            if product is not None and name != product:
+                continue
+            summary = days[day][name]
+            rows.append({
+                "date": day,
+                "product": name,
+                "count": summary["count"],
+                "pass": summary["pass"],
+                "fail": summary["fail"],
+                "fields": {label: field_statistics(stats) for label, stats in summary["fields"].items()},
+            })
+    return rows
+
+
+class DailySummary:
+    """日次集計ファイル
+
+    attach() した保存先への登録は追記通知の中で集計に加える。
+    """
+
+    def __init__(self, path=SUMMARY_FILE):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.store = None
+        self.last_error = None
+        self._data = None
+        self._journal_lines = 0
+        self._recent = OrderedDict()
+        self._lock = threading.RLock()
+        self._pending = threading.Event()
+
+    def attach(self, store, background=True):
+        """保存先への登録を集計する（入力データファイルを直接扱う保存先のみ）"""
+        if not isinstance(store, (RecordStore, ShardedRecordStore)):
+            raise ValueError("日次集計は入力データファイルを直接扱う保存先でのみ使えます。")
+        self.store = store
+        store.add_listener(self._on_append)
+        if background:
+            threading.Thread(target=self._rebuild_loop, name="daily-summary", daemon=True).start()
+        if not self.sync():
+            if background:
+                self._pending.set()
+            elif not self.sync(apply_log_entries=True):
+                self.rebuild()
+
+    def _on_append(self, records):
+        try:
+            if not self.sync():
+                self._pending.set()
+            self.last_error = None
+            metrics.clear_error(ERROR_SOURCE)
+        except Exception as e:
+            self.last_error = e
+            metrics.report_error(ERROR_SOURCE, e)
+
+    def _rebuild_loop(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            try:
+                if not self.sync(apply_log_entries=True):
+                    self.rebuild()
+                self.last_error = None
+                metrics.clear_error(ERROR_SOURCE)
+            except Exception as e:
+                self.last_error = e
+                metrics.report_error(ERROR_SOURCE, e)
+
+    def _sources(self):
+        if isinstance(self.store, ShardedRecordStore):
+            return self.store.shards()
+        return [self.store]
+
+    def sync(self, apply_log_entries=False):
+        """追記された分を集計に加える（作り直しが必要な場合は False）
+
+        編集・削除の記録は apply_log_entries の場合だけ反映する（前の版を探すため、追記通知の中では行わない）。
+        """
+        with self._lock:
+            data = self._load()
+            if data is None:
+                return False
+            archive = get_archive()
+            sources = self._sources()
+            if set(data["sources"]) - {source.path for source in sources}:
+                return False  # 保存先が変わった（品種ごとのシャードに分けたなど）
+            appended = []
+            states = {}
+            for source in sources:
+                state = data["sources"].get(source.path)
+                if not os.path.exists(source.path):
+                    if state is not None:
+                        return False
+                    continue
+                if state is None:
+                    # 集計を作った後に作られたシャード（中身はすべて追記分）
+                    records, position = source.load_records_with_position()
+                elif is_source_current(state, source, archive):
+                    records, position = source.load_records_after(state["position"])
+                else:
+                    return False
+                if not records and state is not None:
+                    continue
+                appended.extend(records)
+                if position is not None:
+                    states[source.path] = source_state(source, archive, position)
+            if not states:
+                return True
+            has_log_entries = any(is_log_entry(r) for r in appended)
+            if has_log_entries and not apply_log_entries:
+                return False
+            specs = field_specs(load_form_config())
+            days = data["days"]
+            if has_log_entries:
+                touched = self._apply_log_entries(days, appended, specs, archive, sources,
+                                                  {**data["sources"], **states})
+                if touched is None:
+                    self._data = None  # 途中まで反映した集計は捨て、保存済みの集計から読み直す
+                    return False
+            else:
+                add_records(days, appended, specs)
+                self._remember(appended)
+                touched = {record_group(record) for record in appended}
+            data["sources"].update(states)
+            self._append_journal(touched, states)
+            return True
+
+    def _apply_log_entries(self, days, entries, specs, archive, sources, states):
+        """編集・削除の記録を、前の版を差し引いてから反映する（変わった日付・品種。前の版がない場合は None）"""
+        touched = set()
+        stale = set()
+        snapshots = {}
+        try:
+            for entry in entries:
+                if not is_log_entry(entry):
+                    add_records(days, [entry], specs)
+                    self._remember([entry])
+                    touched.add(record_group(entry))
+                    continue
+                rid = entry["record_id"]
+                previous = self._previous_version(rid, entry["revision"] - 1, entry, archive, sources, states,
+                                                  snapshots)
+                if previous is None:
+                    return None
+                if remove_record(days, previous, specs):
+                    stale.add(record_group(previous))
+                touched.add(record_group(previous))
+                if entry["op"] == OP_DELETE:
+                    self._recent.pop(rid, None)
+                    continue
+                version = current_version(entry)
+                add_records(days, [version], specs)
+                self._remember([version])
+                touched.add(record_group(version))
+        finally:
+            for snapshot in snapshots.values():
+                if snapshot is not None:
+                    snapshot.close()
+        for group in stale:
+            self._recompute_group(days, group, specs, archive, sources, states)
+        return touched
+
+    def _remember(self, records):
+        """編集・削除の前の版を探すために最近の登録データを覚えておく"""
+        for record in records:
+            rid = record_id(record)
+            self._recent[rid] = record
+            self._recent.move_to_end(rid)
+        while len(self._recent) > RECENT_RECORDS:
+            self._recent.popitem(last=False)
+
+    def _previous_version(self, rid, revision, entry, archive, sources, states, snapshots):
+        """版番号が revision の登録データ（最近の登録データ・スナップショット・登録データの順に探す）"""
+        def is_previous(candidate):
+            return (candidate.get("op") != OP_DELETE and record_id(candidate) == rid
+                    and candidate.get("revision", 0) == revision)
+
+        record = self._recent.get(rid)
+        if record is not None and is_previous(record):
+            return record
+        for source in sources:
+            if source.path not in snapshots:
+                try:
+                    snapshots[source.path] = RecordSnapshot(snapshot_path(source))
+                except (OSError, ValueError, KeyError):
+                    snapshots[source.path] = None
+            snapshot = snapshots[source.path]
+            row = snapshot.find(rid) if snapshot is not None else None
+            if row is not None:
+                record = snapshot.record(row)
+                if is_previous(record):
+                    return record
+        # 削除の記録・日付を変えない編集は前の版と同じ日付なので、書庫は日付で絞り込んでから探す
+        day = {"date_from": entry.get("entry_date", ""), "date_to": entry.get("entry_date", "")}
+        candidates = chain(
+            archive.iter_records(day),
+            chain.from_iterable(source.iter_records_until(states[source.path]["position"])
+                                for source in sources if source.path in states),
+            archive.iter_records(),
+        )
+        for candidate in candidates:
+            if is_previous(candidate):
+                return current_version(candidate)
+        return None
+
+    def _recompute_group(self, days, group, specs, archive, sources, states):
+        """日付・品種の集計を、その日付・品種の登録データから作り直す（最小値・最大値を求め直すため）"""
+        day_key, product = group
+        query = {"date_from": day_key, "date_to": day_key, "product_name": product}
+        overrides = archive_overrides(archive)
+        entries = list(archive.iter_records(query))
+        for source in sources:
+            if source.path in states:
+                records = list(source.iter_records_until(states[source.path]["position"]))
+                collect_overrides(records, overrides)
+                entries.extend(records)
+        fresh = {}
+        emitted = set()
+        for record in resolve(entries, overrides):
+            emitted.add(record_id(record))
+            if record_group(record) == group:
+                add_records(fresh, [record], specs)
+        # 他の日付・品種から編集で移ってきた登録データ
+        add_records(fresh, [current_version(latest) for rid, latest in overrides.items()
+                            if rid not in emitted and latest["op"] != OP_DELETE
+                            and record_group(latest) == group], specs)
+        summary = fresh.get(day_key, {}).get(product)
+        if summary is not None:
+            days.setdefault(day_key, {})[product] = summary
+        elif day_key in days:
+            days[day_key].pop(product, None)
+            if not days[day_key]:
+                del days[day_key]
+
+    def rebuild(self):
+        """書庫と入力データファイルの全件から作り直す"""
+        with self._lock:
+            archive = get_archive()
+            sources = self._sources()
+            specs = field_specs(load_form_config())
+            overrides = {} if sources else archive_overrides(archive)
+            for source in sources:
+                index = get_record_index(source, archive)
+                index.sync()
+                overrides.update(index.overrides)
+            days = add_records({}, resolve(archive.iter_records(), overrides), specs)
+            states = {}
+            for source in sources:
+                if not os.path.exists(source.path):
+                    continue
+                records, position = source.load_records_with_position()
+                add_records(days, resolve(records, overrides), specs)
+                if position is not None:
+                    states[source.path] = source_state(source, archive, position)
+            generation = (self._data or {}).get("generation", 0)
+            self._data = {"generation": generation, "sources": states, "days": days}
+            self._save()
+
+    def _load(self):
+        if self._data is None:
+            data = load_json_file(self.path)
+            if data is None:
+                return None
+            data.setdefault("generation", 0)
+            self._data = data
+            self._journal_lines = 0
+            if self._replay_journal():
+                self._save()  # 書きかけの行の後ろに追記しないよう、まとめてから続ける
+        return self._data
+
+    def _replay_journal(self):
+        """追記ファイルの行を集計に重ねる（書きかけの行があれば True）"""
+        if not os.path.exists(self.journal_path):
+            return False
+        data = self._data
+        codec = json_codec()
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    delta = codec.loads(line)
+                except ValueError:
+                    return True
+                if delta.get("generation") != data["generation"]:
+                    continue  # まとめた後に残った古い行
+                data["sources"].update(delta["sources"])
+                for day_key, products in delta["groups"].items():
+                    for product, summary in products.items():
+                        if summary is not None:
+                            data["days"].setdefault(day_key, {})[product] = summary
+                        elif day_key in data["days"]:
+                            data["days"][day_key].pop(product, None)
+                            if not data["days"][day_key]:
+                                del data["days"][day_key]
+                self._journal_lines += 1
+        return False
+
+    def _append_journal(self, groups, states):
+        """変わった日付・品種の集計と入力データファイルの状態を追記ファイルに1行で書く"""
+        days = self._data["days"]
+        delta = {"generation": self._data["generation"], "sources": states, "groups": {}}
+        for day_key, product in groups:
+            delta["groups"].setdefault(day_key, {})[product] = days.get(day_key, {}).get(product)
+        with open(self.journal_path, "ab") as f:
+            f.write(json_codec().dumps(delta) + b"\n")
+        self._journal_lines += 1
+        if self._journal_lines > COMPACT_LINES:
+            self._save()
+
+    def _save(self):
+        """集計を保存して追記ファイルを空にする（書き込み途中のファイルを読まれないよう置き換える）
+
+        世代番号を進めてから置き換えるため、追記ファイルを空にする前に中断しても古い行は反映されない。
+        """
+        self._data["generation"] += 1
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json_codec().dumps(self._data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        with open(self.journal_path, "wb"):
+            pass
+        self._journal_lines = 0
+
+    def is_ready(self):
+        with self._lock:
+            return self._load() is not None
+
+    def rows(self, date_from=None, date_to=None, product=None):
+        """期間・品種の集計行（summary_rows と同じ形。作成前は空）"""
+        if not self.sync():
+            self._pending.set()
+        with self._lock:
+            data = self._load()
+            return summary_rows(data["days"] if data else {}, date_from, date_to, product)
+
+    def products(self):
+        """集計にある品種"""
+        with self._lock:
+            data = self._load()
+            return sorted({name for day in (data or {}).get("days", {}).values() for name in day})
+
+
+_default_summary = None
+
+
+def get_daily_summary():
+    """アプリ全体で共有する日次集計を取得（入力データファイルを直接扱わない場合は None）"""
+    global _default_summary
+    if _default_summary is None:
+        store = get_store()
+        if not isinstance(store, (RecordStore, ShardedRecordStore)):
+            return None
+        _default_summary = DailySummary()
+        _default_summary.attach(store)
+    return _default_summary
+
+
+def main(argv=None):
+    """日次集計の作成・確認"""
+    parser = argparse.ArgumentParser(description="日付・品種ごとの集計を作成・確認します。")
+    parser.add_argument("--rebuild", action="store_true", help="全件から作り直す")
+    parser.add_argument("--date-from", help="表示する期間の開始日")
+    parser.add_argument("--date-to", help="表示する期間の終了日")
+    args = parser.parse_args(argv)
+
+    summary = DailySummary()
+    try:
+        summary.attach(get_store(), background=False)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.rebuild:
+        summary.rebuild()
+        print("日次集計を作り直しました。")
+        return 0
+    for row in summary.rows(args.date_from, args.date_to):
+        print(f"{row['date']} {row['product'] or '（品種なし）'}: {row['count']}件"
+              f"（合格 {row['pass']}件 / 不合格 {row['fail']}件）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日次集計タブ
+日付・品種ごとの件数・合否と、数値項目の平均・標準偏差・最小値・最大値を表示する（集計は daily_summary.py）
+
+登録データは読まずに日次集計だけを読むため、履歴の量によらずすぐに表示できる。
+"""
+from PySide6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QDateEdit, QPushButton,
+    QTableWidget, QTableWidgetItem, QHeaderView
+)
+from PySide6.QtCore import Qt, QDate, QTimer, Signal
+
+from record_store import get_store, load_form_config
+from column_store import numeric_fields
+from daily_summary import get_daily_summary, summarize, summary_rows
+from query_cache import get_query_cache
+
+ALL_PRODUCTS = "（すべての品種）"
+# 初期表示の期間（日数）
+DEFAULT_DAYS = 7
+# 連続した登録は1回の表示更新にまとめる（ミリ秒）
+REFRESH_DELAY_MS = 500
+
+COLUMNS = ["日付", "品種", "件数", "合格", "不合格", "合格率", "平均", "標準偏差", "最小", "最大"]
+
+
+def _format_number(value):
+    return "" if value is None else f"{value:.4g}"
+
+
+class DailySummaryPage(QWidget):
+    """日次集計表示用ウィジェット"""
+
+    # 保存先への追記通知（受信スレッドからGUIスレッドへ渡す）
+    store_changed = Signal()
+
+    def __init__(self):
+        super().__init__()
+        self.store = get_store()
+        self.summary = get_daily_summary()
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(REFRESH_DELAY_MS)
+        self.refresh_timer.timeout.connect(self.load_summary)
+        self.store_changed.connect(self.refresh_timer.start)
+        self.store.add_listener(lambda records: self.store_changed.emit())
+
+        self.init_ui()
+        self.reload_fields()
+        self.load_summary()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        layout.setSpacing(10)
+
+        title = QLabel("日次集計")
+        title.setStyleSheet("font-size: 18px; font-weight: bold;")
+        layout.addWidget(title)
+
+        control_layout = QHBoxLayout()
+        control_layout.addWidget(QLabel("期間:"))
+        today = QDate.currentDate()
+        self.date_from_edit = QDateEdit(today.addDays(1 - DEFAULT_DAYS))
+        self.date_from_edit.setCalendarPopup(True)
+        self.date_from_edit.setDisplayFormat("yyyy-MM-dd")
+        control_layout.addWidget(self.date_from_edit)
+        control_layout.addWidget(QLabel("〜"))
+        self.date_to_edit = QDateEdit(today)
+        self.date_to_edit.setCalendarPopup(True)
+        self.date_to_edit.setDisplayFormat("yyyy-MM-dd")
+        control_layout.addWidget(self.date_to_edit)
+
+        control_layout.addWidget(QLabel("品種:"))
+        self.product_combo = QComboBox()
+        self.product_combo.setEditable(True)
+        self.product_combo.setMinimumWidth(160)
+        control_layout.addWidget(self.product_combo)
+
+        control_layout.addWidget(QLabel("項目:"))
+        self.field_combo = QComboBox()
+        self.field_combo.setMinimumWidth(160)
+        control_layout.addWidget(self.field_combo)
+
+        show_btn = QPushButton("📋 表示")
+        show_btn.clicked.connect(self.load_summary)
+        control_layout.addWidget(show_btn)
+        control_layout.addStretch()
+        layout.addLayout(control_layout)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def reload_fields(self):
+        """フォーム設定の数値項目と、品種の候補を読み直す"""
+        current = self.field_combo.currentText()
+        self.field_combo.clear()
+        self.field_combo.addItems(numeric_fields(load_form_config()))
+        if current:
+            self.field_combo.setCurrentText(current)
+
+        product = self.product_combo.currentText()
+        self.product_combo.clear()
+        self.product_combo.addItem(ALL_PRODUCTS)
+        if self.summary is not None:
+            self.product_combo.addItems([p for p in self.summary.products() if p])
+        if product:
+            self.product_combo.setCurrentText(product)
+
+    def load_rows(self, date_from, date_to, product):
+        """期間・品種の集計行（受付サーバー経由の場合は検索結果から集計する）"""
+        if self.summary is not None:
+            return self.summary.rows(date_from, date_to, product)
+        query = {"date_from": date_from, "date_to": date_to}
+        if product is not None:
+            query["product_name"] = product
+        records = get_query_cache(self.store).query(query)
+        return summary_rows(summarize(records), date_from, date_to, product)
+
+    def load_summary(self):
+        """選んだ期間・品種の集計を表示"""
+        self.refresh_timer.stop()
+        date_from = self.date_from_edit.date().toString("yyyy-MM-dd")
+        date_to = self.date_to_edit.date().toString("yyyy-MM-dd")
+        product = self.product_combo.currentText().strip()
+        product = None if product in ("", ALL_PRODUCTS) else product
+        label = self.field_combo.currentText()
+
+        rows = self.load_rows(date_from, date_to, product)
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            stats = row["fields"].get(label) or {}
+            rate = f"{row['pass'] / row['count'] * 100:.1f}%" if row["count"] else ""
+            values = [
+                row["date"], row["product"], str(row["count"]), str(row["pass"]), str(row["fail"]), rate,
+                _format_number(stats.get("mean")), _format_number(stats.get("std")),
+                _format_number(stats.get("min")), _format_number(stats.get("max")),
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column >= 2:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                if column == 4 and row["fail"]:
+                    item.setForeground(Qt.red)
+                self.table.setItem(i, column, item)
+
+        count = sum(row["count"] for row in rows)
+        failed = sum(row["fail"] for row in rows)
+        if self.summary is not None and not self.summary.is_ready():
+            self.status_label.setText("日次集計を作成中です。しばらくしてから「表示」を押してください。")
+        elif count:
+            self.status_label.setText(
+                f"{date_from} 〜 {date_to}: {count}件（不合格 {failed}件、合格率 {(count - failed) / count * 100:.1f}%）"
+            )
+        else:
+            self.status_label.setText("この期間のデータはありません。")
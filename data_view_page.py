@@ -2,23 +2,127 @@
 # -*- coding: utf-8 -*-
 """
 登録済みデータ閲覧タブ
+
+表示する行はスナップショット（record_snapshot.py）から表示するときに読み出すため、
+履歴の件数によらず一定時間で開ける。
+スナップショットがない場合も、登録データは辞書ではなく省スペースの形（compact_records.py）で保持する。
+
+編集・削除は権限（アカウント設定の「データ編集」「データ削除」）がある場合だけ行え、
+新しい版・削除の記録として追記する（record_log.py）。
 """
-import json
-import os
 from datetime import datetime
 from PySide6.QtWidgets import (
-    QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem,
-    QHeaderView, QPushButton, QMessageBox, QLabel
+    QWidget, QVBoxLayout, QHBoxLayout, QTableView,
+    QHeaderView, QPushButton, QMessageBox, QLabel, QLineEdit
 )
+from PySide6.QtCore import Qt, QTimer, Signal, QAbstractTableModel
+import metrics
+import profiling
+from record_store import get_store
+from record_snapshot import RecordList, open_records
+from record_log import RecordConflictError, update_record, delete_record
+from fulltext_index import FullTextIndex
+from account_settings_page import load_account_settings, has_permission
+
+
+# 他の端末・一括インポート等で追記されてから表示を更新するまでの待ち時間（ミリ秒）
+REFRESH_DELAY_MS = 500
+# 検索語の入力が止まってから検索するまでの待ち時間（ミリ秒）
+SEARCH_DELAY_MS = 300
+
+
+def format_registered_at(registered_at):
+    """登録日時を表示用の形式にする"""
+    if registered_at:
+        try:
+            return datetime.fromisoformat(registered_at).strftime("%Y-%m-%d %H:%M:%S")
+        except Exception:
+            pass
+    return registered_at
+
+
+class RecordTableModel(QAbstractTableModel):
+    """登録データを新しい順に表示するモデル（行は表示するときに読み出す）"""
+
+    HEADERS = ["日付", "品種", "ロット番号", "登録日時", "詳細"]
+    DETAILS_COLUMN = 4
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = RecordList([])
+        self.indices = None  # 検索中は表示する行の番号（新しい順）
+
+    def set_records(self, records, indices=None):
+        """表示するデータを差し替える"""
+        self.beginResetModel()
+        old_records = self.records
+        self.records = records
+        self.indices = indices
+        self.endResetModel()
+        if old_records is not records:
+            old_records.close()
+
+    def record_index(self, row):
+        """表示行に対応する登録データの番号"""
+        if self.indices is not None:
+            return self.indices[row]
+        return len(self.records) - 1 - row
 
-DATA_FILE = "input_data.json"
+    def record_at(self, row):
+        return self.records.record(self.record_index(row))
+
+    def rowCount(self, parent=None):
+        if parent is not None and parent.isValid():
+            return 0
+        return len(self.indices) if self.indices is not None else len(self.records)
+
+    def columnCount(self, parent=None):
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        column = index.column()
+        if column == self.DETAILS_COLUMN:
+            return "詳細..."
+        value = self.records.row(self.record_index(index.row()))[column]
+        if column == 3:
+            return format_registered_at(value)
+        return str(value)
 
 
 class DataViewPage(QWidget):
     """登録済みデータ表示用ウィジェット"""
 
+    # 保存先への追記通知（受信スレッドからGUIスレッドへ渡す）
+    store_changed = Signal()
+
     def __init__(self):
         super().__init__()
+        self.store = get_store()
+
+        # 連続した追記は1回の表示更新にまとめる
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(REFRESH_DELAY_MS)
+        self.refresh_timer.timeout.connect(self.load_registered_data)
+        self.store_changed.connect(self.refresh_timer.start)
+        self.store.add_listener(lambda records: self.store_changed.emit())
+
+        # 文字列項目の全文検索（履歴の索引作成は別スレッドで行う）
+        self.search_index = FullTextIndex()
+        self.row_positions = None  # 索引の行番号と合わない検索結果の行を引く辞書（必要になったときだけ作る）
+        self.search_index.attach(self.store)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.apply_search)
+
         self.init_ui()
         self.load_registered_data()
 
@@ -26,54 +130,202 @@ class DataViewPage(QWidget):
         layout = QVBoxLayout()
         layout.setSpacing(10)
 
+        title_layout = QHBoxLayout()
         title = QLabel("登録済みデータ")
         title.setStyleSheet("font-size: 18px; font-weight: bold;")
-        layout.addWidget(title)
+        title_layout.addWidget(title)
+        title_layout.addStretch()
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("🔍 文字列項目を検索（例: キズ）")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.setMinimumWidth(260)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+        title_layout.addWidget(self.search_edit)
+
+        import_btn = QPushButton("📥 一括インポート")
+        import_btn.clicked.connect(self.open_import_dialog)
+        title_layout.addWidget(import_btn)
+
+        report_btn = QPushButton("📄 レポート作成")
+        report_btn.clicked.connect(self.open_report_dialog)
+        title_layout.addWidget(report_btn)
+
+        self.edit_btn = QPushButton("✏️ 編集")
+        self.edit_btn.clicked.connect(self.edit_selected_record)
+        title_layout.addWidget(self.edit_btn)
 
-        self.data_table = QTableWidget()
-        self.data_table.setColumnCount(5)
-        self.data_table.setHorizontalHeaderLabels([
-            "日付", "品種", "ロット番号", "登録日時", "詳細"
-        ])
+        self.delete_btn = QPushButton("🗑️ 削除")
+        self.delete_btn.clicked.connect(self.delete_selected_record)
+        title_layout.addWidget(self.delete_btn)
+        layout.addLayout(title_layout)
 
+        self.search_status_label = QLabel("")
+        layout.addWidget(self.search_status_label)
+
+        self.model = RecordTableModel(self)
+        self.data_table = QTableView()
+        self.data_table.setModel(self.model)
+        self.data_table.setSelectionBehavior(QTableView.SelectRows)
+        self.data_table.verticalHeader().setDefaultSectionSize(28)
+        self.data_table.clicked.connect(self.on_table_clicked)
+        self.data_table.doubleClicked.connect(lambda index: self.show_details(self.model.record_at(index.row())))
+
+        # 行数に比例する「内容に合わせた列幅」は使わない
         header = self.data_table.horizontalHeader()
-        header.setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(QHeaderView.Interactive)
         header.setSectionResizeMode(1, QHeaderView.Stretch)
         header.setSectionResizeMode(2, QHeaderView.Stretch)
-        header.setSectionResizeMode(3, QHeaderView.ResizeToContents)
-        header.setSectionResizeMode(4, QHeaderView.ResizeToContents)
+        self.data_table.setColumnWidth(0, 110)
+        self.data_table.setColumnWidth(3, 160)
+        self.data_table.setColumnWidth(4, 80)
 
         layout.addWidget(self.data_table)
         self.setLayout(layout)
 
+    @profiling.profile_action("load_data")
+    @metrics.timed("view_refresh")
     def load_registered_data(self):
         """登録済みデータを読み込んでテーブルに表示"""
-        self.data_table.setRowCount(0)
+        self.refresh_timer.stop()
+        self.update_permissions()
+
+        # 書庫へ移した古いデータも合わせて表示（スナップショットがあれば追記分だけを読み込む）
+        records = open_records(self.store)
+        self.row_positions = None
+        if self.search_edit.text().strip():
+            self.model.set_records(records, [])
+            self.apply_search()
+        else:
+            self.model.set_records(records)
+
+    def apply_search(self):
+        """検索語を含む登録データだけを表示"""
+        self.search_timer.stop()
+        records = self.model.records
+        query = self.search_edit.text().strip()
+        if not query:
+            self.search_status_label.setText("")
+            self.model.set_records(records)
+            return
+        if not self.search_index.is_ready():
+            # 索引の作成が終わるまで待ってから検索
+            self.search_status_label.setText("検索用の索引を作成中です...")
+            self.search_timer.start()
+            return
+
+        with metrics.track("fulltext_search"):
+            hits = self.search_index.search_rows(query)
+
+        # 索引が持つ行番号を識別キーで確かめて使う（読み込み後に追記・削除があってずれた分だけ辞書で引く）
+        rows = set()
+        missed = []
+        for row, key in hits:
+            if row is not None and row < len(records) and records.row(row) == key:
+                rows.add(row)
+            else:
+                missed.append(key)
+        if missed:
+            positions = self.row_positions_of(records)
+            rows.update(i for key in missed for i in positions.get(key, ()))
+        matched = sorted(rows, reverse=True)
+        self.search_status_label.setText(f"「{query}」を含むデータ: {len(matched)}件")
+        self.model.set_records(records, matched)
+
+    def row_positions_of(self, records):
+        """識別キーから行の位置を引く辞書 {キー: [行, ...]}"""
+        if self.row_positions is None:
+            positions = {}
+            for i in range(len(records)):
+                positions.setdefault(records.row(i), []).append(i)
+            self.row_positions = positions
+        return self.row_positions
+
+    def on_table_clicked(self, index):
+        """「詳細」列をクリックしたら詳細を表示"""
+        if index.column() == RecordTableModel.DETAILS_COLUMN:
+            self.show_details(self.model.record_at(index.row()))
+
+    def update_permissions(self):
+        """アカウント設定の権限に合わせて編集・削除ボタンを切り替える"""
+        settings = load_account_settings()
+        self.edit_btn.setEnabled(has_permission("update", settings))
+        self.delete_btn.setEnabled(has_permission("delete", settings))
+
+    def selected_record(self):
+        """選択中の行の登録データ（未選択の場合はメッセージを表示して None）"""
+        rows = self.data_table.selectionModel().selectedRows()
+        if not rows:
+            QMessageBox.information(self, "データ未選択", "編集・削除するデータの行を選択してください。")
+            return None
+        return self.model.record_at(rows[0].row())
 
-        if not os.path.exists(DATA_FILE):
+    def edit_selected_record(self):
+        """選択中のデータを編集（新しい版を追記）"""
+        settings = load_account_settings()
+        if not has_permission("update", settings):
+            QMessageBox.warning(self, "権限エラー", "データ編集の権限がありません。")
             return
+        record = self.selected_record()
+        if record is None:
+            return
+
+        from record_edit_dialog_qt import RecordEditDialog
+
+        dialog = RecordEditDialog(record, self)
+        if not dialog.exec() or dialog.changes is None:
+            return
+        try:
+            update_record(self.store, record, dialog.changes, settings.get("display_name", ""))
+        except RecordConflictError as e:
+            QMessageBox.warning(self, "編集エラー", str(e))
+        except Exception as e:
+            QMessageBox.warning(self, "保存エラー", f"編集を保存できませんでした。\n{e}")
+        else:
+            QMessageBox.information(self, "成功", "データを更新しました。")
+        self.load_registered_data()
+
+    def delete_selected_record(self):
+        """選択中のデータを削除（削除の記録を追記）"""
+        settings = load_account_settings()
+        if not has_permission("delete", settings):
+            QMessageBox.warning(self, "権限エラー", "データ削除の権限がありません。")
+            return
+        record = self.selected_record()
+        if record is None:
+            return
+
+        reply = QMessageBox.question(
+            self, "削除の確認",
+            f"次のデータを削除しますか？\n{record.get('entry_date', '')} {record.get('product_name', '')} "
+            f"{record.get('lot_no', '')}",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        try:
+            delete_record(self.store, record, settings.get("display_name", ""))
+        except RecordConflictError as e:
+            QMessageBox.warning(self, "削除エラー", str(e))
+        except Exception as e:
+            QMessageBox.warning(self, "削除エラー", f"削除できませんでした。\n{e}")
+        else:
+            QMessageBox.information(self, "成功", "データを削除しました。")
+        self.load_registered_data()
 
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            data_list = json.load(f)
+    def open_import_dialog(self):
+        """CSV/Excel一括インポートダイアログを開く"""
+        from import_dialog_qt import ImportDialog
 
-        for idx, data in enumerate(reversed(data_list)):
-            self.data_table.insertRow(idx)
-            self.data_table.setItem(idx, 0, QTableWidgetItem(data.get("entry_date", "")))
-            self.data_table.setItem(idx, 1, QTableWidgetItem(data.get("product_name", "")))
-            self.data_table.setItem(idx, 2, QTableWidgetItem(data.get("lot_no", "")))
+        dialog = ImportDialog(self)
+        dialog.data_imported.connect(self.load_registered_data)
+        dialog.exec()
 
-            registered_at = data.get("registered_at", "")
-            if registered_at:
-                try:
-                    dt = datetime.fromisoformat(registered_at)
-                    registered_at = dt.strftime("%Y-%m-%d %H:%M:%S")
-                except Exception:
-                    pass
-            self.data_table.setItem(idx, 3, QTableWidgetItem(registered_at))
+    def open_report_dialog(self):
+        """日報・検査成績書の作成ダイアログを開く"""
+        from report_dialog_qt import ReportDialog
 
-            details_btn = QPushButton("詳細")
-            details_btn.clicked.connect(lambda checked, d=data: self.show_details(d))
-            self.data_table.setCellWidget(idx, 4, details_btn)
+        ReportDialog(self).exec()
 
     def show_details(self, data):
         """詳細データをメッセージボックスで表示"""
@@ -83,7 +335,10 @@ class DataViewPage(QWidget):
         message += f"日付: {data.get('entry_date', '')}\n"
         message += f"品種: {data.get('product_name', '')}\n"
         message += f"ロット番号: {data.get('lot_no', '')}\n"
-        message += f"登録日時: {data.get('registered_at', '')}\n\n"
+        message += f"登録日時: {data.get('registered_at', '')}\n"
+        if data.get("updated_at"):
+            message += f"更新日時: {data.get('updated_at', '')} ({data.get('updated_by') or '-'})\n"
+        message += "\n"
         message += "【詳細データ】\n"
 
         for key, value in details.items():
@@ -4,13 +4,13 @@
 データベース接続設定画面モジュール (PySide6版)
 PostgreSQLとSQL Serverの接続設定を管理
 """
-import json
 import os
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QComboBox, QPushButton, QMessageBox, QGroupBox, QSpinBox
 )
 from PySide6.QtCore import Signal
+from record_codec import load_json_file, save_json_file
 
 DB_CONFIG_FILE = "db_config.json"
 
@@ -159,20 +159,19 @@ class DBConfigPage(QWidget):
     def load_config(self):
         """設定ファイルを読み込む"""
         if os.path.exists(DB_CONFIG_FILE):
-            with open(DB_CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
+            config = load_json_file(DB_CONFIG_FILE)
 
-                # 各フィールドに値を設定
-                db_type = config.get("db_type", "PostgreSQL")
-                index = self.db_type_combo.findText(db_type)
-                if index >= 0:
-                    self.db_type_combo.setCurrentIndex(index)
+            # 各フィールドに値を設定
+            db_type = config.get("db_type", "PostgreSQL")
+            index = self.db_type_combo.findText(db_type)
+            if index >= 0:
+                self.db_type_combo.setCurrentIndex(index)
 
-                self.host_input.setText(config.get("host", ""))
-                self.port_spin.setValue(config.get("port", 5432))
-                self.database_input.setText(config.get("database", ""))
-                self.username_input.setText(config.get("username", ""))
-                self.password_input.setText(config.get("password", ""))
+            self.host_input.setText(config.get("host", ""))
+            self.port_spin.setValue(config.get("port", 5432))
+            self.database_input.setText(config.get("database", ""))
+            self.username_input.setText(config.get("username", ""))
+            self.password_input.setText(config.get("password", ""))
 
     def save_config(self):
         """設定を保存"""
@@ -185,8 +184,7 @@ class DBConfigPage(QWidget):
             "password": self.password_input.text()  # 注意: 平文保存
         }
 
-        with open(DB_CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        save_json_file(DB_CONFIG_FILE, config)
 
         QMessageBox.information(self, "成功", "データベース接続設定を保存しました。")
         self.config_saved.emit()
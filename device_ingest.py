@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+測定器データ受信モジュール
+デジタルノギス・テスター等からの測定値を TCP / シリアル経由で受信する
+
+受信した値は以下のどちらかで扱う。
+- 画面連携: コールバック（入力画面の項目への自動入力）に渡す
+- ヘッドレス: 1件ずつ登録データにし、一定件数・一定時間ごとにまとめて保存する
+
+asyncio で動作し、Qtのイベントループを止めないよう別スレッドでも実行できる。
+
+設定ファイル (device_config.json) の例:
+    {
+      "headless": {"product_name": "製品A", "lot_no": "LOT-001"},
+      "devices": [
+        {"name": "ノギス1", "type": "tcp", "port": 9001, "field": "寸法"},
+        {"name": "テスター", "type": "serial", "serial_port": "COM3", "baudrate": 9600, "field": "電圧"},
+        {"name": "模擬", "type": "simulated", "field": "電流", "interval": 1.0}
+      ]
+    }
+
+使い方:
+    python device_ingest.py            # 設定ファイルの測定器からヘッドレスで受信
+    python device_ingest.py --simulate 寸法  # 模擬測定器で動作確認
+"""
+import argparse
+import asyncio
+import random
+import re
+import sys
+import threading
+from datetime import datetime
+
+import metrics
+from record_store import get_store, load_form_config
+from record_codec import load_json_file
+from record_validation import build_record
+
+DEVICE_CONFIG_FILE = "device_config.json"
+
+# 受信行から数値を取り出す既定のパターン（例: "+012.34mm" → 12.34）
+DEFAULT_VALUE_PATTERN = r"[-+]?\d+(?:\.\d+)?"
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_BATCH_INTERVAL = 0.5  # 秒
+
+# 測定器の接続・保存に失敗した場合にやり直すまでの間隔（秒）
+RETRY_INTERVAL = 5.0
+
+DEVICE_TYPES = ["tcp", "serial", "simulated"]
+
+
+def load_device_config(path=DEVICE_CONFIG_FILE):
+    """測定器設定を読み込む（未設定の場合は None）"""
+    return load_json_file(path)
+
+
+def parse_reading(line, pattern=DEFAULT_VALUE_PATTERN):
+    """受信した1行から測定値を取り出す（数値にできない場合は文字列のまま）"""
+    text = line.strip()
+    if not text:
+        return None
+    match = re.search(pattern, text)
+    if not match:
+        return text
+    value = match.group(0)
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class DeviceIngestService:
+    """測定器からの受信サービス
+
+    on_reading を指定すると (測定器設定, 値) で呼び出す（画面連携）。
+    指定しない場合は store に登録データとしてまとめて保存する（ヘッドレス）。
+    ヘッドレスの測定値は画面入力と同じ入力規則で検証し、品種・製造ロット番号がないものや
+    規則に合わないものは登録しない。
+    on_reading は受信スレッドから呼ばれる点に注意。
+    """
+
+    def __init__(self, devices, on_reading=None, store=None, headless=None, config=None,
+                 batch_size=DEFAULT_BATCH_SIZE, batch_interval=DEFAULT_BATCH_INTERVAL):
+        self.devices = devices
+        self.on_reading = on_reading
+        self.store = store or get_store()
+        self.headless = headless or {}
+        self.config = config if config is not None or on_reading is not None else load_form_config()
+        self.rejected = 0
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.loop = None
+        self._queue = None
+        self._batch = []
+        self._saving = None
+        self._tasks = []
+        self._servers = []
+        self._thread = None
+        self._main_task = None
+
+    async def run(self):
+        """全測定器の受信を開始し、停止されるまで動作する"""
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._consume())]
+        for device in self.devices:
+            self._tasks.append(asyncio.create_task(self._supervise(device)))
+        try:
+            # 1台の失敗で他の測定器の受信を止めない（失敗した測定器は _supervise でやり直す）
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            for server in self._servers:
+                server.close()
+            await self._flush_pending()
+
+    def start(self):
+        """受信を開始する
+
+        現在のスレッドで asyncio のループが動いている場合（qasync等）はそのループで、
+        そうでなければ専用スレッドで実行する。
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop is not None:
+            self._main_task = loop.create_task(self.run())
+            return
+
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """受信を停止する（どのスレッドからでも呼べる）"""
+        if self.loop is None:
+            return
+        for task in self._tasks:
+            self.loop.call_soon_threadsafe(task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    async def _supervise(self, device):
+        """測定器の受信を行い、接続の失敗・切断の場合は一定時間後にやり直す"""
+        name = device.get("name", device.get("type", "tcp"))
+        if device.get("type", "tcp") not in DEVICE_TYPES:
+            print(f"未対応の測定器種別です: {name} ({device.get('type')})", file=sys.stderr)
+            return
+        while True:
+            try:
+                await self._run_device(device)
+                if device.get("type") == "simulated":
+                    return  # 指定回数の出力を終えた
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.count("device_ingest.device_errors")
+                print(f"測定器「{name}」の受信に失敗しました（{RETRY_INTERVAL:g}秒後にやり直します）: {e}",
+                      file=sys.stderr)
+            await asyncio.sleep(RETRY_INTERVAL)
+
+    async def _run_device(self, device):
+        """測定器の種別に応じて受信を開始"""
+        device_type = device.get("type", "tcp")
+        if device_type == "tcp":
+            await self._run_tcp(device)
+        elif device_type == "serial":
+            await self._run_serial(device)
+        elif device_type == "simulated":
+            await SimulatedDevice(device).run(self._put)
+        else:
+            raise ValueError(f"未対応の測定器種別です: {device_type}")
+
+    async def _run_tcp(self, device):
+        """TCPポートで待ち受け、接続ごとに1行ずつ受信"""
+        async def handle(reader, writer):
+            try:
+                await self._read_lines(device, reader)
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, device.get("host", "0.0.0.0"), device["port"])
+        self._servers.append(server)
+        async with server:
+            await server.serve_forever()
+
+    async def _run_serial(self, device):
+        """シリアルポートから1行ずつ受信（pyserial-asyncio が必要）"""
+        try:
+            import serial_asyncio
+        except ImportError:
+            raise RuntimeError("シリアル接続には pyserial-asyncio が必要です。(pip install pyserial-asyncio)")
+
+        reader, writer = await serial_asyncio.open_serial_connection(
+            url=device["serial_port"], baudrate=device.get("baudrate", 9600)
+        )
+        try:
+            await self._read_lines(device, reader)
+        finally:
+            writer.close()
+
+    async def _read_lines(self, device, reader):
+        """ストリームから1行ずつ読み込んで測定値として扱う"""
+        pattern = device.get("pattern", DEFAULT_VALUE_PATTERN)
+        encoding = device.get("encoding", "ascii")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            value = parse_reading(line.decode(encoding, errors="replace"), pattern)
+            if value is not None:
+                await self._put(device, value)
+
+    async def _put(self, device, value):
+        """受信した値をキューに積む"""
+        await self._queue.put((device, value))
+
+    async def _consume(self):
+        """キューから取り出して画面に渡す、またはまとめて保存する"""
+        while True:
+            device, value = await self._queue.get()
+            if self.on_reading is not None:
+                self.on_reading(device, value)
+                continue
+
+            # 保存前に停止された場合も _flush_pending で保存できるよう保持する
+            self._add_to_batch(device, value)
+            deadline = self.loop.time() + self.batch_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    device, value = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                self._add_to_batch(device, value)
+            if not self._batch:
+                continue
+
+            # ファイル書き込みでループを止めないよう別スレッドで保存（失敗した場合は同じ分をやり直す）
+            # 保存に渡した分は先に取り出し、保存中に停止されても _flush_pending で二重に保存しない
+            batch, self._batch = self._batch, []
+            while True:
+                future = self.loop.run_in_executor(None, self.store.append_records, batch)
+                self._saving = (batch, future)
+                try:
+                    await asyncio.shield(future)
+                    break
+                except Exception as e:
+                    self._saving = (batch, None)
+                    metrics.count("device_ingest.save_errors")
+                    print(f"測定値の保存に失敗しました（{RETRY_INTERVAL:g}秒後にやり直します）: {e}", file=sys.stderr)
+                    await asyncio.sleep(RETRY_INTERVAL)
+            self._saving = None
+
+    def _add_to_batch(self, device, value):
+        record = self._make_record(device, value)
+        if record is not None:
+            self._batch.append(record)
+
+    async def _flush_pending(self):
+        """停止時にキューに残った値を保存する"""
+        if self.on_reading is not None or self._queue is None:
+            return
+        if self._saving is not None:
+            # 保存中の分は完了を待ち、失敗していた場合だけ保存し直す
+            saving, future = self._saving
+            self._saving = None
+            saved = False
+            if future is not None:
+                try:
+                    await future
+                    saved = True
+                except Exception:
+                    pass
+            if not saved:
+                self._batch[:0] = saving
+        while not self._queue.empty():
+            device, value = self._queue.get_nowait()
+            self._add_to_batch(device, value)
+        batch, self._batch = self._batch, []
+        if batch:
+            self.store.append_records(batch)
+
+    def _make_record(self, device, value):
+        """測定値1件から登録データを作成（ヘッドレス用。入力規則に合わない場合は None）
+
+        測定器が送るのは1項目の値だけのため、入力規則はその項目の分だけを適用する。
+        """
+        label_name = device.get("field", "")
+        fields = [field for field in self.config if field.get("label_name") == label_name]
+        if not fields:
+            errors = [f"フォームにない項目です: {label_name}"]
+            record = None
+        else:
+            record, errors = build_record(
+                fields,
+                datetime.now().strftime("%Y-%m-%d"),
+                device.get("product_name", self.headless.get("product_name", "")),
+                device.get("lot_no", self.headless.get("lot_no", "")),
+                {label_name: value}
+            )
+        if errors:
+            self.rejected += 1
+            metrics.count("device_ingest.rejected")
+            print(f"測定値を登録しませんでした（{device.get('name', label_name)}: {value}）: {' / '.join(errors)}",
+                  file=sys.stderr)
+            return None
+        return record
+
+
+class SimulatedDevice:
+    """動作確認用の模擬測定器（基準値の周りにばらついた値を一定間隔で出力）"""
+
+    def __init__(self, device):
+        self.device = device
+        self.nominal = device.get("nominal", 10.0)
+        self.sigma = device.get("sigma", 0.05)
+        self.interval = device.get("interval", 1.0)
+        self.count = device.get("count")  # None の場合は停止されるまで出力
+
+    async def run(self, put):
+        """put(測定器設定, 値) を一定間隔で呼び出す"""
+        sent = 0
+        while self.count is None or sent < self.count:
+            value = round(random.gauss(self.nominal, self.sigma), 3)
+            await put(self.device, value)
+            sent += 1
+            await asyncio.sleep(self.interval)
+
+
+def main(argv=None):
+    """ヘッドレスで測定器からの受信を行う"""
+    parser = argparse.ArgumentParser(description="測定器から測定値を受信して登録します。")
+    parser.add_argument("--config", default=DEVICE_CONFIG_FILE, help="測定器設定ファイル")
+    parser.add_argument("--simulate", metavar="項目名", help="模擬測定器で指定項目に値を登録する")
+    parser.add_argument("--product", default="", help="登録時の品種")
+    parser.add_argument("--lot", default="", help="登録時の製造ロット番号")
+    args = parser.parse_args(argv)
+
+    if args.simulate:
+        config = {"devices": [{"name": "模擬", "type": "simulated", "field": args.simulate}]}
+    else:
+        config = load_device_config(args.config)
+        if not config:
+            parser.error(f"測定器設定ファイルがありません: {args.config}")
+
+    headless = dict(config.get("headless", {}))
+    if args.product:
+        headless["product_name"] = args.product
+    if args.lot:
+        headless["lot_no"] = args.lot
+    for device in config.get("devices", []):
+        if not device.get("product_name", headless.get("product_name")) or \
+                not device.get("lot_no", headless.get("lot_no")):
+            parser.error(f"測定器「{device.get('name', '')}」の品種・製造ロット番号がありません（--product / --lot で指定）")
+
+    service = DeviceIngestService(config.get("devices", []), headless=headless)
+    print("受信を開始しました。Ctrl+C で終了します。")
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+測定器データ受信の画面連携 (PySide6版)
+受信スレッドの測定値をシグナルでGUIスレッドに渡す
+"""
+from PySide6.QtCore import QObject, Signal
+
+from device_ingest import DeviceIngestService, load_device_config
+
+
+class DeviceIngestBridge(QObject):
+    """測定器受信サービスとGUIの橋渡し"""
+
+    # 測定値受信通知 (項目名, 値) 項目名が空の場合は入力中の項目に入力する
+    reading_received = Signal(str, object)
+
+    def __init__(self, devices, parent=None):
+        super().__init__(parent)
+        self.service = DeviceIngestService(devices, on_reading=self._on_reading)
+
+    @classmethod
+    def from_config(cls, parent=None):
+        """設定ファイルから作成（未設定の場合は None）"""
+        config = load_device_config()
+        if not config or not config.get("devices"):
+            return None
+        return cls(config["devices"], parent)
+
+    def start(self):
+        """受信を開始（Qtのイベントループは止めない）"""
+        self.service.start()
+
+    def stop(self):
+        """受信を停止"""
+        self.service.stop()
+
+    def _on_reading(self, device, value):
+        # 受信スレッドから呼ばれるため、シグナル経由でGUIスレッドに渡す
+        self.reading_received.emit(device.get("field", ""), value)
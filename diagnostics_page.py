@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+診断タブ（通常は非表示）
+処理ごとの所要時間の集計を表示し、Prometheus形式でファイルに出力する
+操作のプロファイル記録もここから開始する
+書庫への移動・集計などのバックグラウンド処理のエラーもここに表示する
+"""
+import time
+
+from PySide6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+    QHeaderView, QPushButton, QMessageBox, QLabel, QCheckBox, QGroupBox, QSpinBox
+)
+from PySide6.QtCore import Qt, QTimer
+
+import metrics
+import profiling
+
+# 表示の自動更新間隔（ミリ秒）
+REFRESH_INTERVAL_MS = 2000
+
+
+class DiagnosticsPage(QWidget):
+    """処理時間の集計表示用ウィジェット"""
+
+    def __init__(self):
+        super().__init__()
+        self.init_ui()
+        self.refresh()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(REFRESH_INTERVAL_MS)
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        layout.setSpacing(10)
+
+        title = QLabel("診断情報（処理時間）")
+        title.setStyleSheet("font-size: 18px; font-weight: bold;")
+        layout.addWidget(title)
+
+        self.enabled_check = QCheckBox("計測を有効にする")
+        self.enabled_check.setChecked(metrics.is_enabled())
+        self.enabled_check.toggled.connect(self.toggle_metrics)
+        layout.addWidget(self.enabled_check)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels([
+            "処理", "回数", "平均(ms)", "中央値(ms)", "95%(ms)", "最大(ms)"
+        ])
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+        for col in range(1, 6):
+            header.setSectionResizeMode(col, QHeaderView.ResizeToContents)
+        layout.addWidget(self.table)
+
+        self.counter_label = QLabel("")
+        self.counter_label.setWordWrap(True)
+        layout.addWidget(self.counter_label)
+
+        # バックグラウンド処理のエラー
+        error_group = QGroupBox("バックグラウンド処理のエラー")
+        error_layout = QVBoxLayout()
+        self.error_table = QTableWidget()
+        self.error_table.setColumnCount(3)
+        self.error_table.setHorizontalHeaderLabels(["処理", "発生時刻", "内容"])
+        error_header = self.error_table.horizontalHeader()
+        error_header.setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        error_header.setSectionResizeMode(1, QHeaderView.ResizeToContents)
+        error_header.setSectionResizeMode(2, QHeaderView.Stretch)
+        self.error_table.setMaximumHeight(150)
+        error_layout.addWidget(self.error_table)
+        error_group.setLayout(error_layout)
+        layout.addWidget(error_group)
+
+        button_layout = QHBoxLayout()
+        export_btn = QPushButton("💾 ファイルに出力")
+        export_btn.clicked.connect(self.export_metrics)
+        button_layout.addWidget(export_btn)
+
+        reset_btn = QPushButton("🔄 リセット")
+        reset_btn.clicked.connect(self.reset_metrics)
+        button_layout.addWidget(reset_btn)
+        layout.addLayout(button_layout)
+
+        # 操作のプロファイル
+        profile_group = QGroupBox("操作のプロファイル（登録・フォーム再読込・データ読込）")
+        profile_layout = QHBoxLayout()
+        profile_layout.addWidget(QLabel("次の"))
+        self.profile_count_spin = QSpinBox()
+        self.profile_count_spin.setMinimum(1)
+        self.profile_count_spin.setMaximum(100)
+        self.profile_count_spin.setValue(5)
+        profile_layout.addWidget(self.profile_count_spin)
+        profile_layout.addWidget(QLabel("回の操作を記録"))
+
+        profile_btn = QPushButton("⏺ 記録開始")
+        profile_btn.clicked.connect(self.start_profiling)
+        profile_layout.addWidget(profile_btn)
+
+        self.profile_status_label = QLabel("")
+        profile_layout.addWidget(self.profile_status_label)
+        profile_layout.addStretch()
+        profile_group.setLayout(profile_layout)
+        layout.addWidget(profile_group)
+
+        self.setLayout(layout)
+
+    def toggle_metrics(self, checked):
+        """計測の有効/無効を切り替え"""
+        if checked:
+            metrics.enable()
+        else:
+            metrics.disable()
+
+    def refresh(self):
+        """集計値を表示"""
+        histograms, counters = metrics.snapshot()
+        self.table.setRowCount(0)
+
+        for idx, operation in enumerate(sorted(histograms)):
+            histogram = histograms[operation]
+            values = [
+                str(histogram.count),
+                f"{histogram.mean * 1000:.1f}",
+                f"{histogram.quantile(0.5) * 1000:.1f}",
+                f"{histogram.quantile(0.95) * 1000:.1f}",
+                f"{histogram.max * 1000:.1f}",
+            ]
+            self.table.insertRow(idx)
+            self.table.setItem(idx, 0, QTableWidgetItem(operation))
+            for col, value in enumerate(values, start=1):
+                item = QTableWidgetItem(value)
+                item.setTextAlignment(int(Qt.AlignRight | Qt.AlignVCenter))
+                self.table.setItem(idx, col, item)
+
+        self.counter_label.setText(
+            " / ".join(f"{name}: {value}" for name, value in sorted(counters.items()))
+        )
+
+        errors = metrics.errors()
+        self.error_table.setRowCount(len(errors))
+        for idx, source in enumerate(sorted(errors)):
+            occurred_at, message = errors[source]
+            values = [source, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(occurred_at)), message]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col == 2:
+                    item.setForeground(Qt.red)
+                self.error_table.setItem(idx, col, item)
+        self.profile_status_label.setText(
+            f"残り {profiling.remaining()} 回（出力先: {profiling.PROFILE_DIR}）" if profiling.remaining() else ""
+        )
+
+    def start_profiling(self):
+        """次のN回の操作をプロファイル対象にする"""
+        profiling.arm(self.profile_count_spin.value())
+        self.refresh()
+
+    def export_metrics(self):
+        """Prometheus形式でファイルに出力"""
+        path = metrics.dump_to_file()
+        QMessageBox.information(self, "出力完了", f"診断情報を出力しました。\n{path}")
+
+    def reset_metrics(self):
+        """集計値を消去"""
+        metrics.reset()
+        self.refresh()
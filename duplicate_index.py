@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重複登録チェックモジュール
+品種 + 製造ロット番号 + 日付 の組み合わせをハッシュ表で保持し、
+履歴の件数によらず O(1) で重複を判定する
+"""
+import threading
+
+from record_log import OP_DELETE, record_id, resolve_records
+
+# 重複登録時の動作
+DUPLICATE_POLICIES = {
+    "confirm": "確認して登録",
+    "overwrite": "上書き",
+    "reject": "登録しない",
+}
+DEFAULT_DUPLICATE_POLICY = "confirm"
+
+# 重複判定に使う項目
+KEY_FIELDS = ["product_name", "lot_no", "entry_date"]
+
+
+def record_key(record):
+    """重複判定に使うキー"""
+    return tuple(record.get(key, "") for key in KEY_FIELDS)
+
+
+class RecordKeyIndex:
+    """登録済みキーの件数表
+
+    store に登録すると、以降の登録（画面・一括インポート・測定器）と編集・削除・上書き登録で
+    自動的に更新される。record_id ごとに今のキーを持ち、編集でキーが変わった場合は古いキーを除く。
+    """
+
+    def __init__(self):
+        self._counts = {}   # キー → そのキーの登録データの件数
+        self._records = {}  # record_id → (キー, 版番号)。削除されたものはキーを None にする
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def attach(self, store, background=True):
+        """保存先の履歴からキーを読み込み、以降の追記を反映する"""
+        store.add_listener(self.add_records)
+        if background:
+            threading.Thread(target=self._build, args=(store,), daemon=True).start()
+        else:
+            self._build(store)
+
+    def _build(self, store):
+        try:
+            self.add_records(resolve_records(store.load_records()))
+        finally:
+            self._ready.set()
+
+    def add_records(self, records):
+        """登録データ・編集・削除の記録を反映（反映済みの版より古いものは無視する）"""
+        with self._lock:
+            for record in records:
+                rid = record_id(record)
+                revision = record.get("revision", 0)
+                old = self._records.get(rid)
+                if old is not None:
+                    old_key, old_revision = old
+                    if old_revision >= revision:
+                        continue
+                    if old_key is not None:
+                        self._discard(old_key)
+                key = None if record.get("op") == OP_DELETE else record_key(record)
+                self._records[rid] = (key, revision)
+                if key is not None:
+                    self._counts[key] = self._counts.get(key, 0) + 1
+
+    def _discard(self, key):
+        count = self._counts.get(key, 0) - 1
+        if count > 0:
+            self._counts[key] = count
+        else:
+            self._counts.pop(key, None)
+
+    def is_ready(self):
+        """履歴の読み込みが完了したか"""
+        return self._ready.is_set()
+
+    def contains(self, record):
+        """同じキーのデータが登録済みか（履歴の読み込み中で分からない場合は None。待たずに返す）"""
+        if not self._ready.is_set():
+            return None
+        return record_key(record) in self._counts
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文検索インデックスモジュール
+文字列項目（備考・不良内容など）の値を n-gram の転置インデックスで検索する
+
+日本語は単語の区切りがないため、1文字と2文字の n-gram をすべて索引にする。
+検索語の n-gram のうち該当件数が最も少ないものを候補とし、元の文字列で一致を確認する。
+登録ごとに追記分だけを索引に加えるため、履歴の件数によらず更新は一定時間で済む。
+
+索引の各文書は登録データのID (record_id) ごとに最新の版だけを持つ。編集・削除・上書き登録の
+記録（record_log.py）が届くと、古い版の文書を検索対象から外し、新しい版を加える。
+他のプロセス・他の保存先オブジェクトが追記した分は、検索時に前回の位置より後だけを読んで加える。
+入力データファイルが追記以外で書き換わった場合（書庫への移動・整理）は、検索時に検出して
+別スレッドで作り直す（作り直す間は今の索引で検索する）。
+
+表示順（record_snapshot.open_records と同じ、記録を反映した元の順）での行番号も索引に持ち、
+検索結果の行を全件を走査せずに引けるようにする。
+"""
+import os
+import threading
+import unicodedata
+from array import array
+
+import metrics
+from record_store import RecordStore, load_form_config
+from record_archive import get_archive, iter_all_records
+from record_log import OP_DELETE, is_log_entry, record_id
+from record_snapshot import source_state, is_source_current
+
+DEFAULT_LIMIT = 1000
+
+# 表示順の行がない文書（元の登録データを読んでいない編集の記録）
+_NO_ROW = 0xFFFFFFFF
+
+ERROR_SOURCE = "全文検索の索引作成"
+
+# 検索対象にするデータ型
+SEARCH_DATA_TYPES = ["文字列"]
+
+
+# カタカナをひらがなに揃える（「キズ」と「きず」を同じに扱う）
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def normalize_text(text):
+    """全角・半角、大文字・小文字、カタカナ・ひらがなの違いをなくす"""
+    return unicodedata.normalize("NFKC", text).lower().translate(_KATAKANA_TO_HIRAGANA)
+
+
+def ngrams(text):
+    """1文字と2文字の n-gram の集合"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def search_fields(config):
+    """フォーム設定から検索対象の項目名を返す"""
+    return [f.get("label_name", "") for f in config if f.get("data_type", "文字列") in SEARCH_DATA_TYPES]
+
+
+def hit_key(record):
+    """検索結果として返す登録データの識別キー"""
+    return (
+        record.get("entry_date", ""),
+        record.get("product_name", ""),
+        record.get("lot_no", ""),
+        record.get("registered_at", ""),
+    )
+
+
+class _LiveRows:
+    """登録データの読み込み順の番号から、削除分を除いた表示順の行番号を引く（Fenwick木）"""
+
+    def __init__(self):
+        self.tree = array("I", [0])  # 1始まり
+
+    def append(self):
+        """残っている行を末尾に加え、その番号を返す"""
+        i = len(self.tree)
+        total = 1
+        j = i - 1
+        stop = i - (i & -i)
+        while j > stop:
+            total += self.tree[j]
+            j -= j & -j
+        self.tree.append(total)
+        return i - 1
+
+    def remove(self, ordinal):
+        """削除された行を数えないようにする"""
+        i = ordinal + 1
+        while i < len(self.tree):
+            self.tree[i] -= 1
+            i += i & -i
+
+    def row(self, ordinal):
+        """ordinal より前に残っている行の数（表示順の行番号）"""
+        i = ordinal
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+class _Postings:
+    """n-gram の転置インデックス本体（文書番号は追加順。古い版の文書は本文を None にする）"""
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.postings = {}
+        self.texts = []
+        self.keys = []
+        self.doc_ordinals = array("I")  # 文書番号 → 読み込み順の番号
+        self.docs = {}       # record_id → 最新の版の文書番号
+        self.revisions = {}  # record_id → 索引にした版番号
+        self.ordinals = {}   # record_id → 読み込み順の番号（削除されていないもの）
+        self.rows = _LiveRows()
+        self.count = 0
+
+    def apply(self, entries):
+        """登録データ・編集・削除の記録を反映（索引にした版より古いものは無視する）"""
+        for entry in entries:
+            rid = record_id(entry)
+            revision = entry.get("revision", 0)
+            indexed = self.revisions.get(rid)
+            if indexed is not None and indexed >= revision:
+                continue
+            self.revisions[rid] = revision
+            old = self.docs.pop(rid, None)
+            if old is not None:
+                self.texts[old] = None
+                self.count -= 1
+            if not is_log_entry(entry):
+                if rid not in self.ordinals:
+                    self.ordinals[rid] = self.rows.append()
+            elif entry.get("op") == OP_DELETE:
+                # 削除された行より後ろの行番号を詰める
+                ordinal = self.ordinals.pop(rid, None)
+                if ordinal is not None:
+                    self.rows.remove(ordinal)
+                continue
+            details = entry.get("details") or {}
+            text = "\n".join(
+                normalize_text(value) for value in (details.get(name) for name in self.fields)
+                if isinstance(value, str) and value
+            )
+            if not text:
+                continue
+            doc_id = len(self.texts)
+            self.texts.append(text)
+            self.keys.append(hit_key(entry))
+            self.doc_ordinals.append(self.ordinals.get(rid, _NO_ROW))
+            self.docs[rid] = doc_id
+            self.count += 1
+            for gram in ngrams(text):
+                postings = self.postings.get(gram)
+                if postings is None:
+                    postings = self.postings[gram] = array("I")
+                postings.append(doc_id)
+
+
+class FullTextIndex:
+    """文字列項目の n-gram 転置インデックス
+
+    store に登録すると、以降の登録（画面・一括インポート・測定器）と編集・削除・上書き登録で
+    自動的に更新される。
+    """
+
+    def __init__(self, fields=None):
+        self.fields = fields
+        self.store = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._data = _Postings(fields or [])
+        self._state = None
+        self._empty_source = False  # 入力データファイルがない状態で作ったか
+        self._pending = None  # 作り直している間に届いた登録データ
+        self._ready = threading.Event()
+        self._check_lock = threading.Lock()
+
+    def __len__(self):
+        return self._data.count
+
+    def is_ready(self):
+        """履歴の読み込みが完了したか"""
+        return self._ready.is_set()
+
+    def attach(self, store, background=True):
+        """保存先の履歴（書庫を含む）を索引にし、以降の追記を反映する"""
+        if self.fields is None:
+            self.fields = search_fields(load_form_config())
+            self._data.fields = self.fields
+        self.store = store
+        store.add_listener(self.add_records)
+        if background:
+            self._start_build()
+        else:
+            self._pending = []
+            self._build()
+
+    def _start_build(self):
+        """別スレッドで作り直す（作り直している最中なら何もしない）"""
+        with self._lock:
+            if self._pending is not None:
+                return
+            self._pending = []
+        threading.Thread(target=self._build, name="fulltext-index", daemon=True).start()
+
+    def _build(self):
+        """履歴の全件から新しい索引を作り、作る間に届いた登録データを反映して置き換える"""
+        store = self.store
+        data = _Postings(self.fields or [])
+        try:
+            archive = get_archive()
+            state = None
+            empty_source = False
+            if isinstance(store, RecordStore):
+                position = store.end_position()
+                if position is not None:
+                    state = source_state(store, archive, position)
+                else:
+                    empty_source = True
+            batch = []
+            for record in iter_all_records(store, archive):
+                batch.append(record)
+                if len(batch) >= 10000:
+                    data.apply(batch)
+                    batch = []
+            data.apply(batch)
+            with self._lock:
+                data.apply(self._pending)
+                self._data = data
+                self._state = state
+                self._empty_source = empty_source
+            self.last_error = None
+            metrics.clear_error(ERROR_SOURCE)
+        except Exception as e:
+            self.last_error = e
+            metrics.report_error(ERROR_SOURCE, e)
+        finally:
+            with self._lock:
+                self._pending = None
+            self._ready.set()
+
+    def _check_source(self):
+        """他のプロセスなどが追記した分を反映し、追記以外で書き換わっていれば作り直しを始める"""
+        store = self.store
+        if not isinstance(store, RecordStore):
+            return
+        with self._check_lock:
+            state = self._state
+            if state is None:
+                if self._empty_source and os.path.exists(store.path):
+                    self._empty_source = False
+                    self._start_build()
+                return
+            archive = get_archive()
+            if not is_source_current(state, store, archive):
+                self._state = None
+                self._start_build()
+                return
+            try:
+                # 自分の追記は通知で反映済みだが、版番号で判定するため重ねて反映しても変わらない
+                appended, position = store.load_records_after(state["position"])
+                if appended:
+                    self.add_records(appended)
+                    self._state = source_state(store, archive, position)
+            except (OSError, ValueError) as e:
+                self.last_error = e
+                metrics.report_error(ERROR_SOURCE, e)
+
+    def add_records(self, records):
+        """登録データ・編集・削除の記録を索引に反映"""
+        with self._lock:
+            self._data.apply(records)
+            if self._pending is not None:
+                self._pending.extend(records)
+
+    def _matches(self, data, query, limit):
+        """検索語を含む文書番号を新しい順に最大 limit 件返す（self._lock を取得して呼ぶ）"""
+        grams = [query] if len(query) == 1 else [query[i:i + 2] for i in range(len(query) - 1)]
+        candidates = min((data.postings.get(g, ()) for g in grams), key=len)
+        texts = data.texts
+        hits = []
+        for doc_id in reversed(candidates):
+            text = texts[doc_id]
+            if text is not None and query in text:
+                hits.append(doc_id)
+                if len(hits) >= limit:
+                    break
+        return hits
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """検索語を含む登録データの識別キーを新しい順に最大 limit 件返す"""
+        query = normalize_text(query.strip())
+        if not query:
+            return []
+        self._check_source()
+        with self._lock:
+            data = self._data
+            return [data.keys[doc_id] for doc_id in self._matches(data, query, limit)]
+
+    def search_rows(self, query, limit=DEFAULT_LIMIT):
+        """検索語を含む登録データの (表示順の行番号, 識別キー) を新しい順に最大 limit 件返す
+
+        行番号は open_records で開いた一覧の位置。索引の方が新しい場合にずれるため、
+        呼び出し側で識別キーと照合する（行番号が分からないものは None）。
+        """
+        query = normalize_text(query.strip())
+        if not query:
+            return []
+        self._check_source()
+        with self._lock:
+            data = self._data
+            hits = []
+            for doc_id in self._matches(data, query, limit):
+                ordinal = data.doc_ordinals[doc_id]
+                row = None if ordinal == _NO_ROW else data.rows.row(ordinal)
+                hits.append((row, data.keys[doc_id]))
+        return hits
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+一括インポートダイアログ (PySide6版)
+ファイル選択 → 列の対応付け → 取込実行 の順に進むウィザード
+"""
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
+    QTableWidget, QTableWidgetItem, QComboBox, QHeaderView, QFileDialog,
+    QMessageBox, QProgressBar, QSpinBox
+)
+from PySide6.QtCore import QThread, Signal
+
+from bulk_import import (
+    HEADER_TARGETS, DEFAULT_CHUNK_SIZE, read_header, guess_mapping, import_file
+)
+from record_store import load_form_config
+
+# 対応付けしない列の表示名
+NOT_MAPPED = "（取込まない）"
+
+
+class ImportWorker(QThread):
+    """バックグラウンドで取込を実行するスレッド"""
+
+    progressed = Signal(int, int, int)
+    finished_import = Signal(dict)
+    failed = Signal(str)
+
+    def __init__(self, path, mapping, config, chunk_size, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.mapping = mapping
+        self.config = config
+        self.chunk_size = chunk_size
+        self._cancelled = False
+
+    def cancel(self):
+        """取込を中断（処理中のチャンクは登録される）"""
+        self._cancelled = True
+
+    def run(self):
+        try:
+            summary = import_file(
+                self.path, self.mapping, config=self.config, chunk_size=self.chunk_size,
+                progress=self.progressed.emit, cancelled=lambda: self._cancelled
+            )
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.finished_import.emit(summary)
+
+
+class ImportDialog(QDialog):
+    """CSV/Excel一括インポートダイアログ"""
+
+    # 取込完了通知（データ閲覧タブ更新用）
+    data_imported = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.config = load_form_config()
+        self.header = []
+        self.worker = None
+        self.init_ui()
+
+    def init_ui(self):
+        """UIの初期化"""
+        self.setWindowTitle("一括インポート")
+        self.setModal(True)
+        self.resize(700, 600)
+
+        layout = QVBoxLayout()
+
+        # ステップ1: ファイル選択
+        layout.addWidget(QLabel("① 取込むファイルを選択してください（CSV / Excel）"))
+        file_layout = QHBoxLayout()
+        self.path_input = QLineEdit()
+        self.path_input.setReadOnly(True)
+        file_layout.addWidget(self.path_input)
+        browse_btn = QPushButton("📂 参照")
+        browse_btn.clicked.connect(self.select_file)
+        file_layout.addWidget(browse_btn)
+        layout.addLayout(file_layout)
+
+        # ステップ2: 列の対応付け
+        layout.addWidget(QLabel("② ファイルの列と登録先の項目を対応付けてください"))
+        self.mapping_table = QTableWidget()
+        self.mapping_table.setColumnCount(2)
+        self.mapping_table.setHorizontalHeaderLabels(["ファイルの列", "登録先の項目"])
+        header = self.mapping_table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+        header.setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(self.mapping_table)
+
+        # ステップ3: 取込実行
+        option_layout = QHBoxLayout()
+        option_layout.addWidget(QLabel("③ 1回に処理する行数:"))
+        self.chunk_spin = QSpinBox()
+        self.chunk_spin.setMinimum(100)
+        self.chunk_spin.setMaximum(100000)
+        self.chunk_spin.setSingleStep(1000)
+        self.chunk_spin.setValue(DEFAULT_CHUNK_SIZE)
+        option_layout.addWidget(self.chunk_spin)
+        option_layout.addStretch()
+        layout.addLayout(option_layout)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        button_layout = QHBoxLayout()
+        self.import_btn = QPushButton("📥 取込開始")
+        self.import_btn.setStyleSheet("background-color: #4CAF50; color: white; padding: 10px; font-size: 14px;")
+        self.import_btn.setEnabled(False)
+        self.import_btn.clicked.connect(self.start_import)
+        button_layout.addWidget(self.import_btn)
+
+        self.close_btn = QPushButton("閉じる")
+        self.close_btn.clicked.connect(self.close_dialog)
+        button_layout.addWidget(self.close_btn)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+    def target_choices(self):
+        """対応付け先の選択肢 (表示名, キー)"""
+        choices = [(NOT_MAPPED, "")]
+        choices += [(name, key) for key, name in HEADER_TARGETS.items()]
+        choices += [(field.get("label_name", ""), field.get("label_name", "")) for field in self.config]
+        return choices
+
+    def select_file(self):
+        """ファイルを選択して見出し行を読み込む"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "取込ファイルを選択", "", "CSV / Excel (*.csv *.xlsx *.xlsm);;すべてのファイル (*)"
+        )
+        if not path:
+            return
+
+        try:
+            self.header = read_header(path)
+        except Exception as e:
+            QMessageBox.warning(self, "読込エラー", f"ファイルを読み込めませんでした。\n{e}")
+            return
+
+        self.path_input.setText(path)
+        self.update_mapping_table(guess_mapping(self.header, self.config))
+        self.import_btn.setEnabled(bool(self.header))
+
+    def update_mapping_table(self, mapping):
+        """列の対応付けテーブルを更新"""
+        choices = self.target_choices()
+        self.mapping_table.setRowCount(0)
+
+        for idx, column in enumerate(self.header):
+            self.mapping_table.insertRow(idx)
+            self.mapping_table.setItem(idx, 0, QTableWidgetItem(column))
+
+            combo = QComboBox()
+            for name, key in choices:
+                combo.addItem(name, key)
+            index = combo.findData(mapping.get(column, ""))
+            if index >= 0:
+                combo.setCurrentIndex(index)
+            self.mapping_table.setCellWidget(idx, 1, combo)
+
+    def current_mapping(self):
+        """テーブルで選択された対応付けを取得"""
+        mapping = {}
+        for idx, column in enumerate(self.header):
+            target = self.mapping_table.cellWidget(idx, 1).currentData()
+            if target:
+                mapping[column] = target
+        return mapping
+
+    def start_import(self):
+        """取込を開始"""
+        mapping = self.current_mapping()
+        missing = [name for key, name in HEADER_TARGETS.items() if key not in mapping.values()]
+        if missing:
+            QMessageBox.warning(self, "入力エラー", f"基本情報の列を対応付けてください: {', '.join(missing)}")
+            return
+
+        self.import_btn.setEnabled(False)
+        self.progress_bar.setVisible(True)
+        self.status_label.setText("取込中...")
+
+        self.worker = ImportWorker(self.path_input.text(), mapping, self.config, self.chunk_spin.value(), self)
+        self.worker.progressed.connect(self.on_progress)
+        self.worker.finished_import.connect(self.on_finished)
+        self.worker.failed.connect(self.on_failed)
+        self.worker.start()
+
+    def on_progress(self, total, imported, rejected):
+        """進捗表示を更新"""
+        self.status_label.setText(f"処理済み: {total}行 (登録 {imported} / 却下 {rejected})")
+
+    def on_finished(self, summary):
+        """取込完了"""
+        self.progress_bar.setVisible(False)
+        self.import_btn.setEnabled(True)
+        message = f"登録: {summary['imported']}件 / 却下: {summary['rejected']}件"
+        if summary["report"]:
+            message += f"\n\n却下された行の一覧:\n{summary['report']}"
+        self.status_label.setText(message.split("\n")[0])
+        QMessageBox.information(self, "取込完了", message)
+        self.data_imported.emit()
+
+    def on_failed(self, message):
+        """取込失敗"""
+        self.progress_bar.setVisible(False)
+        self.import_btn.setEnabled(True)
+        self.status_label.setText("")
+        QMessageBox.warning(self, "取込エラー", f"取込に失敗しました。\n{message}")
+        self.data_imported.emit()
+
+    def close_dialog(self):
+        """取込中の場合は中断してから閉じる"""
+        if self.worker and self.worker.isRunning():
+            self.worker.cancel()
+            self.worker.wait()
+        self.accept()
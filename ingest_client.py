@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録受付サーバーの接続モジュール
+RecordStore と同じ使い方で、読み書きを登録受付サーバー (ingest_server.py) 経由で行う
+
+設定ファイル (ingest_config.json) があると get_store() がこの保存先を返す:
+    {"host": "192.168.1.10", "port": 8765}
+"""
+import itertools
+import json
+import socket
+import threading
+
+import metrics
+from record_codec import load_json_file
+from record_store import new_record_id
+
+INGEST_CONFIG_FILE = "ingest_config.json"
+
+# サーバーの応答を待つ時間（秒）
+REQUEST_TIMEOUT = 30
+
+# 全件の読み込みの応答を待つ時間（秒。サーバーが全件を読み込む間も待つため長くする）
+# 読み込み結果を受信している間は、この時間を過ぎても待ち続ける
+LOAD_TIMEOUT = 600
+
+
+def load_ingest_config(path=INGEST_CONFIG_FILE):
+    """受付サーバーの接続設定を読み込む（未設定の場合は None）"""
+    return load_json_file(path) or None
+
+
+class IngestError(Exception):
+    """受付サーバーとの通信エラー"""
+
+
+class _PendingRequest:
+    """応答待ちの要求"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.reply = None
+        self.records = []
+
+
+class RemoteRecordStore:
+    """登録受付サーバー経由の保存先
+
+    1つの接続で要求と通知の受信を行い、他の端末が登録したデータも追記通知として受け取る。
+    """
+
+    def __init__(self, host, port, timeout=REQUEST_TIMEOUT, load_timeout=LOAD_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self._listeners = []
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._sock = None
+
+    def add_listener(self, callback):
+        """追記時に呼び出す関数を登録（他の端末の登録も通知される）"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """登録した関数を解除"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _ensure_connected(self):
+        with self._connect_lock:
+            if self._sock is not None:
+                return
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            except OSError as e:
+                raise IngestError(f"登録受付サーバーに接続できません ({self.host}:{self.port}): {e}")
+            sock.settimeout(None)
+            self._sock = sock
+            threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+        self._send({"id": next(self._ids), "op": "subscribe"})
+
+    def _send(self, message):
+        data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._send_lock:
+            try:
+                self._sock.sendall(data)
+            except OSError as e:
+                self._disconnect()
+                raise IngestError(f"登録受付サーバーへの送信に失敗しました: {e}")
+
+    def _disconnect(self):
+        with self._connect_lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _read_loop(self, sock):
+        """応答・通知を受信して振り分ける"""
+        try:
+            with sock.makefile("rb") as reader:
+                for line in reader:
+                    message = json.loads(line)
+                    if message.get("event") == "appended":
+                        self._notify(message.get("records", []))
+                        continue
+                    pending = self._pending.get(message.get("id"))
+                    if pending is None:
+                        continue
+                    if "records" in message and not message.get("done"):
+                        pending.records.extend(message["records"])
+                        continue
+                    pending.reply = message
+                    pending.event.set()
+        except (OSError, ValueError):
+            pass
+        finally:
+            if self._sock is sock:
+                self._disconnect()
+            # 応答待ちの要求はエラーとして終了させる
+            for pending in list(self._pending.values()):
+                pending.event.set()
+
+    def _request(self, message, timeout=None):
+        """要求を送り、応答を待つ（timeout を省略した場合は self.timeout）
+
+        分割された読み込み結果を受信している間は、timeout を過ぎても待ち続ける。
+        """
+        self._ensure_connected()
+        request_id = next(self._ids)
+        message["id"] = request_id
+        pending = _PendingRequest()
+        self._pending[request_id] = pending
+        try:
+            self._send(message)
+            received = 0
+            while not pending.event.wait(self.timeout if timeout is None else timeout):
+                if len(pending.records) == received:
+                    raise IngestError("登録受付サーバーからの応答がありません。")
+                received = len(pending.records)
+        finally:
+            self._pending.pop(request_id, None)
+
+        reply = pending.reply
+        if reply is None:
+            raise IngestError("登録受付サーバーとの接続が切れました。")
+        if not reply.get("ok"):
+            raise IngestError(reply.get("error", "登録受付サーバーでエラーが発生しました。"))
+        return pending
+
+    def _notify(self, records):
+        for callback in list(self._listeners):
+            callback(records)
+
+    @metrics.timed("store.load_records")
+    def load_records(self):
+        """全登録データを読み込む"""
+        return self._request({"op": "load"}, timeout=self.load_timeout).records
+
+    def iter_records(self):
+        """登録データを1件ずつ返す"""
+        yield from self.load_records()
+
+    def append_record(self, record):
+        """1件追記"""
+        self.append_records([record])
+
+    @metrics.timed("store.append_records")
+    def append_records(self, records):
+        """複数件をまとめて追記（サーバーの書き込み完了まで待つ）"""
+        if not records:
+            return
+        for record in records:
+            if not record.get("record_id"):
+                record["record_id"] = new_record_id()
+        self._request({"op": "append", "records": records})
+        metrics.count("records_appended", len(records))
+        self._notify(records)
+
+    @metrics.timed("store.replace_records")
+    def replace_records(self, match, record):
+        """match の項目がすべて一致する登録データを record 1件に置き換える
+
+        追記通知・戻り値は RecordStore.replace_records() と同じ（置き換えを編集・削除の記録の形で渡す）。
+        """
+        reply = self._request({"op": "replace", "match": match, "record": record}).reply
+        changes = reply.get("changes") or [record]
+        record.update({key: changes[-1][key] for key in ("record_id", "revision") if key in changes[-1]})
+        self._notify(changes)
+        return changes
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録受付サーバー
+複数の端末からの登録を1つのプロセスで受け付け、入力データファイルへの書き込みを直列化する
+
+共有フォルダ上の input_data.json を複数端末で直接書き換えると互いの追記を上書きしてしまうため、
+ファイルはこのサーバーだけが書き込み、各端末はサーバーに登録データを送る。
+処理中に届いた登録はまとめて1回で書き込み（グループコミット）、
+書き込み後に接続中の端末へ新しい登録データを通知する。
+
+通信は1行1メッセージのJSON (TCP または Unixソケット):
+    → {"id": 1, "op": "append", "records": [...]}
+    ← {"id": 1, "ok": true, "count": 3}
+    → {"id": 2, "op": "load"}
+    ← {"id": 2, "records": [...]} (複数回)  ← {"id": 2, "ok": true, "done": true}
+    → {"id": 3, "op": "replace", "match": {...}, "record": {...}}
+    ← {"id": 3, "ok": true, "changes": [...]}  (置き換えを編集・削除の記録の形にしたもの)
+    → {"id": 4, "op": "subscribe"}
+    ← {"event": "appended", "records": [...]}  (他の端末が登録したとき)
+
+使い方:
+    python ingest_server.py --port 8765 --data input_data.json
+    python ingest_server.py --unix /tmp/eform.sock
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from record_store import DATA_FILE, RecordStore
+from record_archive import ArchiveJob
+from record_log import CompactionJob
+from column_store import ColumnStore
+from daily_summary import DailySummary
+from change_feed import DEFAULT_HOST as FEED_HOST, ChangeFeed, load_change_feed_config, start_feed_server
+from sharded_store import open_store
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# 1回の書き込みにまとめる最大件数
+MAX_COMMIT_RECORDS = 5000
+# 読み込み結果を分割して送る件数
+LOAD_CHUNK_SIZE = 1000
+# 1行の最大長（大きな一括登録を受け付けるため既定より大きくする）
+STREAM_LIMIT = 64 * 1024 * 1024
+
+
+def encode_message(message):
+    """メッセージを1行のJSONに変換"""
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class Connection:
+    """接続中の端末"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.subscribed = False
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message):
+        async with self._send_lock:
+            self.writer.write(encode_message(message))
+            await self.writer.drain()
+
+
+class IngestServer:
+    """登録受付サーバー"""
+
+    def __init__(self, store, max_commit_records=MAX_COMMIT_RECORDS):
+        self.store = store
+        self.max_commit_records = max_commit_records
+        self.connections = set()
+        self._queue = None
+        self._broadcasts = set()
+        self.change_feed = None
+        self.loop = None
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, ready=None):
+        """受付を開始し、停止されるまで動作する"""
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        if unix_path:
+            server = await asyncio.start_unix_server(self._handle, unix_path, limit=STREAM_LIMIT)
+        else:
+            server = await asyncio.start_server(self._handle, host, port, limit=STREAM_LIMIT)
+
+        committer = asyncio.create_task(self._commit_loop())
+        if ready:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            committer.cancel()
+
+    async def _handle(self, reader, writer):
+        """1つの接続からの要求を処理"""
+        connection = Connection(writer)
+        self.connections.add(connection)
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    await connection.send({"ok": False, "error": "JSONとして解釈できません。"})
+                    continue
+                # 書き込み待ちの間も次の要求を受け付ける
+                task = asyncio.create_task(self._dispatch(connection, message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(connection)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _dispatch(self, connection, message):
+        request_id = message.get("id")
+        op = message.get("op")
+        try:
+            if op == "append":
+                records = message.get("records") or []
+                count = await self._enqueue(("append", records, connection))
+                await connection.send({"id": request_id, "ok": True, "count": count})
+            elif op == "replace":
+                changes = await self._enqueue(("replace", (message["match"], message["record"]), connection))
+                await connection.send({"id": request_id, "ok": True, "changes": changes})
+            elif op == "load":
+                await self._send_records(connection, request_id)
+            elif op == "subscribe":
+                connection.subscribed = True
+                await connection.send({"id": request_id, "ok": True})
+            elif op == "ping":
+                await connection.send({"id": request_id, "ok": True})
+            else:
+                await connection.send({"id": request_id, "ok": False, "error": f"未対応の要求です: {op}"})
+        except ConnectionError:
+            pass
+        except Exception as e:
+            await connection.send({"id": request_id, "ok": False, "error": str(e)})
+
+    async def _enqueue(self, item):
+        """書き込み待ちの列に追加し、書き込み完了を待つ"""
+        future = self.loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _commit_loop(self):
+        """書き込み待ちの登録をまとめて書き込む（グループコミット）
+
+        前回の書き込み中に届いた追記を1回の書き込みにまとめる。上書きは単独で処理する。
+        """
+        deferred = None
+        while True:
+            entry = deferred or await self._queue.get()
+            deferred = None
+            (kind, payload, _), _ = entry
+            if kind == "replace":
+                await self._commit_replace(entry)
+                continue
+
+            batch = [entry]
+            count = len(payload)
+            while count < self.max_commit_records and not self._queue.empty():
+                next_entry = self._queue.get_nowait()
+                if next_entry[0][0] != "append":
+                    deferred = next_entry
+                    break
+                batch.append(next_entry)
+                count += len(next_entry[0][1])
+            await self._commit_append(batch)
+
+    async def _commit_append(self, batch):
+        records = [record for (_, item_records, _), _ in batch for record in item_records]
+        try:
+            await self.loop.run_in_executor(None, self.store.append_records, records)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, item_records, _), future in batch:
+            if not future.done():
+                future.set_result(len(item_records))
+        for (_, item_records, origin), _ in batch:
+            self._start_broadcast(item_records, origin)
+
+    async def _commit_replace(self, entry):
+        (_, (match, record), origin), future = entry
+        try:
+            changes = await self.loop.run_in_executor(None, self.store.replace_records, match, record)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(changes)
+        self._start_broadcast(changes, origin)
+
+    def _start_broadcast(self, records, origin):
+        """通知を別タスクで送る（受信の遅い端末で書き込みを止めない）"""
+        task = self.loop.create_task(self._broadcast(records, origin))
+        self._broadcasts.add(task)
+        task.add_done_callback(self._broadcasts.discard)
+
+    async def _broadcast(self, records, origin):
+        """登録した端末以外の購読中の端末に通知"""
+        if not records:
+            return
+        message = {"event": "appended", "records": records}
+        for connection in list(self.connections):
+            if connection is origin or not connection.subscribed:
+                continue
+            try:
+                await connection.send(message)
+            except ConnectionError:
+                self.connections.discard(connection)
+
+    async def _send_records(self, connection, request_id):
+        """全登録データを分割して送る"""
+        records = await self.loop.run_in_executor(None, self.store.load_records)
+        for start in range(0, len(records), LOAD_CHUNK_SIZE):
+            await connection.send({"id": request_id, "records": records[start:start + LOAD_CHUNK_SIZE]})
+        await connection.send({"id": request_id, "ok": True, "done": True})
+
+
+def main(argv=None):
+    """登録受付サーバーを起動"""
+    parser = argparse.ArgumentParser(description="複数端末からの登録を受け付けるサーバーを起動します。")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="待ち受けるアドレス（他のPCから使う場合は 0.0.0.0）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="待ち受けるポート番号")
+    parser.add_argument("--unix", metavar="PATH", help="TCPの代わりにUnixソケットで待ち受ける")
+    parser.add_argument("--data", default=DATA_FILE, help="入力データファイル")
+    args = parser.parse_args(argv)
+
+    store = open_store(args.data)
+    server = IngestServer(store)
+
+    # 書庫が設定されていれば古いデータを定期的に移す
+    archive_job = ArchiveJob.from_config(store)
+    if archive_job:
+        archive_job.start()
+
+    # 編集・削除の記録を定期的に整理する
+    CompactionJob.from_config(store).start()
+
+    # 数値項目を列ストアにも取り込む（品種別の保存先では使わない）
+    if isinstance(store, RecordStore):
+        ColumnStore().attach(store)
+
+    # 日付・品種ごとの集計を登録のたびに更新する
+    DailySummary().attach(store)
+
+    # 設定されていれば登録・編集・削除を変更フィードに記録する
+    feed_config = load_change_feed_config()
+    if feed_config is not None:
+        server.change_feed = ChangeFeed()
+        server.change_feed.attach(store)
+        if feed_config.get("port"):
+            start_feed_server(server.change_feed, feed_config.get("host", FEED_HOST), feed_config["port"])
+
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"登録受付サーバーを起動しました ({where}, データ: {args.data})。Ctrl+C で終了します。")
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,30 +4,94 @@
 """
 import streamlit as st
 from datetime import datetime
-import json
 import os
+import threading
+
+from record_store import get_store
+from record_codec import load_json_file
+from record_archive import load_all_records
+from record_archive import get_archive
+from record_snapshot import open_records, source_state
+from sharded_store import ShardedRecordStore
 
 CONFIG_FILE = "form_config.json"
-DATA_FILE = "input_data.json"
+
+# 登録済みデータの1ページあたりの表示件数
+HISTORY_PAGE_SIZE = 20
+
+def _file_version(path):
+    """キャッシュのキーにするファイルの更新日時とサイズ（ファイルが無い場合は None）"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+@st.cache_data(max_entries=4)
+def _load_json_file(path, version):
+    """JSONファイルを読み込む（ファイルが変わるまで再読み込みしない）"""
+    if version is None:
+        return []
+    return load_json_file(path, [])
+
+def clear_caches():
+    """保存後に読み込み結果のキャッシュを破棄する"""
+    _load_json_file.clear()
 
 def load_form_config():
     """フォーム設定を読み込む"""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+    return _load_json_file(CONFIG_FILE, _file_version(CONFIG_FILE))
 
 def load_input_data():
-    """入力データを読み込む"""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
-
-def save_input_data(data_list):
-    """入力データを保存する"""
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data_list, f, ensure_ascii=False, indent=2)
+    """入力データを読み込む（保存先は他の画面と共通。書庫・編集・削除も反映した最新の版）"""
+    return load_all_records(get_store())
+
+def append_input_data(new_data):
+    """入力データを1件追記する（既存データを読み直さない。保存先は他の画面と共通）"""
+    get_store().append_record(new_data)
+    clear_caches()
+
+# 開いた登録データを入力データファイル・書庫の状態が変わるまで使い回す（再実行のたびに開き直さない）
+_history_cache = {"key": None, "records": None}
+_history_lock = threading.Lock()
+
+def _history_key(store):
+    """開いた登録データを使い回せるかの判定に使う状態（品種別の保存先はシャードごと）"""
+    archive = get_archive()
+    sources = store.shards() if isinstance(store, ShardedRecordStore) else [store]
+    key = [tuple(archive.segment_paths())]
+    for source in sources:
+        position = source.end_position()
+        if position is None:
+            continue
+        state = source_state(source, archive, position)
+        key.append((source.path, state["inode"], position, state["tail"]))
+    return tuple(key)
+
+def _open_history(store):
+    """表示用の登録データを開く（状態が変わっていなければ前回開いたものを返す。_history_lock 内で呼ぶ）"""
+    key = _history_key(store)
+    if _history_cache["key"] != key or _history_cache["records"] is None:
+        if _history_cache["records"] is not None:
+            _history_cache["records"].close()
+            _history_cache["records"] = None
+        _history_cache["records"] = open_records(store)
+        _history_cache["key"] = key
+    return _history_cache["records"]
+
+def load_history_page(page, page_size=HISTORY_PAGE_SIZE):
+    """登録件数と、新しい順で page ページ目（0始まり）の登録データ [(No., データ), ...] を返す
+
+    スナップショット（record_snapshot.py）から開くため、読み出すのは表示するページの分だけ。
+    開いた登録データは入力データファイル・書庫が変わるまで使い回す。
+    編集・削除の記録は反映して、最新の版だけを返す。
+    """
+    with _history_lock:
+        records = _open_history(get_store())
+        total = len(records)
+        stop = max(total - page * page_size, 0)
+        start = max(stop - page_size, 0)
+        return total, [(i + 1, records.record(i)) for i in range(stop - 1, start - 1, -1)]
 
 def render_input_page():
     """入力画面をレンダリング"""
@@ -157,9 +221,7 @@ def render_input_page():
                     "registered_at": datetime.now().isoformat()
                 }
 
-                existing_data = load_input_data()
-                existing_data.append(new_data)
-                save_input_data(existing_data)
+                append_input_data(new_data)
 
                 st.success("✅ データを登録しました!")
 
@@ -177,14 +239,30 @@ def render_input_page():
     # 登録済みデータの表示
     st.subheader("📊 登録済みデータ")
 
-    existing_data = load_input_data()
-
-    if existing_data:
-        st.write(f"**{len(existing_data)}件のデータが登録されています**")
+    page = st.session_state.get("history_page", 1)
+    total, history = load_history_page(page - 1)
+    page_count = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    if total and page > page_count:
+        page = page_count
+        total, history = load_history_page(page - 1)
+
+    if total:
+        st.write(f"**{total}件のデータが登録されています**")
+
+        # 表示中のページだけを読み込む
+        if page_count > 1:
+            st.session_state.history_page = page
+            st.number_input(
+                f"ページ (全{page_count}ページ)",
+                min_value=1,
+                max_value=page_count,
+                step=1,
+                key="history_page"
+            )
 
-        for idx, data in enumerate(reversed(existing_data)):
+        for number, data in history:
             with st.expander(
-                f"No.{len(existing_data) - idx} | {data['entry_date']} | {data['product_name']} | {data['lot_no']}",
+                f"No.{number} | {data['entry_date']} | {data['product_name']} | {data['lot_no']}",
                 expanded=False
             ):
                 st.write("**基本情報:**")
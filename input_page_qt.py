@@ -5,19 +5,22 @@
 設定された項目に基づいて動的にフォームを生成する
 パスワード、日付時刻、配置、入力規則に対応
 """
-import json
 import os
-import re
 from datetime import datetime
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QPushButton, QGroupBox, QScrollArea, QDateEdit, QMessageBox,
-    QDoubleSpinBox, QDateTimeEdit, QGridLayout, QTimeEdit, QTableWidget, QTableWidgetItem
+    QDoubleSpinBox, QDateTimeEdit, QGridLayout, QTimeEdit, QTableWidget, QTableWidgetItem,
+    QCompleter
 )
-from PySide6.QtCore import Qt, QDate, QDateTime, QTime, Signal
-
-CONFIG_FILE = "form_config.json"
-DATA_FILE = "input_data.json"
+from PySide6.QtCore import Qt, QDate, QDateTime, QTime, Signal, QStringListModel
+import metrics
+import profiling
+from autocomplete_index import HistoryIndex
+from duplicate_index import RecordKeyIndex, KEY_FIELDS, DEFAULT_DUPLICATE_POLICY
+from record_log import is_log_entry
+from record_store import CONFIG_FILE, get_store, load_form_config, load_form_settings
+from record_validation import validate_value
 
 
 class InputPage(QWidget):
@@ -29,6 +32,13 @@ class InputPage(QWidget):
     def __init__(self):
         super().__init__()
         self.detail_widgets = {}  # 詳細入力ウィジェットを保持
+        self.store = get_store()
+        # 品種・ロット番号の入力補完（履歴はバックグラウンドで読み込む）
+        self.history_index = HistoryIndex()
+        self.history_index.attach(self.store)
+        # 重複登録チェック用のキー
+        self.key_index = RecordKeyIndex()
+        self.key_index.attach(self.store)
         self.init_ui()
         self.reload_config()
 
@@ -57,12 +67,14 @@ class InputPage(QWidget):
         header_layout.addWidget(QLabel("品種:"))
         self.product_input = QLineEdit()
         self.product_input.setPlaceholderText("例: 製品A")
+        self.setup_completer(self.product_input, self.history_index.suggest_products)
         header_layout.addWidget(self.product_input)
 
         # ロット番号
         header_layout.addWidget(QLabel("製造ロット番号:"))
         self.lot_input = QLineEdit()
         self.lot_input.setPlaceholderText("例: LOT-20250101-001")
+        self.setup_completer(self.lot_input, self.history_index.suggest_lots)
         header_layout.addWidget(self.lot_input)
 
         header_group.setLayout(header_layout)
@@ -89,7 +101,8 @@ class InputPage(QWidget):
 
         register_btn = QPushButton("✅ データを登録")
         register_btn.setStyleSheet("background-color: #4CAF50; color: white; padding: 10px; font-size: 14px;")
-        register_btn.clicked.connect(self.register_data)
+        # clicked の引数(checked)を計測・プロファイル用のデコレータに渡さないよう lambda で呼ぶ
+        register_btn.clicked.connect(lambda: self.register_data())
         button_layout.addWidget(register_btn)
 
         clear_btn = QPushButton("🔄 クリア")
@@ -101,6 +114,24 @@ class InputPage(QWidget):
 
         self.setLayout(layout)
 
+    def setup_completer(self, line_edit, suggest):
+        """入力中の文字列で始まる履歴を候補として表示する"""
+        model = QStringListModel(self)
+        completer = QCompleter(model, self)
+        completer.setCaseSensitivity(Qt.CaseSensitive)
+        line_edit.setCompleter(completer)
+
+        def update_candidates(text):
+            # 候補はインデックスで絞り込み済みのため、表示するものだけをモデルに渡す
+            model.setStringList(suggest(text))
+            completer.setCompletionPrefix(text)
+            if text:
+                completer.complete()
+
+        line_edit.textEdited.connect(update_candidates)
+
+    @profiling.profile_action("reload_config")
+    @metrics.timed("reload_config")
     def reload_config(self):
         """設定を再読み込みして詳細入力フォームを再生成"""
         # 既存のウィジェットをクリア
@@ -119,8 +150,7 @@ class InputPage(QWidget):
             self.scroll_content_layout.addWidget(label, 0, 0)
             return
 
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            config = json.load(f)
+        config = load_form_config()
 
         if not config:
             label = QLabel("⚠️ 入力項目が設定されていません。\n「設定画面」から入力項目を追加してください。")
@@ -253,6 +283,8 @@ class InputPage(QWidget):
 
         return label, widget
 
+    @profiling.profile_action("register_data")
+    @metrics.timed("register_data")
     def register_data(self):
         """データを登録"""
         # ヘッダー情報の検証
@@ -270,21 +302,12 @@ class InputPage(QWidget):
         for label_name, info in self.detail_widgets.items():
             widget = info["widget"]
             data_type = info["data_type"]
-            is_required = info["is_required"]
             field_config = info["field_config"]
 
             # 値を取得
             if data_type == "数値":
                 value = widget.value()
 
-                # 数値の範囲チェック
-                min_val = field_config.get("min_value")
-                max_val = field_config.get("max_value")
-                if min_val is not None and value < min_val:
-                    errors.append(f"「{label_name}」は{min_val}以上で入力してください。")
-                if max_val is not None and value > max_val:
-                    errors.append(f"「{label_name}」は{max_val}以下で入力してください。")
-
             elif data_type == "日付":
                 value = widget.date().toString("yyyy-MM-dd")
 
@@ -308,30 +331,12 @@ class InputPage(QWidget):
                         row_values[header] = cell_text
                     if has_value:
                         value.append(row_values)
-                if is_required and not value:
-                    errors.append(f"「{label_name}」は最低1行入力してください。")
-                detail_values[label_name] = value
-                continue
 
             else:  # 文字列またはパスワード
                 value = widget.text().strip()
 
-                # 正規表現チェック
-                regex_pattern = field_config.get("regex_pattern", "")
-                if regex_pattern and value:
-                    try:
-                        if not re.match(regex_pattern, value):
-                            errors.append(f"「{label_name}」の形式が正しくありません。")
-                    except re.error:
-                        pass  # 正規表現のエラーは無視
-
-            # 必須チェック
-            if is_required:
-                if value is None or (isinstance(value, str) and not value.strip()):
-                    errors.append(f"「{label_name}」は必須項目です。")
-                elif data_type == "数値" and value == 0:
-                    # 数値の場合、0も有効な値として扱う
-                    pass
+            # 入力規則チェック（範囲・正規表現・必須）
+            errors.extend(validate_value(field_config, value))
 
             detail_values[label_name] = value
 
@@ -348,19 +353,52 @@ class InputPage(QWidget):
             "registered_at": datetime.now().isoformat()
         }
 
-        # 既存データを読み込み
-        existing_data = []
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                existing_data = json.load(f)
-
-        existing_data.append(new_data)
-
-        # 保存
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=2)
-
-        QMessageBox.information(self, "成功", "データを登録しました。")
+        # 重複チェック（品種 + ロット番号 + 日付）
+        overwrite = False
+        policy = load_form_settings().get("duplicate_policy", DEFAULT_DUPLICATE_POLICY)
+        duplicate = self.key_index.contains(new_data)
+        if duplicate is None:
+            # 履歴の読み込み中は待たない（上書きは保存時に一致するデータを探すため、そのまま使える）
+            if policy == "overwrite":
+                overwrite = True
+            else:
+                reply = QMessageBox.question(
+                    self, "確認",
+                    "登録済みデータを読み込み中のため、重複を確認できません。\nこのまま登録しますか?",
+                    QMessageBox.Yes | QMessageBox.No
+                )
+                if reply != QMessageBox.Yes:
+                    return
+        elif duplicate:
+            duplicate_message = (
+                f"品種「{product_name}」ロット番号「{lot_no}」"
+                f"日付「{new_data['entry_date']}」のデータは登録済みです。"
+            )
+            if policy == "reject":
+                QMessageBox.warning(self, "重複エラー", duplicate_message)
+                return
+            if policy == "overwrite":
+                overwrite = True
+            else:
+                reply = QMessageBox.question(
+                    self, "確認",
+                    f"{duplicate_message}\n別のデータとして登録しますか?",
+                    QMessageBox.Yes | QMessageBox.No
+                )
+                if reply != QMessageBox.Yes:
+                    return
+
+        if overwrite:
+            match = {key: new_data[key] for key in KEY_FIELDS}
+            changes = self.store.replace_records(match, new_data)
+            if any(is_log_entry(change) for change in changes):
+                QMessageBox.information(self, "成功", "登録済みのデータを上書きしました。")
+            else:
+                QMessageBox.information(self, "成功", "データを登録しました。")
+        else:
+            # 保存（既存データは読み直さずに追記）
+            self.store.append_record(new_data)
+            QMessageBox.information(self, "成功", "データを登録しました。")
 
         # 入力フィールドをクリア
         self.clear_inputs()
@@ -368,6 +406,33 @@ class InputPage(QWidget):
         # 登録完了を通知（データ閲覧タブ更新用）
         self.data_saved.emit()
 
+    def fill_device_reading(self, label_name, value):
+        """測定器から受信した値を入力欄に入力する
+
+        項目名が空の場合は入力中（フォーカスのある）の項目に入力し、次の項目へ移動する。
+        """
+        info = self.detail_widgets.get(label_name) if label_name else None
+        if info is None:
+            focused = self.focusWidget()
+            info = next((i for i in self.detail_widgets.values() if i["widget"] is focused), None)
+            if info is None:
+                return
+
+        widget = info["widget"]
+        data_type = info["data_type"]
+        if data_type == "数値":
+            try:
+                widget.setValue(float(value))
+            except (TypeError, ValueError):
+                return
+        elif data_type in ["文字列", "パスワード"]:
+            widget.setText(str(value))
+        else:
+            return  # 日付・時刻・表形式は測定器からの入力対象外
+
+        if not label_name:
+            widget.focusNextChild()
+
     def clear_inputs(self):
         """入力フィールドをクリア"""
         for info in self.detail_widgets.values():
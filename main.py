@@ -5,14 +5,65 @@
 メインアプリケーション (PySide6版)
 
 DB接続なし版: 設定画面で項目を増やすと、入力画面のフォームが動的に増える仕組みを実装
+
+起動を速くするため、各タブの画面は初めて選択されたときに作成する。
+画面モジュールの import も作成時まで遅らせる。
 """
+import os
 import sys
-from PySide6.QtWidgets import QApplication, QMainWindow, QTabWidget
-from config_page_qt import ConfigPage
-from input_page_qt import InputPage
-from data_view_page import DataViewPage
-from db_config_page import DBConfigPage
-from account_settings_page import AccountSettingsPage
+from PySide6.QtWidgets import QApplication, QMainWindow, QTabWidget, QWidget
+from PySide6.QtGui import QShortcut, QKeySequence
+from PySide6.QtCore import QTimer
+
+
+def create_input_page():
+    from input_page_qt import InputPage
+    return InputPage()
+
+
+def create_data_view_page():
+    from data_view_page import DataViewPage
+    return DataViewPage()
+
+
+def create_control_chart_page():
+    from control_chart_page import ControlChartPage
+    return ControlChartPage()
+
+
+def create_daily_summary_page():
+    from daily_summary_page import DailySummaryPage
+    return DailySummaryPage()
+
+
+def create_config_page():
+    from config_page_qt import ConfigPage
+    return ConfigPage()
+
+
+def create_db_config_page():
+    from db_config_page import DBConfigPage
+    return DBConfigPage()
+
+
+def create_account_settings_page():
+    from account_settings_page import AccountSettingsPage
+    return AccountSettingsPage()
+
+
+# バックグラウンド処理のエラーを確認する間隔（ミリ秒）
+ERROR_CHECK_INTERVAL_MS = 5000
+
+# タブ一覧 (属性名, タブ名, 作成関数)
+TAB_DEFINITIONS = [
+    ("input_page", "📝 データ入力", create_input_page),
+    ("data_view_page", "📊 登録データ", create_data_view_page),
+    ("control_chart_page", "📈 管理図", create_control_chart_page),
+    ("daily_summary_page", "📋 日次集計", create_daily_summary_page),
+    ("config_page", "⚙️ フォーム設定", create_config_page),
+    ("db_config_page", "🔌 DB接続設定", create_db_config_page),
+    ("account_settings_page", "👤 アカウント設定", create_account_settings_page),
+]
 
 
 class MainWindow(QMainWindow):
@@ -20,6 +71,10 @@ class MainWindow(QMainWindow):
 
     def __init__(self):
         super().__init__()
+        self.device_bridge = None
+        self.archive_job = None
+        self.compaction_job = None
+        self.diagnostics_page = None
         self.init_ui()
 
     def init_ui(self):
@@ -27,34 +82,153 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("生産現場向け・可変型入力システム")
         self.setGeometry(100, 100, 1400, 900)
 
-        # タブウィジェットの作成
+        # タブウィジェットの作成（中身は選択されるまで空のまま）
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
 
-        # 入力画面タブ
-        self.input_page = InputPage()
-        self.tabs.addTab(self.input_page, "📝 データ入力")
-
-        # データ閲覧タブ
-        self.data_view_page = DataViewPage()
-        self.tabs.addTab(self.data_view_page, "📊 登録データ")
-
-        # 設定画面タブ
-        self.config_page = ConfigPage()
-        self.tabs.addTab(self.config_page, "⚙️ フォーム設定")
-
-        # DB接続設定画面タブ
-        self.db_config_page = DBConfigPage()
-        self.tabs.addTab(self.db_config_page, "🔌 DB接続設定")
-
-        # アカウント設定タブ
-        self.account_settings_page = AccountSettingsPage()
-        self.tabs.addTab(self.account_settings_page, "👤 アカウント設定")
-
+        for attr, title, _ in TAB_DEFINITIONS:
+            setattr(self, attr, None)
+            self.tabs.addTab(QWidget(), title)
+
+        self.tabs.currentChanged.connect(self.ensure_page)
+
+        # ウィンドウの表示後に最初のタブを作成し、測定器の受信を開始
+        QTimer.singleShot(0, lambda: self.ensure_page(self.tabs.currentIndex()))
+        QTimer.singleShot(0, self.start_device_ingest)
+        QTimer.singleShot(0, self.start_archive_job)
+        QTimer.singleShot(0, self.start_column_store)
+        QTimer.singleShot(0, self.start_daily_summary)
+        QTimer.singleShot(0, self.start_change_feed)
+
+        # バックグラウンド処理（書庫への移動・集計など）のエラーをステータスバーに表示
+        self.error_timer = QTimer(self)
+        self.error_timer.timeout.connect(self.show_background_errors)
+        self.error_timer.start(ERROR_CHECK_INTERVAL_MS)
+
+        # 診断タブは通常は非表示（Ctrl+Shift+D または EFORM_DIAGNOSTICS=1 で表示）
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, activated=self.show_diagnostics_tab)
+        if os.environ.get("EFORM_DIAGNOSTICS", "") not in ("", "0"):
+            QTimer.singleShot(0, self.show_diagnostics_tab)
+
+    def ensure_page(self, index):
+        """タブの画面が未作成なら作成して差し替える"""
+        if index < 0 or index >= len(TAB_DEFINITIONS):
+            return
+        attr, title, factory = TAB_DEFINITIONS[index]
+        if getattr(self, attr) is not None:
+            return
+
+        page = factory()
+        setattr(self, attr, page)
+
+        # 空のタブを作成した画面に差し替える（選択中のタブは変えない）
+        self.tabs.blockSignals(True)
+        placeholder = self.tabs.widget(index)
+        self.tabs.removeTab(index)
+        self.tabs.insertTab(index, page, title)
+        self.tabs.setCurrentIndex(index)
+        self.tabs.blockSignals(False)
+        placeholder.deleteLater()
+
+        self.connect_pages(attr)
+
+    def connect_pages(self, attr):
+        """作成した画面と作成済みの画面の間のシグナルを接続"""
         # 設定画面で保存されたときに入力画面を更新
-        self.config_page.config_saved.connect(self.input_page.reload_config)
+        if attr in ("config_page", "input_page") and self.config_page and self.input_page:
+            self.config_page.config_saved.connect(self.input_page.reload_config)
         # 入力画面でデータ登録が完了したらデータ閲覧タブを更新
-        self.input_page.data_saved.connect(self.data_view_page.load_registered_data)
+        if attr in ("input_page", "data_view_page") and self.input_page and self.data_view_page:
+            self.input_page.data_saved.connect(self.data_view_page.load_registered_data)
+        # 入力画面でデータ登録が完了したら管理図に打点を追加
+        if attr in ("input_page", "control_chart_page") and self.input_page and self.control_chart_page:
+            self.input_page.data_saved.connect(self.control_chart_page.append_new_points)
+        # フォーム設定が保存されたら管理図の項目を更新
+        if attr in ("config_page", "control_chart_page") and self.config_page and self.control_chart_page:
+            self.config_page.config_saved.connect(self.control_chart_page.reload_fields)
+        # フォーム設定が保存されたら日次集計の項目を更新
+        if attr in ("config_page", "daily_summary_page") and self.config_page and self.daily_summary_page:
+            self.config_page.config_saved.connect(self.daily_summary_page.reload_fields)
+        # 測定器から受信した値を入力画面に自動入力
+        if attr == "input_page" and self.device_bridge:
+            self.device_bridge.reading_received.connect(self.input_page.fill_device_reading)
+
+    def show_background_errors(self):
+        """バックグラウンド処理のエラーがあればステータスバーに表示（詳細は診断タブ）"""
+        import metrics
+
+        errors = metrics.errors()
+        if errors:
+            self.statusBar().showMessage(
+                f"⚠️ {'・'.join(sorted(errors))}でエラーが発生しています（Ctrl+Shift+D の診断タブで詳細を確認できます）"
+            )
+        else:
+            self.statusBar().clearMessage()
+
+    def show_diagnostics_tab(self):
+        """診断タブを表示"""
+        if self.diagnostics_page is None:
+            from diagnostics_page import DiagnosticsPage
+            self.diagnostics_page = DiagnosticsPage()
+            self.tabs.addTab(self.diagnostics_page, "🩺 診断")
+        self.tabs.setCurrentWidget(self.diagnostics_page)
+
+    def start_device_ingest(self):
+        """測定器が設定されていれば受信を開始"""
+        from device_ingest_qt import DeviceIngestBridge
+
+        self.device_bridge = DeviceIngestBridge.from_config(self)
+        if self.device_bridge:
+            if self.input_page:
+                self.device_bridge.reading_received.connect(self.input_page.fill_device_reading)
+            self.device_bridge.start()
+
+    def start_archive_job(self):
+        """書庫が設定されていれば古いデータの定期移動を開始"""
+        from record_store import get_store
+        from record_archive import ArchiveJob
+
+        self.archive_job = ArchiveJob.from_config(get_store())
+        if self.archive_job:
+            self.archive_job.start()
+        self.start_compaction_job()
+
+    def start_compaction_job(self):
+        """編集・削除の記録の定期整理を開始（入力データファイルを直接扱う場合のみ）"""
+        from record_store import get_store
+        from record_log import CompactionJob
+
+        self.compaction_job = CompactionJob.from_config(get_store())
+        if self.compaction_job:
+            self.compaction_job.start()
+
+    def start_column_store(self):
+        """数値項目の列ストアへの取り込みを開始（入力データファイルを直接扱う場合のみ）"""
+        from column_store import get_column_store
+
+        get_column_store()
+
+    def start_daily_summary(self):
+        """日次集計への取り込みを開始（入力データファイルを直接扱う場合のみ）"""
+        from daily_summary import get_daily_summary
+
+        get_daily_summary()
+
+    def start_change_feed(self):
+        """設定されていれば変更フィードへの記録を開始（入力データファイルを直接扱う場合のみ）"""
+        from change_feed import get_change_feed
+
+        get_change_feed()
+
+    def closeEvent(self, event):
+        """終了時に測定器の受信・書庫への移動・記録の整理を停止"""
+        if self.device_bridge:
+            self.device_bridge.stop()
+        if self.archive_job:
+            self.archive_job.stop()
+        if self.compaction_job:
+            self.compaction_job.stop()
+        super().closeEvent(event)
 
 
 def main():
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+処理時間計測モジュール
+登録・フォーム再生成・保存・データ閲覧などの所要時間をヒストグラムに集計する
+
+環境変数 EFORM_METRICS=1 で有効になる（enable() でも切り替え可能）。
+無効時はフラグを1回確認するだけで元の処理を呼び出す。
+集計結果は Prometheus のテキスト形式でファイルに出力できる。
+
+書庫への移動・集計などのバックグラウンド処理のエラーは、計測の有効・無効によらず
+report_error() で記録し、標準エラー出力と診断タブに表示する。
+"""
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 診断情報の出力先（プロファイル結果もここに出力する）
+DIAGNOSTICS_DIR = "diagnostics"
+METRICS_FILE = os.path.join(DIAGNOSTICS_DIR, "metrics.prom")
+
+# ヒストグラムの区切り（秒）
+DEFAULT_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+_enabled = os.environ.get("EFORM_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_errors = {}
+
+
+def is_enabled():
+    """計測が有効か"""
+    return _enabled
+
+
+def enable():
+    """計測を有効にする"""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """計測を無効にする（集計済みの値は残る）"""
+    global _enabled
+    _enabled = False
+
+
+class Histogram:
+    """処理時間のヒストグラム（件数・合計・区切りごとの件数）"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # 最後は上限なし
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """1回分の値を記録"""
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """区切りごとの件数から分位点を推定"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if cumulative + bucket_count >= target and bucket_count:
+                return lower + (upper - lower) * (target - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = upper
+        return self.max
+
+
+def observe(operation, seconds):
+    """処理時間を記録"""
+    with _lock:
+        histogram = _histograms.get(operation)
+        if histogram is None:
+            histogram = _histograms[operation] = Histogram()
+        histogram.observe(seconds)
+
+
+def count(name, value=1):
+    """件数を加算（無効時は何もしない）"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+@contextmanager
+def track(operation):
+    """with ブロックの処理時間を記録"""
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        count(f"{operation}_errors")
+        raise
+    finally:
+        observe(operation, time.perf_counter() - started)
+
+
+def timed(operation):
+    """関数の処理時間を記録するデコレータ"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                count(f"{operation}_errors")
+                raise
+            finally:
+                observe(operation, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def report_error(source, error):
+    """バックグラウンド処理のエラーを記録する（同じエラーが続く間は標準エラー出力に1回だけ表示する）"""
+    message = str(error) or type(error).__name__
+    with _lock:
+        previous = _errors.get(source)
+        _errors[source] = (time.time(), message)
+    if previous is None or previous[1] != message:
+        print(f"{source}: {message}", file=sys.stderr)
+
+
+def clear_error(source):
+    """バックグラウンド処理が成功したらエラーの記録を消す"""
+    with _lock:
+        _errors.pop(source, None)
+
+
+def errors():
+    """記録されているエラー {処理名: (発生時刻 (time.time()), メッセージ)}"""
+    with _lock:
+        return dict(_errors)
+
+
+def snapshot():
+    """現在の集計値のコピーを返す ({処理名: Histogram}, {名前: 件数})"""
+    with _lock:
+        histograms = {}
+        for name, histogram in _histograms.items():
+            copied = Histogram(histogram.buckets)
+            copied.bucket_counts = list(histogram.bucket_counts)
+            copied.count = histogram.count
+            copied.sum = histogram.sum
+            copied.max = histogram.max
+            histograms[name] = copied
+        return histograms, dict(_counters)
+
+
+def reset():
+    """集計値をすべて消去"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def export_prometheus_text():
+    """集計値を Prometheus のテキスト形式で返す"""
+    histograms, counters = snapshot()
+    lines = [
+        "# HELP eform_operation_duration_seconds 処理ごとの所要時間",
+        "# TYPE eform_operation_duration_seconds histogram",
+    ]
+    for operation in sorted(histograms):
+        histogram = histograms[operation]
+        cumulative = 0
+        for bucket, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+            cumulative += bucket_count
+            lines.append(
+                f'eform_operation_duration_seconds_bucket{{operation="{operation}",le="{bucket}"}} {cumulative}'
+            )
+        lines.append(
+            f'eform_operation_duration_seconds_bucket{{operation="{operation}",le="+Inf"}} {histogram.count}'
+        )
+        lines.append(f'eform_operation_duration_seconds_sum{{operation="{operation}"}} {_format_number(histogram.sum)}')
+        lines.append(f'eform_operation_duration_seconds_count{{operation="{operation}"}} {histogram.count}')
+
+    lines.append("# HELP eform_events_total 件数")
+    lines.append("# TYPE eform_events_total counter")
+    for name in sorted(counters):
+        lines.append(f'eform_events_total{{event="{name}"}} {_format_number(counters[name])}')
+    return "\n".join(lines) + "\n"
+
+
+def dump_to_file(path=METRICS_FILE):
+    """集計値をファイルに出力（書き込み途中のファイルを読まれないよう置き換える）"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(export_prometheus_text())
+    os.replace(tmp_path, path)
+    return path
+
+
+def _dump_at_exit():
+    if _enabled and _histograms:
+        dump_to_file()
+
+
+atexit.register(_dump_at_exit)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+操作プロファイルモジュール
+「登録が遅い」などの報告に対し、次のN回の操作を cProfile と tracemalloc で記録する
+
+環境変数 EFORM_PROFILE_ACTIONS=N で起動するか、診断タブから回数を指定して開始する。
+結果は diagnostics/profiles/ に操作名つきで出力する。
+- <日時>_<操作名>.prof     cProfile の結果（snakeviz 等で閲覧可能）
+- <日時>_<操作名>.txt      処理時間の上位関数とメモリ確保の上位行
+- <日時>_<操作名>.tracemalloc  メモリのスナップショット（tracemalloc.Snapshot.load で読込）
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from datetime import datetime
+
+from metrics import DIAGNOSTICS_DIR
+
+PROFILE_DIR = os.path.join(DIAGNOSTICS_DIR, "profiles")
+
+# 結果の要約に出力する件数
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 30
+
+_lock = threading.Lock()
+_remaining = 0
+_active = threading.local()
+
+
+def _initial_count():
+    try:
+        return max(0, int(os.environ.get("EFORM_PROFILE_ACTIONS", "0")))
+    except ValueError:
+        return 0
+
+
+_remaining = _initial_count()
+
+
+def arm(count):
+    """次の count 回の操作をプロファイル対象にする"""
+    global _remaining
+    with _lock:
+        _remaining = max(0, count)
+
+
+def remaining():
+    """残りのプロファイル回数"""
+    return _remaining
+
+
+def _take():
+    """プロファイル回数を1回分消費する（残っていなければ False）"""
+    global _remaining
+    with _lock:
+        if _remaining <= 0:
+            return False
+        _remaining -= 1
+        return True
+
+
+def profile_action(action):
+    """操作をプロファイルするデコレータ（対象外のときはそのまま呼び出す）"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # 他の操作の中から呼ばれた場合は外側の操作の結果に含める
+            if not _remaining or getattr(_active, "running", False) or not _take():
+                return func(*args, **kwargs)
+            return _run_profiled(action, func, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def _run_profiled(action, func, args, kwargs):
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(25)
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+
+    profiler = cProfile.Profile()
+    _active.running = True
+    started_at = datetime.now()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        _active.running = False
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            write_profile(action, started_at, profiler, before, after, peak)
+        except OSError:
+            pass  # 出力に失敗しても操作自体は続ける
+
+
+def write_profile(action, started_at, profiler, before, after, peak):
+    """プロファイル結果を出力し、出力先のパス（拡張子なし）を返す"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{started_at:%Y%m%d_%H%M%S_%f}_{action}")
+
+    profiler.dump_stats(base + ".prof")
+    after.dump(base + ".tracemalloc")
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(f"操作: {action}\n")
+        f.write(f"開始: {started_at.isoformat()}\n")
+        f.write(f"処理時間: {stats.total_tt:.3f} 秒\n")
+        f.write(f"最大メモリ使用量: {peak / 1024 / 1024:.1f} MiB\n\n")
+        f.write("【処理時間の上位関数】\n")
+        f.write(stream.getvalue())
+        f.write("\n【メモリ確保の増加（上位）】\n")
+        for stat in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+            f.write(f"{stat}\n")
+    return base
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+検索結果のキャッシュモジュール
+同じ条件の検索（当日の品種別のデータ、直近のロットなど）を、登録データを読み直さずに返す
+
+API・レポート・管理図は同じ条件の検索を何度も行う。検索結果を正規化した条件ごとに
+最近使った順に保持し、件数の合計が上限を超えたら古いものから捨てる。
+
+登録・編集・削除があった場合は、そのデータが一致する条件（品種・日付の範囲など）の
+結果だけを捨て、他の条件の結果は残す。
+    - 同じプロセスでの登録: 保存先の追記通知
+    - 他の端末・プロセスでの登録: 検索のたびに入力データファイルの追記分を読んで判定
+    - 上書き登録: 保存先の追記通知（置き換えた元のデータを含む結果も捨てる）
+    - 追記以外の書き換え（書庫への移動・整理）: すべて捨てる
+
+条件のない検索（全履歴）と、件数が上限を超える検索の結果は保持せず、読みながら返す。
+"""
+import threading
+from collections import OrderedDict
+
+import metrics
+from record_store import RecordStore
+from record_query import matches, normalize_query
+from record_archive import get_archive, iter_all_records
+from record_snapshot import source_state, is_source_current
+from sharded_store import ShardedRecordStore
+
+# 保持する検索条件の数
+DEFAULT_MAX_ENTRIES = 64
+
+# 保持する検索結果の件数の合計（これより多い結果はキャッシュしない）
+DEFAULT_MAX_RECORDS = 200000
+
+
+def cache_key(query):
+    """検索条件のキー（条件の順序・空の条件によらず同じになる）"""
+    return tuple(sorted(normalize_query(**(query or {})).items()))
+
+
+class QueryCache:
+    """保存先1つ分の検索結果のキャッシュ"""
+
+    def __init__(self, store, archive=None, max_entries=DEFAULT_MAX_ENTRIES, max_records=DEFAULT_MAX_RECORDS):
+        self.store = store
+        self.archive = archive or get_archive()
+        self.max_entries = max_entries
+        self.max_records = max_records
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # キー -> 検索結果のリスト
+        self._size = 0
+        self._generation = 0
+        self._states = {}  # 入力データファイル -> 読み込んだ時点の状態
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        store.add_listener(self.invalidate)
+
+    def query(self, query=None):
+        """条件に一致する登録データのリスト（編集・削除を反映した最新の版）"""
+        return list(self.iter_records(query))
+
+    def iter_records(self, query=None):
+        """条件に一致する登録データを1件ずつ返す（キャッシュにない場合は読みながら返す）
+
+        条件のない検索は全履歴になるため保持しない。読み込んだ結果が max_records 件を
+        超えた場合も保持をやめ、全件をメモリに載せずに返し続ける。
+        """
+        key = cache_key(query)
+        self._check_sources()
+        with self._lock:
+            records = self._entries.get(key)
+            if records is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                generation = self._generation
+        if records is not None:
+            metrics.count("query_cache.hit")
+            # 保持している結果は置き換えるだけで書き換えないため、そのまま返せる
+            yield from records
+            return
+        metrics.count("query_cache.miss")
+
+        query = dict(key)
+        collected = [] if query else None
+        for record in iter_all_records(self.store, self.archive, query):
+            if not matches(record, query):
+                continue
+            if collected is not None:
+                collected.append(record)
+                if len(collected) > self.max_records:
+                    collected = None
+            yield record
+        if collected is None:
+            return
+        with self._lock:
+            # 読み込み中に登録があった場合、その結果が反映されているか分からないため保持しない
+            if generation == self._generation:
+                self._put(key, collected)
+
+    def _put(self, key, records):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = records
+        self._size += len(records)
+        while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_records):
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def invalidate(self, records):
+        """登録・編集・削除されたデータが一致する条件の結果を捨てる"""
+        from record_log import is_log_entry, record_id
+
+        changed = [(record, record_id(record) if is_log_entry(record) else None) for record in records]
+        if not changed:
+            return
+        with self._lock:
+            self._generation += 1
+            for key in list(self._entries):
+                query = dict(key)
+                entries = self._entries[key]
+                for record, rid in changed:
+                    # 編集の記録は変更前の品種・日付を持たないため、結果に含まれていればそれも捨てる
+                    if matches(record, query) or (rid is not None and any(record_id(r) == rid for r in entries)):
+                        del self._entries[key]
+                        self._size -= len(entries)
+                        break
+
+    def clear(self):
+        """すべての結果を捨てる"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def _sources(self):
+        """追記分を確認する入力データファイル（受付サーバー経由の場合は追記通知だけを使う）"""
+        if isinstance(self.store, ShardedRecordStore):
+            return self.store.shards()
+        if isinstance(self.store, RecordStore):
+            return [self.store]
+        return []
+
+    def _check_sources(self):
+        """前回の検索から他のプロセスが書き込んだ分を反映する"""
+        with self._check_lock:
+            for source in self._sources():
+                self._check_source(source)
+
+    def _check_source(self, source):
+        state = self._states.get(source.path)
+        try:
+            if state is not None and is_source_current(state, source, self.archive):
+                appended, position = source.load_records_after(state["position"])
+                if appended:
+                    self.invalidate(appended)
+            else:
+                if state is not None:
+                    self.clear()
+                position = source.end_position()
+            self._states[source.path] = source_state(source, self.archive, position)
+        except OSError:
+            if self._states.pop(source.path, None) is not None:
+                self.clear()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_query_cache(store, archive=None):
+    """保存先ごとに共有する検索結果のキャッシュを取得"""
+    with _caches_lock:
+        cache = _caches.get(id(store))
+        if cache is None or cache.store is not store:
+            cache = _caches[id(store)] = QueryCache(store, archive)
+    return cache
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録データ書庫モジュール
+古い登録データを圧縮した書庫ファイル（セグメント）に移し、入力データファイルを小さく保つ
+
+セグメントは一定件数ごとのブロックに分けて圧縮し、ブロックごとの日付範囲・品種を
+索引ファイル (<セグメント>.idx.json) に記録する。検索時は条件に合うブロックだけを展開する。
+gzip の各ブロックは独立した gzip データのため、セグメント全体を zcat などでそのまま読める。
+ブロック内の保存形式は既定ではJSON（1行1件）で、msgpack・packed も選べる（record_codec.py）。
+
+編集・削除の記録（record_log.py）を整理したセグメントは世代番号を付けて書き直す
+(segment-000001.g2.jsonl.gz)。索引まで書き終えた最も新しい世代が使われる。
+
+設定ファイル (archive_config.json) があると、アプリ・登録受付サーバーの起動中に
+定期的に古いデータを書庫へ移す:
+    {"max_age_days": 365, "codec": "gzip", "record_codec": "json", "block_size": 1000, "interval_hours": 24}
+
+使い方:
+    python record_archive.py --max-age-days 365
+    python record_archive.py --codec zstd --data input_data.json
+"""
+import argparse
+import gzip
+import os
+import re
+import sys
+import threading
+from datetime import date, timedelta
+from itertools import chain
+
+import metrics
+from record_store import DATA_FILE, RecordStore, load_form_config
+from record_query import matches
+from record_codec import CODEC_NAMES, get_codec, json_codec, load_json_file, encode_frames, iter_frames
+from sharded_store import ShardedRecordStore, open_store
+
+ARCHIVE_DIR = "archive"
+ARCHIVE_CONFIG_FILE = "archive_config.json"
+
+# 既定の移動対象（日付がこの日数より前のデータ）
+DEFAULT_MAX_AGE_DAYS = 365
+# 1ブロックの件数
+DEFAULT_BLOCK_SIZE = 1000
+# 定期実行の間隔（時間）
+DEFAULT_INTERVAL_HOURS = 24
+
+# 圧縮形式 (形式名: 拡張子)
+CODECS = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_CODEC = "gzip"
+
+# ブロック内の保存形式 (形式名: 拡張子)。orjson は json と同じ形で書く
+RECORD_CODEC_EXTENSIONS = {"json": ".jsonl", "msgpack": ".msgpack", "packed": ".packed"}
+DEFAULT_RECORD_CODEC = "json"
+
+_SEGMENT_NAME = re.compile(r"^segment-(\d+)(?:\.g(\d+))?\.(jsonl|msgpack|packed)\.(gz|zst)$")
+
+# 定期的な移動のエラーを診断タブに表示するときの処理名
+ERROR_SOURCE = "書庫への移動"
+
+# 書庫への移動と編集記録の整理を同時に行わないためのロック
+maintenance_lock = threading.Lock()
+
+
+def load_archive_config(path=ARCHIVE_CONFIG_FILE):
+    """書庫の設定を読み込む（未設定の場合は None）"""
+    return load_json_file(path) or None
+
+
+def _compress(codec, data):
+    if codec == "gzip":
+        return gzip.compress(data)
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=10).compress(data)
+    raise ValueError(f"未対応の圧縮形式です: {codec}")
+
+
+def _decompress(codec, data):
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        return _zstd().ZstdDecompressor().decompress(data)
+    raise ValueError(f"未対応の圧縮形式です: {codec}")
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd形式の書庫には zstandard が必要です。pip install zstandard を実行してください。")
+    return zstandard
+
+
+def _block_may_match(block, query):
+    """ブロックの索引から、検索条件に一致するデータを含む可能性があるか判定"""
+    if not query:
+        return True
+    if "date_from" in query and block["date_max"] < query["date_from"]:
+        return False
+    if "date_to" in query and block["date_min"] > query["date_to"]:
+        return False
+    if "product_name" in query and query["product_name"] not in block["products"]:
+        return False
+    return True
+
+
+class ArchiveSegment:
+    """書庫ファイル1つ（索引から必要なブロックだけを読む）"""
+
+    def __init__(self, path):
+        self.path = path
+        index = load_json_file(path + ".idx.json")
+        self.codec = index["codec"]
+        self.record_codec = index.get("record_codec", "json")
+        self.schema = index.get("schema")
+        self.record_count = index["record_count"]
+        self.blocks = index["blocks"]
+        match = _SEGMENT_NAME.match(os.path.basename(path))
+        self.number = int(match.group(1))
+        self.generation = int(match.group(2) or 1)
+
+    def has_log_entries(self):
+        """編集・削除の記録を含むか（記録の件数がない古い索引は、編集機能より前のため含まない）"""
+        return any(block.get("ops") for block in self.blocks)
+
+    def _decode_block(self, data):
+        if self.record_codec == "json":
+            loads = json_codec().loads
+            return [loads(line) for line in data.splitlines() if line]
+        return iter_frames(get_codec(self.record_codec, self.schema), data)
+
+    def iter_records(self, query=None, log_entries_only=False):
+        """検索条件に合うブロックだけを展開して1件ずつ返す（条件による絞り込みは呼び出し側で行う）
+
+        log_entries_only の場合は編集・削除の記録を含むブロックだけを読む。
+        """
+        with open(self.path, "rb") as f:
+            for block in self.blocks:
+                if not _block_may_match(block, query):
+                    continue
+                if log_entries_only and not block.get("ops"):
+                    continue
+                f.seek(block["offset"])
+                data = _decompress(self.codec, f.read(block["length"]))
+                yield from self._decode_block(data)
+
+
+class RecordArchive:
+    """書庫（セグメントを入れるフォルダ）"""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+
+    def segment_paths(self):
+        """索引まで書き終えたセグメントを古い順に返す（書き直したセグメントは最新の世代）"""
+        if not os.path.isdir(self.directory):
+            return []
+        latest = {}
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_NAME.match(name)
+            path = os.path.join(self.directory, name)
+            if match and os.path.exists(path + ".idx.json"):
+                number, generation = int(match.group(1)), int(match.group(2) or 1)
+                if number not in latest or latest[number][0] < generation:
+                    latest[number] = (generation, path)
+        return [latest[number][1] for number in sorted(latest)]
+
+    def segments(self):
+        return [ArchiveSegment(path) for path in self.segment_paths()]
+
+    def count(self):
+        """書庫内の件数"""
+        return sum(segment.record_count for segment in self.segments())
+
+    def iter_records(self, query=None):
+        """書庫内の登録データを古い順に返す（query があれば一致するものだけ）"""
+        for segment in self.segments():
+            for record in segment.iter_records(query):
+                if not query or matches(record, query):
+                    yield record
+
+    def write_segment(self, records, codec=DEFAULT_CODEC, block_size=DEFAULT_BLOCK_SIZE,
+                      record_codec=DEFAULT_RECORD_CODEC):
+        """登録データを新しいセグメントに書き込み、そのパスを返す
+
+        データ・索引の順に書き、索引の置き換えが完了した時点で書庫に加わる。
+        """
+        if codec not in CODECS:
+            raise ValueError(f"未対応の圧縮形式です: {codec}")
+        if record_codec == "orjson":
+            record_codec = "json"
+        if record_codec not in RECORD_CODEC_EXTENSIONS:
+            raise ValueError(f"未対応の保存形式です: {record_codec}")
+        schema = None
+        if record_codec == "packed":
+            schema = [[f.get("label_name", ""), f.get("data_type", "文字列")] for f in load_form_config()]
+
+        os.makedirs(self.directory, exist_ok=True)
+        existing = [int(_SEGMENT_NAME.match(os.path.basename(p)).group(1)) for p in self.segment_paths()]
+        number = max(existing, default=0) + 1
+        return self._write(number, 1, records, codec, block_size, record_codec, schema)
+
+    def rewrite_segment(self, segment, records):
+        """セグメントの内容を records に置き換えた次の世代を書き込み、そのパスを返す
+
+        新しい世代の索引を書き終えた時点で置き換わる。古い世代のファイルは削除する
+        （読み込み中で削除できない場合は残し、使われない）。
+        """
+        block_size = max((block["count"] for block in segment.blocks), default=DEFAULT_BLOCK_SIZE)
+        path = self._write(segment.number, segment.generation + 1, records, segment.codec,
+                           block_size, segment.record_codec, segment.schema)
+        for old_path in (segment.path + ".idx.json", segment.path):
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+        return path
+
+    def _write(self, number, generation, records, codec, block_size, record_codec, schema):
+        """セグメントのデータ・索引を書き込む"""
+        encoder = json_codec() if record_codec == "json" else get_codec(record_codec, schema)
+        suffix = f".g{generation}" if generation > 1 else ""
+        path = os.path.join(
+            self.directory, f"segment-{number:06d}{suffix}{RECORD_CODEC_EXTENSIONS[record_codec]}{CODECS[codec]}"
+        )
+
+        blocks = []
+        with open(path, "wb") as f:
+            for start in range(0, len(records), block_size):
+                chunk = records[start:start + block_size]
+                if record_codec == "json":
+                    raw = b"".join(encoder.dumps(r) + b"\n" for r in chunk)
+                else:
+                    raw = encode_frames(encoder, chunk)
+                data = _compress(codec, raw)
+                dates = [r.get("entry_date", "") for r in chunk]
+                blocks.append({
+                    "offset": f.tell(),
+                    "length": len(data),
+                    "count": len(chunk),
+                    "date_min": min(dates),
+                    "date_max": max(dates),
+                    "products": sorted({r.get("product_name", "") for r in chunk}),
+                    "ops": sum(1 for r in chunk if r.get("op")),
+                })
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        index = {"codec": codec, "record_codec": record_codec, "record_count": len(records), "blocks": blocks}
+        if schema is not None:
+            index["schema"] = schema
+        tmp_path = path + ".idx.json.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json_codec().dumps(index))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path + ".idx.json")
+        return path
+
+
+def archive_old_records(store, archive, max_age_days=DEFAULT_MAX_AGE_DAYS,
+                        codec=DEFAULT_CODEC, block_size=DEFAULT_BLOCK_SIZE, today=None,
+                        record_codec=DEFAULT_RECORD_CODEC):
+    """日付が max_age_days 日より前の登録データを書庫へ移し、移した件数を返す
+
+    セグメントを書き終えてから入力データファイルを書き直す。
+    途中で中断した場合は同じデータが両方に残ることがある（データは失われない）。
+    """
+    cutoff = ((today or date.today()) - timedelta(days=max_age_days)).isoformat()
+    with maintenance_lock:
+        return store.extract_records(
+            lambda record: record.get("entry_date", "") < cutoff,
+            lambda records: archive.write_segment(records, codec, block_size, record_codec),
+        )
+
+
+_default_archive = None
+
+
+def get_archive():
+    """アプリ全体で共有する書庫を取得"""
+    global _default_archive
+    if _default_archive is None:
+        _default_archive = RecordArchive()
+    return _default_archive
+
+
+def iter_all_records(store, archive=None, query=None):
+    """書庫と入力データファイルの登録データを古い順に返す（query があれば書庫は一致するものだけ）
+
+    編集・削除の記録（record_log.py）を反映した最新の版だけを返す。
+    品種別の保存先（sharded_store.py）では、品種を指定すればそのシャードだけを読む。
+    """
+    from record_log import get_record_index, resolve_records
+
+    archive = archive or get_archive()
+    if isinstance(store, ShardedRecordStore):
+        yield from store.iter_resolved(archive, query)
+        return
+    if not isinstance(store, RecordStore):
+        yield from resolve_records(list(chain(archive.iter_records(query), store.iter_records())))
+        return
+    index = get_record_index(store, archive)
+    yield from index.resolve(chain(archive.iter_records(query), store.iter_records()))
+
+
+def load_all_records(store, archive=None):
+    """書庫と入力データファイルの全登録データを読み込む（編集・削除を反映した最新の版）"""
+    from record_log import resolve_records
+
+    archive = archive or get_archive()
+    if not archive.segment_paths():
+        return resolve_records(store.load_records())
+    return list(iter_all_records(store, archive))
+
+
+class ArchiveJob:
+    """古いデータを定期的に書庫へ移すバックグラウンド処理"""
+
+    def __init__(self, store, archive=None, config=None):
+        config = config or {}
+        self.store = store
+        self.archive = archive or get_archive()
+        self.max_age_days = config.get("max_age_days", DEFAULT_MAX_AGE_DAYS)
+        self.codec = config.get("codec", DEFAULT_CODEC)
+        self.block_size = config.get("block_size", DEFAULT_BLOCK_SIZE)
+        self.record_codec = config.get("record_codec", DEFAULT_RECORD_CODEC)
+        self.interval = config.get("interval_hours", DEFAULT_INTERVAL_HOURS) * 3600
+        self.last_error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, store):
+        """設定ファイルがあり、入力データファイルを直接扱う保存先なら作成する（それ以外は None）"""
+        config = load_archive_config()
+        if not config or not isinstance(store, (RecordStore, ShardedRecordStore)):
+            return None
+        return cls(store, config=config)
+
+    def run_once(self):
+        """1回分の移動を行い、移した件数を返す"""
+        return archive_old_records(self.store, self.archive, self.max_age_days, self.codec, self.block_size,
+                                   record_codec=self.record_codec)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="archive-job", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+                self.last_error = None
+                metrics.clear_error(ERROR_SOURCE)
+            except Exception as e:
+                self.last_error = e
+                metrics.report_error(ERROR_SOURCE, e)
+            self._stop_event.wait(self.interval)
+
+
+def main(argv=None):
+    """古い登録データを書庫へ移す"""
+    config = load_archive_config() or {}
+    parser = argparse.ArgumentParser(description="古い登録データを圧縮した書庫へ移します。")
+    parser.add_argument("--data", default=DATA_FILE, help="入力データファイル（品種別に分けてある場合はシャードごとに移す）")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="書庫のフォルダ")
+    parser.add_argument("--max-age-days", type=int, default=config.get("max_age_days", DEFAULT_MAX_AGE_DAYS),
+                        help="日付がこの日数より前のデータを移す")
+    parser.add_argument("--codec", choices=sorted(CODECS), default=config.get("codec", DEFAULT_CODEC),
+                        help="圧縮形式（zstd は zstandard が必要）")
+    parser.add_argument("--record-codec", choices=CODEC_NAMES,
+                        default=config.get("record_codec", DEFAULT_RECORD_CODEC),
+                        help="ブロック内の保存形式（msgpack は msgpack が必要）")
+    parser.add_argument("--block-size", type=int, default=config.get("block_size", DEFAULT_BLOCK_SIZE),
+                        help="1ブロックの件数")
+    args = parser.parse_args(argv)
+
+    try:
+        moved = archive_old_records(
+            open_store(args.data), RecordArchive(args.archive_dir),
+            args.max_age_days, args.codec, args.block_size, record_codec=args.record_codec,
+        )
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"{moved}件を書庫へ移しました。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
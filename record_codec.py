@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+シリアライズ（保存形式）モジュール
+設定ファイル・入力データ・書庫・スナップショットの読み書きはすべてここを通す
+
+形式は次の中から選べる:
+- json    : 標準ライブラリ
+- orjson  : orjson がインストールされていれば使う高速なJSON（出力は json と同じ形）
+- msgpack : msgpack がインストールされていれば使うバイナリ形式
+- packed  : フォーム設定（項目とデータ型）に合わせて詰めたバイナリ形式
+
+設定ファイルや入力データファイルは人が読めるよう常にJSON（インデント2）で保存し、
+orjson があれば読み書きを高速化する。バイナリ形式は書庫など内部のファイルで使う。
+"""
+import json
+import os
+import struct
+
+# バイナリ形式で複数件を並べるときの長さ（uint32）
+_FRAME_LENGTH = struct.Struct("<I")
+_FLOAT = struct.Struct("<d")
+
+# packed 形式で基本情報として先頭に保存する項目
+PACKED_HEADER_FIELDS = ["entry_date", "product_name", "lot_no", "registered_at"]
+
+
+class JsonCodec:
+    """標準ライブラリのJSON"""
+
+    name = "json"
+    binary = False
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def dumps_pretty(self, obj):
+        """人が読める形（インデント2）"""
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+    def loads(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson による高速なJSON"""
+
+    name = "orjson"
+
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError:
+            raise RuntimeError("orjson形式には orjson が必要です。pip install orjson を実行してください。")
+        self._orjson = orjson
+
+    def dumps(self, obj):
+        return self._orjson.dumps(obj)
+
+    def dumps_pretty(self, obj):
+        return self._orjson.dumps(obj, option=self._orjson.OPT_INDENT_2)
+
+    def loads(self, data):
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return self._orjson.loads(data)
+
+
+class MsgpackCodec:
+    """msgpack によるバイナリ形式"""
+
+    name = "msgpack"
+    binary = True
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise RuntimeError("msgpack形式には msgpack が必要です。pip install msgpack を実行してください。")
+        self._msgpack = msgpack
+
+    def dumps(self, obj):
+        return self._msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        return self._msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _pack_text(out, text):
+    data = text.encode("utf-8")
+    _pack_varint(out, len(data))
+    out += data
+
+
+def _pack_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _unpack_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class PackedCodec:
+    """フォーム設定に合わせて詰めたバイナリ形式
+
+    基本情報の4項目と、フォーム設定の各項目を順に保存する（項目名は保存しない）。
+    数値は8バイトの浮動小数点、文字列類は長さ付きのUTF-8で保存し、
+    どの項目に値があるかはビット列で表す。フォーム設定にない項目や表形式などはJSONで末尾に付ける。
+    読み込みには書き込んだときの schema（[[項目名, データ型], ...]）が必要。
+    """
+
+    name = "packed"
+    binary = True
+
+    def __init__(self, schema):
+        self.schema = [list(item) for item in schema]
+        self._labels = [label for label, _ in self.schema]
+        self._numeric = [data_type == "数値" for _, data_type in self.schema]
+        self._bitmap_size = (len(self.schema) + 7) // 8
+
+    @classmethod
+    def from_form_config(cls, config):
+        return cls([[f.get("label_name", ""), f.get("data_type", "文字列")] for f in config])
+
+    def dumps(self, record):
+        out = bytearray()
+        for key in PACKED_HEADER_FIELDS:
+            value = record.get(key)
+            _pack_text(out, value if isinstance(value, str) else "")
+
+        details = record.get("details") or {}
+        packed, extra_details = self._pack_details(details)
+        out += packed
+
+        # 詰められなかった値（設定にない項目、型の違う値、基本情報以外の項目）
+        extra = {}
+        if extra_details:
+            extra["details"] = extra_details
+        if "details" not in record:
+            extra["no_details"] = True
+        extra_fields = {
+            k: v for k, v in record.items()
+            if k != "details" and not (k in PACKED_HEADER_FIELDS and isinstance(v, str))
+        }
+        missing = [k for k in PACKED_HEADER_FIELDS if k not in record]
+        if extra_fields:
+            extra["fields"] = extra_fields
+        if missing:
+            extra["missing"] = missing
+        if extra:
+            out += json.dumps(extra, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return bytes(out)
+
+    def _pack_details(self, details):
+        """詳細データを詰める（詰められなかった値の辞書も返す）"""
+        bitmap = bytearray(self._bitmap_size)
+        body = bytearray()
+        packed_labels = set()
+        for i, label in enumerate(self._labels):
+            value = details.get(label)
+            if self._numeric[i]:
+                if type(value) is not float:
+                    continue
+                body += _FLOAT.pack(value)
+            elif isinstance(value, str):
+                _pack_text(body, value)
+            else:
+                continue
+            bitmap[i >> 3] |= 1 << (i & 7)
+            packed_labels.add(label)
+        extra_details = {k: v for k, v in details.items() if k not in packed_labels}
+        return bytes(bitmap + body), extra_details
+
+    def _unpack_details(self, data, pos):
+        bitmap = data[pos:pos + self._bitmap_size]
+        pos += self._bitmap_size
+        details = {}
+        for i, label in enumerate(self._labels):
+            if not bitmap[i >> 3] & (1 << (i & 7)):
+                continue
+            if self._numeric[i]:
+                (details[label],) = _FLOAT.unpack_from(data, pos)
+                pos += 8
+            else:
+                length, pos = _unpack_varint(data, pos)
+                details[label] = bytes(data[pos:pos + length]).decode("utf-8")
+                pos += length
+        return details, pos
+
+    def dumps_details(self, details):
+        """詳細データ（details）だけを詰める"""
+        packed, extra_details = self._pack_details(details)
+        if extra_details:
+            packed += json.dumps(extra_details, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return packed
+
+    def loads_details(self, data):
+        """dumps_details() で詰めた詳細データを戻す"""
+        data = memoryview(data)
+        details, pos = self._unpack_details(data, 0)
+        if pos < len(data):
+            details.update(json.loads(bytes(data[pos:]).decode("utf-8")))
+        return details
+
+    def loads(self, data):
+        data = memoryview(data)
+        record = {}
+        pos = 0
+        for key in PACKED_HEADER_FIELDS:
+            length, pos = _unpack_varint(data, pos)
+            record[key] = bytes(data[pos:pos + length]).decode("utf-8")
+            pos += length
+
+        details, pos = self._unpack_details(data, pos)
+
+        if pos < len(data):
+            extra = json.loads(bytes(data[pos:]).decode("utf-8"))
+            details.update(extra.get("details", {}))
+            record.update(extra.get("fields", {}))
+            for key in extra.get("missing", []):
+                record.pop(key, None)
+            if extra.get("no_details"):
+                return record
+        record["details"] = details
+        return record
+
+
+def get_codec(name, schema=None):
+    """名前から形式を取得（packed は schema が必要）"""
+    if name == "json":
+        return JsonCodec()
+    if name == "orjson":
+        return OrjsonCodec()
+    if name == "msgpack":
+        return MsgpackCodec()
+    if name == "packed":
+        if schema is None:
+            raise ValueError("packed形式には項目の定義 (schema) が必要です。")
+        return PackedCodec(schema)
+    raise ValueError(f"未対応の保存形式です: {name}")
+
+
+CODEC_NAMES = ["json", "orjson", "msgpack", "packed"]
+
+
+def available_codecs():
+    """この環境で使える形式の名前"""
+    names = []
+    for name in CODEC_NAMES:
+        try:
+            get_codec(name, schema=[])
+        except RuntimeError:
+            continue
+        names.append(name)
+    return names
+
+
+_json_codec = None
+
+
+def json_codec():
+    """JSONの読み書きに使う形式（orjson があれば orjson）"""
+    global _json_codec
+    if _json_codec is None:
+        try:
+            _json_codec = OrjsonCodec()
+        except RuntimeError:
+            _json_codec = JsonCodec()
+    return _json_codec
+
+
+def load_json_file(path, default=None):
+    """JSONファイルを読み込む（ファイルがない場合は default）"""
+    if not os.path.exists(path):
+        return default
+    with open(path, "rb") as f:
+        return json_codec().loads(f.read())
+
+
+def save_json_file(path, obj):
+    """JSONファイルを人が読める形（インデント2）で保存する"""
+    with open(path, "wb") as f:
+        f.write(json_codec().dumps_pretty(obj))
+
+
+def encode_frames(codec, records):
+    """バイナリ形式で複数件を長さ付きで並べる"""
+    out = bytearray()
+    for record in records:
+        data = codec.dumps(record)
+        out += _FRAME_LENGTH.pack(len(data))
+        out += data
+    return bytes(out)
+
+
+def iter_frames(codec, data):
+    """encode_frames() で並べたデータを1件ずつ返す"""
+    view = memoryview(data)
+    pos = 0
+    while pos < len(view):
+        (length,) = _FRAME_LENGTH.unpack_from(view, pos)
+        pos += _FRAME_LENGTH.size
+        yield codec.loads(view[pos:pos + length])
+        pos += length
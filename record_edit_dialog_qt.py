@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録データ編集ダイアログ (PySide6版)
+登録済みのデータを入力画面と同じ検証で編集する（保存は record_log.py の新しい版として追記）
+"""
+import json
+
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLabel, QLineEdit, QPushButton,
+    QMessageBox, QScrollArea, QWidget
+)
+
+from record_store import load_form_config
+from record_validation import build_record
+
+
+def format_value(value):
+    """登録データの値を入力欄の文字列にする"""
+    if isinstance(value, list):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return "" if value is None else str(value)
+
+
+class RecordEditDialog(QDialog):
+    """登録データ1件の編集ダイアログ
+
+    保存すると changes に変更後の項目（日付・品種・ロット番号・詳細）が入る。
+    登録日時・IDは変更しない。
+    """
+
+    def __init__(self, record, parent=None):
+        super().__init__(parent)
+        self.record = record
+        self.config = load_form_config()
+        self.changes = None
+        self.detail_inputs = {}
+        self.init_ui()
+
+    def init_ui(self):
+        """UIの初期化"""
+        self.setWindowTitle("登録データの編集")
+        self.setModal(True)
+        self.resize(480, 560)
+
+        layout = QVBoxLayout()
+        info = QLabel(f"登録日時: {self.record.get('registered_at', '')}")
+        info.setStyleSheet("color: #666;")
+        layout.addWidget(info)
+
+        form_widget = QWidget()
+        form = QFormLayout(form_widget)
+        self.date_input = QLineEdit(self.record.get("entry_date", ""))
+        form.addRow("日付:", self.date_input)
+        self.product_input = QLineEdit(self.record.get("product_name", ""))
+        form.addRow("品種:", self.product_input)
+        self.lot_input = QLineEdit(self.record.get("lot_no", ""))
+        form.addRow("製造ロット番号:", self.lot_input)
+
+        details = self.record.get("details") or {}
+        for field in self.config:
+            label_name = field.get("label_name", "")
+            edit = QLineEdit(format_value(details.get(label_name)))
+            if field.get("data_type") == "パスワード":
+                edit.setEchoMode(QLineEdit.Password)
+            unit = field.get("unit", "")
+            form.addRow(f"{label_name}{f' ({unit})' if unit else ''}:", edit)
+            self.detail_inputs[label_name] = edit
+
+        scroll = QScrollArea()
+        scroll.setWidgetResizable(True)
+        scroll.setWidget(form_widget)
+        layout.addWidget(scroll)
+
+        button_layout = QHBoxLayout()
+        save_btn = QPushButton("💾 保存")
+        save_btn.setStyleSheet("background-color: #4CAF50; color: white; padding: 8px;")
+        save_btn.clicked.connect(self.save)
+        button_layout.addWidget(save_btn)
+
+        cancel_btn = QPushButton("キャンセル")
+        cancel_btn.clicked.connect(self.reject)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+    def save(self):
+        """入力値を検証して閉じる"""
+        raw_details = {name: edit.text() for name, edit in self.detail_inputs.items()}
+        record, errors = build_record(
+            self.config, self.date_input.text(), self.product_input.text(), self.lot_input.text(), raw_details
+        )
+        if errors:
+            QMessageBox.warning(self, "入力エラー", "\n".join(errors))
+            return
+
+        # 現在のフォームにない項目の値は残す
+        details = dict(self.record.get("details") or {})
+        details.update(record["details"])
+        self.changes = {
+            "entry_date": record["entry_date"],
+            "product_name": record["product_name"],
+            "lot_no": record["lot_no"],
+            "details": details,
+        }
+        self.accept()
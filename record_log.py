@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録データの編集・削除モジュール
+入力データファイルは追記だけで書き換えないため、編集・削除も「記録」として追記する
+
+    編集: 新しい版の全項目 {"op": "update", "record_id": ..., "revision": 2, "updated_at": ..., ...}
+    削除: 削除の記録     {"op": "delete", "record_id": ..., "revision": 3, "deleted_at": ..., ...}
+
+登録データは record_id で識別し、版番号 (revision) が最も大きい記録が最新の状態になる。
+record_id がない古いデータは、日付・品種・ロット番号・登録日時から求めたIDを使う。
+読み込み時は ID索引 (RecordIdIndex) から各IDの最新の記録を引き、元のデータの位置に
+最新の版を返す（削除されたデータは返さない）。
+
+記録がたまると読み込みのたびに索引を引く件数が増えるため、整理処理 (compact) が
+書庫のセグメントと入力データファイルを書き直して、記録を元のデータに反映する。
+書き直す内容はロックの外で用意し、入力データファイルのロックを持つのは
+その間に追記された部分を写して置き換えるときだけのため、登録を止めない。
+
+設定ファイル (archive_config.json) の compaction_interval_hours で整理の間隔を変えられる。
+
+使い方:
+    python record_log.py --compact
+"""
+import argparse
+import hashlib
+import os
+import sys
+import threading
+from datetime import datetime
+
+import metrics
+from record_store import DATA_FILE, RecordStore, new_record_id
+from record_archive import ARCHIVE_DIR, RecordArchive, get_archive, load_archive_config, maintenance_lock
+from record_snapshot import source_state, is_source_current
+from sharded_store import ShardedRecordStore, open_store
+
+OP_UPDATE = "update"
+OP_DELETE = "delete"
+
+# 記録に写す元のデータの項目（削除の記録も書庫への移動・絞り込みで元のデータと同じに扱われる）
+_TOMBSTONE_FIELDS = ["entry_date", "product_name", "lot_no"]
+
+# 古いデータのIDを求める項目
+_LEGACY_ID_FIELDS = ["entry_date", "product_name", "lot_no", "registered_at"]
+
+# 整理の間隔（時間）
+DEFAULT_COMPACTION_INTERVAL_HOURS = 1
+
+ERROR_SOURCE = "編集・削除の記録の整理"
+
+
+class RecordConflictError(Exception):
+    """編集・削除しようとしたデータが、他の端末で先に変更されていた"""
+
+
+def record_id(record):
+    """登録データのID（record_id がない古いデータは項目から求める）"""
+    value = record.get("record_id")
+    if value:
+        return value
+    key = "\x1f".join(str(record.get(name, "")) for name in _LEGACY_ID_FIELDS)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:32]
+
+
+def is_log_entry(entry):
+    """編集・削除の記録か"""
+    return bool(entry.get("op"))
+
+
+def current_version(entry):
+    """編集の記録から登録データの形（op を除いたもの）を取り出す"""
+    return {key: value for key, value in entry.items() if key != "op"}
+
+
+def collect_overrides(entries, overrides=None):
+    """記録をIDごとの最新の記録の辞書にまとめる"""
+    overrides = {} if overrides is None else overrides
+    for entry in entries:
+        if not is_log_entry(entry):
+            continue
+        rid = entry["record_id"]
+        latest = overrides.get(rid)
+        if latest is None or latest["revision"] < entry["revision"]:
+            overrides[rid] = entry
+    return overrides
+
+
+def resolve(entries, overrides):
+    """記録を反映した登録データを元の順に返す（記録そのものは返さない）"""
+    for entry in entries:
+        if is_log_entry(entry):
+            continue
+        if overrides:
+            latest = overrides.get(record_id(entry))
+            if latest is not None and latest["revision"] > entry.get("revision", 0):
+                if latest["op"] == OP_DELETE:
+                    continue
+                entry = current_version(latest)
+        yield entry
+
+
+def archive_overrides(archive):
+    """書庫にある記録をIDごとの最新の記録の辞書にまとめる（記録を含むブロックだけを読む）"""
+    overrides = {}
+    for segment in archive.segments():
+        if segment.has_log_entries():
+            collect_overrides(segment.iter_records(log_entries_only=True), overrides)
+    return overrides
+
+
+def resolve_records(entries):
+    """読み込み済みの全データから、記録を反映した登録データのリストを作る"""
+    overrides = collect_overrides(entries)
+    if not overrides:
+        return entries
+    return list(resolve(entries, overrides))
+
+
+class RecordIdIndex:
+    """IDごとの最新の編集・削除の記録
+
+    入力データファイルは前回読んだ位置より後の追記分だけを読み込む。
+    追記以外で書き換わった場合（上書き登録・書庫への移動・整理）は読み直す。
+    書庫は記録を含むブロックだけを読む。
+    """
+
+    def __init__(self, store, archive=None):
+        self.store = store
+        self.archive = archive or get_archive()
+        self.overrides = {}
+        self._state = None
+        self._lock = threading.Lock()
+
+    def sync(self):
+        """前回から追記された記録を取り込む"""
+        with self._lock:
+            store, archive = self.store, self.archive
+            if not os.path.exists(store.path):
+                self._rebuild_archive()
+                self._state = None
+                return
+            if self._state is not None and is_source_current(self._state, store, archive):
+                entries, position = store.load_records_after(self._state["position"])
+                if entries:
+                    collect_overrides(entries, self.overrides)
+                    self._state = source_state(store, archive, position)
+                return
+            self._rebuild_archive()
+            position = store.end_position()
+            collect_overrides(store.iter_records_until(position), self.overrides)
+            self._state = source_state(store, archive, position)
+
+    def _rebuild_archive(self):
+        self.overrides = archive_overrides(self.archive)
+
+    def latest(self, record):
+        """登録データの最新の記録（記録がない場合は None）"""
+        return self.overrides.get(record_id(record))
+
+    def resolve(self, entries):
+        """記録を反映した登録データを元の順に返す"""
+        self.sync()
+        return resolve(entries, self.overrides)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_record_index(store, archive=None):
+    """入力データファイルごとに共有するID索引を取得"""
+    archive = archive or get_archive()
+    key = (os.path.abspath(store.path), os.path.abspath(archive.directory))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = RecordIdIndex(store, archive)
+    return index
+
+
+def _next_revision(store, record):
+    """次の版番号（直接扱う保存先では、表示していた版が最新か確認する）"""
+    revision = record.get("revision", 0)
+    if isinstance(store, ShardedRecordStore):
+        store = store.store_for(record)
+    if isinstance(store, RecordStore):
+        index = get_record_index(store)
+        index.sync()
+        latest = index.latest(record)
+        if latest is not None and latest["revision"] > revision:
+            raise RecordConflictError("このデータは他の端末で変更・削除されています。表示を更新してください。")
+    return revision + 1
+
+
+def update_record(store, record, changes, user=""):
+    """登録データを編集し、新しい版を返す（changes は変更する項目の辞書）
+
+    品種別の保存先で品種を変更した場合は、元のシャードに削除の記録を書き、
+    新しいシャードに新しいIDのデータとして登録する（同じIDが2つのシャードに分かれないようにする）。
+    """
+    product_name = changes.get("product_name", record.get("product_name"))
+    if isinstance(store, ShardedRecordStore) and product_name != record.get("product_name"):
+        delete_record(store, record, user)
+        moved = {**current_version(record), **changes}
+        moved.pop("revision", None)
+        moved.update({"record_id": new_record_id(), "updated_at": datetime.now().isoformat(), "updated_by": user})
+        store.append_record(moved)
+        return moved
+    rid = record_id(record)
+    version = {**current_version(record), **changes}
+    version.update({
+        "record_id": rid,
+        "revision": _next_revision(store, record),
+        "updated_at": datetime.now().isoformat(),
+        "updated_by": user,
+    })
+    store.append_record({"op": OP_UPDATE, **version})
+    return version
+
+
+def tombstone(record, revision, user=""):
+    """登録データの削除の記録"""
+    entry = {"op": OP_DELETE, "record_id": record_id(record), "revision": revision}
+    entry.update({name: record.get(name, "") for name in _TOMBSTONE_FIELDS})
+    entry.update({"deleted_at": datetime.now().isoformat(), "deleted_by": user})
+    return entry
+
+
+def delete_record(store, record, user=""):
+    """登録データを削除する（削除の記録を追記する）"""
+    entry = tombstone(record, _next_revision(store, record), user)
+    store.append_record(entry)
+    return entry
+
+
+class _Compaction:
+    """整理1回分の判定
+
+    元のデータと記録が別の書き込み単位（セグメント・入力データファイル）にある場合は、
+    元のデータに反映した書き込みが終わった次の整理で記録を消す。途中で中断しても
+    記録と反映済みのデータが両方残るだけで、編集・削除は失われない。
+
+    書庫を複数のシャードで共有する場合 (shared_archive)、書庫にある削除の記録の
+    元のデータは他のシャードにあることがあるため、元のデータが見つからなくても消さない。
+    """
+
+    def __init__(self, overrides, shared_archive=False):
+        self.overrides = overrides
+        self.shared_archive = shared_archive
+        self.on_disk = {}  # 整理前に保存されていた元のデータの版番号
+        self.scanned_all = False
+
+    def note_bases(self, entries):
+        for entry in entries:
+            if not is_log_entry(entry):
+                rid = record_id(entry)
+                if rid in self.overrides:
+                    self.on_disk[rid] = max(self.on_disk.get(rid, -1), entry.get("revision", 0))
+
+    def apply(self, entries, live=False):
+        """記録を反映し、不要になった記録を除いた内容と、除いた記録の件数を返す（変更がない場合は None）"""
+        applied = set()
+        result = []
+        for entry in entries:
+            if is_log_entry(entry):
+                result.append(entry)
+                continue
+            rid = record_id(entry)
+            latest = self.overrides.get(rid)
+            if latest is not None and latest["revision"] > entry.get("revision", 0):
+                applied.add(rid)
+                if latest["op"] == OP_DELETE:
+                    continue
+                entry = current_version(latest)
+            result.append(entry)
+        kept = [entry for entry in result if not is_log_entry(entry) or not self._is_obsolete(entry, applied, live)]
+        if not applied and len(kept) == len(result):
+            return None, 0
+        return kept, len(result) - len(kept)
+
+    def _is_obsolete(self, entry, applied, live):
+        latest = self.overrides.get(entry["record_id"])
+        if latest is None or entry["revision"] > latest["revision"]:
+            return False  # 整理を始めた後の記録
+        if entry["revision"] < latest["revision"]:
+            return True  # より新しい記録がある
+        rid = entry["record_id"]
+        if rid in applied or self.on_disk.get(rid, -1) >= entry["revision"]:
+            return True  # 元のデータに反映済み
+        # 元のデータが見つからない削除の記録（削除を反映済み）
+        if self.shared_archive and not live:
+            return False
+        return entry["op"] == OP_DELETE and self.scanned_all and rid not in self.on_disk
+
+
+def compact(store, archive=None, shared_archive=False):
+    """編集・削除の記録を書庫と入力データファイルに反映し、除いた記録の件数を返す"""
+    archive = archive or get_archive()
+    with maintenance_lock:
+        if not os.path.exists(store.path):
+            return 0
+        index = RecordIdIndex(store, archive)
+        index.sync()
+        if not index.overrides:
+            return 0
+        compaction = _Compaction(dict(index.overrides), shared_archive)
+
+        position = store.end_position()
+        with open(store.path, "rb") as f:
+            f.seek(max(0, position - 64))
+            check = f.read(min(position, 64))
+        live = list(store.iter_records_until(position))
+        compaction.note_bases(live)
+
+        # 入力データファイルに元のデータがない記録があれば書庫全体を調べる
+        segments = archive.segments()
+        if set(compaction.overrides) - compaction.on_disk.keys():
+            compaction.scanned_all = True
+            targets = segments
+        else:
+            targets = [segment for segment in segments if segment.has_log_entries()]
+        for segment in targets:
+            compaction.note_bases(segment.iter_records())
+
+        removed = 0
+        for segment in targets:
+            entries, count = compaction.apply(list(segment.iter_records()))
+            if entries is not None:
+                archive.rewrite_segment(segment, entries)
+                removed += count
+        entries, count = compaction.apply(live, live=True)
+        if entries is not None and store.rewrite_prefix(position, entries, check):
+            removed += count
+        return removed
+
+
+def compact_store(store, archive=None):
+    """保存先の記録を整理する（品種別の保存先ではシャードごとに整理する）"""
+    if isinstance(store, ShardedRecordStore):
+        return sum(compact(shard, archive, shared_archive=True) for shard in store.shards())
+    return compact(store, archive)
+
+
+class CompactionJob:
+    """編集・削除の記録を定期的に整理するバックグラウンド処理"""
+
+    def __init__(self, store, archive=None, config=None):
+        config = config or {}
+        self.store = store
+        self.archive = archive or get_archive()
+        self.interval = config.get("compaction_interval_hours", DEFAULT_COMPACTION_INTERVAL_HOURS) * 3600
+        self.last_error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, store):
+        """入力データファイルを直接扱う保存先なら作成する（それ以外は None）"""
+        if not isinstance(store, (RecordStore, ShardedRecordStore)):
+            return None
+        return cls(store, config=load_archive_config())
+
+    def run_once(self):
+        """1回分の整理を行い、除いた記録の件数を返す"""
+        return compact_store(self.store, self.archive)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="compaction-job", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_once()
+                self.last_error = None
+                metrics.clear_error(ERROR_SOURCE)
+            except Exception as e:
+                self.last_error = e
+                metrics.report_error(ERROR_SOURCE, e)
+
+
+def main(argv=None):
+    """編集・削除の記録を整理する"""
+    parser = argparse.ArgumentParser(description="登録データの編集・削除の記録を整理します。")
+    parser.add_argument("--data", default=DATA_FILE, help="入力データファイル")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="書庫のフォルダ")
+    parser.add_argument("--compact", action="store_true", help="記録を元のデータに反映して除く")
+    args = parser.parse_args(argv)
+
+    store, archive = open_store(args.data), RecordArchive(args.archive_dir)
+    if args.compact:
+        try:
+            removed = compact_store(store, archive)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"{removed}件の記録を整理しました。")
+        return 0
+
+    overrides = {}
+    for shard in store.shards() if isinstance(store, ShardedRecordStore) else [store]:
+        index = RecordIdIndex(shard, archive)
+        index.sync()
+        overrides.update(index.overrides)
+    deleted = sum(1 for entry in overrides.values() if entry["op"] == OP_DELETE)
+    print(f"編集・削除されたデータ: {len(overrides)}件（うち削除 {deleted}件）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
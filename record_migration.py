@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+旧形式の入力データファイルの移行モジュール
+大きな input_data.json を1件ずつ読み込み、現在のフォーム設定に合わせて変換して新しい保存先に移す
+
+json.load() はファイル全体と全件の辞書をメモリに載せるため、大きな履歴では読み込めないことがある。
+移行では配列の要素を先頭から1件ずつ解析し、一定件数ごとのチャンクで保存先にまとめて書き込む。
+
+- 詳細の値はフォーム設定のデータ型に変換する（変換できないデータは却下レポートに出力）
+- ID (record_id) のないデータにはIDを付ける（項目と移行元での順番から求めるため、再実行しても同じで、
+  同じ内容の古いデータが複数あっても別のIDになる）
+- 日付が書庫の対象より古いデータは入力データファイルを経由せずに書庫へ直接書き込む（archive_config.json）
+
+チャンクを書き込むたびに、移行元のどこまでを移したかを状態ファイル (<移行先>.migration.json) に記録する。
+中断した場合は同じコマンドを再実行すると続きから移行する（記録後に書き込まれていたデータは
+IDで判定して二重に登録しない）。
+品種別の保存先（sharded_store.py）に分けてある場合は、品種ごとのシャードに移す。
+
+使い方:
+    python record_migration.py                       # input_data.json を移行（元のファイルは input_data.json.legacy に残す）
+    python record_migration.py old_data.json --chunk-size 20000
+"""
+import argparse
+import codecs
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from datetime import date, timedelta
+
+from record_store import DATA_FILE, load_form_config
+from record_archive import (
+    ARCHIVE_DIR, RecordArchive, load_archive_config,
+    DEFAULT_CODEC, DEFAULT_BLOCK_SIZE, DEFAULT_RECORD_CODEC
+)
+from record_codec import json_codec, load_json_file
+from record_validation import DATE_FORMATS, convert_value
+from record_log import is_log_entry, record_id
+from sharded_store import ShardedRecordStore, open_store, shard_map_path
+
+DEFAULT_CHUNK_SIZE = 20000
+
+# 移行元の読み込み単位（バイト）
+_READ_CHUNK_SIZE = 1 << 20
+
+# 移行元を残すときの拡張子（移行元と移行先が同じファイルの場合）
+LEGACY_SUFFIX = ".legacy"
+
+# 配列の開始前・要素の間の空白と区切り
+_LEADING = re.compile(r"[\s\ufeff]*")
+_SEPARATOR = re.compile(r"[\s,]*")
+
+# 変換しなくてよい日付
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class JsonArrayReader:
+    """JSON配列のファイルを1要素ずつ読み込む（読み込んだ位置をバイト単位で返せる）
+
+    record_store.iter_json_array() と同じ読み方で、途中の位置（要素の終わり）から再開できる。
+    """
+
+    def __init__(self, f, offset=0, chunk_size=_READ_CHUNK_SIZE):
+        f.seek(offset)
+        self._file = f
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._scanner = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._base = offset  # _buf の先頭のバイト位置
+        self._eof = False
+        self._in_array = offset > 0
+
+    def position(self):
+        """最後に返した要素の終わりのバイト位置"""
+        return self._base + len(self._buf[:self._pos].encode("utf-8"))
+
+    def _refill(self):
+        data = self._file.read(self._chunk_size)
+        if not data:
+            self._eof = True
+            return False
+        self._base += len(self._buf[:self._pos].encode("utf-8"))
+        self._buf = self._buf[self._pos:] + self._decoder.decode(data)
+        self._pos = 0
+        return True
+
+    def __iter__(self):
+        if not self._in_array:
+            while True:
+                self._pos = _LEADING.match(self._buf, self._pos).end()
+                if self._pos < len(self._buf):
+                    break
+                if not self._refill():
+                    return
+            if self._buf[self._pos] != "[":
+                raise ValueError("JSON配列ではありません。")
+            self._pos += 1
+            self._in_array = True
+
+        while True:
+            self._pos = _SEPARATOR.match(self._buf, self._pos).end()
+            if self._pos >= len(self._buf):
+                if not self._refill():
+                    raise ValueError("JSON配列が途中で終わっています。")
+                continue
+            if self._buf[self._pos] == "]":
+                return
+            try:
+                item, end = self._scanner.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # 要素がバッファの途中で切れているので続きを読む
+                if not self._refill():
+                    raise
+                continue
+            if end >= len(self._buf) and not self._eof and self._refill():
+                continue  # 数値などが途中で切れている可能性があるため読み直す
+            self._pos = end
+            yield item
+
+
+def _normalize_date(value):
+    """日付を YYYY-MM-DD にそろえる（解釈できない場合はそのまま）"""
+    text = str(value or "").strip()
+    if _ISO_DATE.match(text):
+        return text
+    for fmt in DATE_FORMATS:
+        try:
+            return time.strftime("%Y-%m-%d", time.strptime(text, fmt))
+        except ValueError:
+            continue
+    return text
+
+
+def legacy_record_id(record, index):
+    """ID のない古いデータのID（移行元での順番 index も含めて求める）"""
+    key = f"{record_id(record)}\x1f{index}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:32]
+
+
+def map_record(config, legacy, index):
+    """旧形式のデータを現在のフォーム設定に合わせて変換する (データ, エラー一覧) を返す
+
+    index は移行元の配列での順番（ID のないデータのIDに使う）。
+    フォームにある項目はデータ型に変換し、フォームにない項目の値はそのまま残す。
+    入力規則（必須・範囲など）は登録時のものを尊重し、ここでは確認しない。
+    """
+    if not isinstance(legacy, dict):
+        return None, ["登録データの形式ではありません。"]
+    if is_log_entry(legacy):
+        return legacy, []  # 編集・削除の記録はそのまま移す
+
+    details = dict(legacy.get("details") or {})
+    # 詳細が基本情報と同じ階層に保存されている古い形式
+    labels = {field.get("label_name", "") for field in config}
+    for label_name in labels:
+        if label_name not in details and label_name in legacy:
+            details[label_name] = legacy[label_name]
+
+    errors = []
+    for field in config:
+        label_name = field.get("label_name", "")
+        if label_name not in details:
+            continue
+        value, error = convert_value(field, details[label_name])
+        if error:
+            errors.append(error)
+        else:
+            details[label_name] = value
+    if not str(legacy.get("product_name") or "").strip() or not str(legacy.get("lot_no") or "").strip():
+        errors.append("品種または製造ロット番号がありません。")
+    if errors:
+        return None, errors
+
+    record = {key: value for key, value in legacy.items() if key != "details" and key not in labels}
+    record.update({
+        "entry_date": _normalize_date(legacy.get("entry_date")),
+        "product_name": str(legacy.get("product_name")).strip(),
+        "lot_no": str(legacy.get("lot_no")).strip(),
+        "details": details,
+        "registered_at": legacy.get("registered_at") or "",
+    })
+    if not record.get("record_id"):
+        record["record_id"] = legacy_record_id(record, index)
+    return record, []
+
+
+def state_path(data_path):
+    """移行の状態ファイル"""
+    return data_path + ".migration.json"
+
+
+def _target_stores(store):
+    """移行先の入力データファイル（品種別の保存先ではシャードごと）"""
+    if isinstance(store, ShardedRecordStore):
+        return store.shards()
+    return [store]
+
+
+def _target_state_path(store):
+    if isinstance(store, ShardedRecordStore):
+        return state_path(shard_map_path(store.directory))
+    return state_path(store.path)
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _save_state(path, state):
+    """状態ファイルを書き込む（書き込み途中のファイルを読まないよう置き換える）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(json_codec().dumps_pretty(state))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _written_after(state, store, archive):
+    """最後の記録より後に書き込まれていたデータのID（中断時の二重登録を防ぐ）"""
+    ids = set()
+    positions = state.get("target_positions", {})
+    for target in _target_stores(store):
+        if not os.path.exists(target.path):
+            continue
+        position = positions.get(target.path)
+        if position is None:
+            records = target.iter_records()  # 記録後に作られたファイル
+        else:
+            records, _ = target.load_records_after(position)
+        ids.update(record_id(r) for r in records if not is_log_entry(r))
+    known = set(state.get("segments", []))
+    for segment in archive.segments():
+        if os.path.basename(segment.path) not in known:
+            ids.update(record_id(r) for r in segment.iter_records() if not is_log_entry(r))
+    return ids
+
+
+def migrate(source, store, archive=None, config=None, chunk_size=DEFAULT_CHUNK_SIZE,
+            archive_config=None, today=None, reject_path=None, progress=None, cancelled=None):
+    """旧形式の入力データファイルを移行し、結果の集計を返す
+
+    archive_config: 書庫の設定（max_age_days より古いデータを書庫へ直接書き込む。None の場合は書庫を使わない）
+    progress: 各チャンクの書き込み後に集計の辞書で呼ばれる
+    cancelled: True を返すと次のチャンクを読み込まずに終了する（続きは再実行で移行できる）
+    """
+    archive = archive or RecordArchive()
+    config = load_form_config() if config is None else config
+    if reject_path is None:
+        base = source[:-len(LEGACY_SUFFIX)] if source.endswith(LEGACY_SUFFIX) else source
+        reject_path = os.path.splitext(base)[0] + "_rejected.jsonl"
+    cutoff = None
+    if archive_config:
+        max_age_days = archive_config.get("max_age_days")
+        if max_age_days is not None:
+            cutoff = ((today or date.today()) - timedelta(days=max_age_days)).isoformat()
+        archive_config = dict(archive_config)
+
+    path = _target_state_path(store)
+    state = load_json_file(path)
+    if state and state.get("completed") and state.get("source") != os.path.abspath(source):
+        state = None  # 別のファイルの移行は完了済み
+    skip_ids = set()
+    if state:
+        if state.get("source") != os.path.abspath(source) or state.get("signature") != _source_signature(source):
+            raise ValueError(f"移行元が前回の移行から変更されています。{path} を削除してから最初からやり直してください。")
+        if state.get("completed"):
+            return dict(state["summary"], resumed=True)
+        skip_ids = _written_after(state, store, archive)
+    else:
+        state = {
+            "source": os.path.abspath(source),
+            "signature": _source_signature(source),
+            "offset": 0,
+            "summary": {"total": 0, "imported": 0, "archived": 0, "rejected": 0, "skipped": 0},
+            "elapsed": 0.0,
+        }
+    summary = state["summary"]
+    started = time.perf_counter()
+    start_offset = state["offset"]
+    elapsed_before = state["elapsed"]
+
+    def checkpoint(offset, reject_size, completed=False):
+        state["offset"] = offset
+        state["reject_size"] = reject_size
+        state["target_positions"] = {target.path: target.end_position() for target in _target_stores(store)}
+        state["segments"] = [os.path.basename(p) for p in archive.segment_paths()]
+        state["elapsed"] = elapsed_before + time.perf_counter() - started
+        state["completed"] = completed
+        _save_state(path, state)
+
+    def report(offset):
+        elapsed = time.perf_counter() - started
+        summary["elapsed"] = elapsed_before + elapsed
+        summary["records_per_sec"] = summary["total"] / summary["elapsed"] if summary["elapsed"] else 0.0
+        summary["mb_per_sec"] = (offset - start_offset) / elapsed / 1e6 if elapsed else 0.0
+        summary["offset"] = offset
+        if progress:
+            progress(summary)
+
+    with open(source, "rb") as f, open(reject_path, "ab") as reject_file:
+        # 前回の記録より後に出力していた却下データは出力し直す
+        reject_file.truncate(state.get("reject_size", 0))
+        reader = JsonArrayReader(f, state["offset"])
+        items = iter(reader)
+        finished = False
+        while not finished:
+            if cancelled and cancelled():
+                break
+            live, archived = [], []
+            for _ in range(chunk_size):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    finished = True
+                    break
+                record, errors = map_record(config, item, summary["total"])
+                summary["total"] += 1
+                if errors:
+                    summary["rejected"] += 1
+                    reject_file.write(json_codec().dumps({"errors": errors, "record": item}) + b"\n")
+                    continue
+                if skip_ids and not is_log_entry(record) and record["record_id"] in skip_ids:
+                    summary["skipped"] += 1
+                    continue
+                if cutoff is not None and record.get("entry_date", "") < cutoff:
+                    archived.append(record)
+                else:
+                    live.append(record)
+
+            if archived:
+                archive.write_segment(
+                    archived, archive_config.get("codec", DEFAULT_CODEC),
+                    archive_config.get("block_size", DEFAULT_BLOCK_SIZE),
+                    archive_config.get("record_codec", DEFAULT_RECORD_CODEC),
+                )
+            store.append_records(live)
+            reject_file.flush()
+            summary["archived"] += len(archived)
+            summary["imported"] += len(live)
+            offset = reader.position()
+            report(offset)
+            checkpoint(offset, reject_file.tell(), completed=finished)
+
+    summary["report"] = reject_path if summary["rejected"] else None
+    if not summary["rejected"] and os.path.exists(reject_path) and not os.path.getsize(reject_path):
+        os.remove(reject_path)
+    return dict(summary, completed=state["completed"])
+
+
+def main(argv=None):
+    """コマンドラインから移行を実行"""
+    parser = argparse.ArgumentParser(description="旧形式の入力データファイルを1件ずつ読み込んで移行します。")
+    parser.add_argument("source", nargs="?", default=DATA_FILE, help="移行元のファイル（JSON配列）")
+    parser.add_argument("--data", default=DATA_FILE, help="移行先の入力データファイル（品種別に分けてある場合はシャードに移す）")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="書庫のフォルダ")
+    parser.add_argument("--no-archive", action="store_true", help="古いデータも書庫へ移さず入力データファイルに入れる")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="まとめて書き込む件数")
+    parser.add_argument("--reject-report", default=None, help="却下データレポートの出力先 (JSON Lines)")
+    args = parser.parse_args(argv)
+
+    source = args.source
+    if os.path.abspath(source) == os.path.abspath(args.data):
+        # 移行元を残して、同じ名前で新しい入力データファイルを作る
+        legacy = source + LEGACY_SUFFIX
+        if not os.path.exists(legacy):
+            if not os.path.exists(source):
+                parser.error(f"移行元のファイルがありません: {source}")
+            os.replace(source, legacy)
+            print(f"移行元を {legacy} に移しました。")
+        source = legacy
+    elif not os.path.exists(source):
+        parser.error(f"移行元のファイルがありません: {source}")
+
+    def report_progress(summary):
+        print(f"\r処理済み: {summary['total']}件 (登録 {summary['imported']} / 書庫 {summary['archived']} / "
+              f"却下 {summary['rejected']})  {summary['records_per_sec']:.0f}件/秒 {summary['mb_per_sec']:.1f}MB/秒",
+              end="", flush=True)
+
+    try:
+        summary = migrate(
+            source, open_store(args.data), RecordArchive(args.archive_dir),
+            chunk_size=args.chunk_size, archive_config=None if args.no_archive else load_archive_config(),
+            reject_path=args.reject_report, progress=report_progress,
+        )
+    except (RuntimeError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("\n中断しました。もう一度実行すると続きから移行します。")
+        return 1
+    print()
+    if summary.get("resumed"):
+        print("移行は完了済みです。")
+    print(f"登録: {summary['imported']}件 / 書庫: {summary['archived']}件 / 却下: {summary['rejected']}件 "
+          f"/ 二重登録を防いで除外: {summary['skipped']}件 ({summary['elapsed']:.1f}秒, "
+          f"{summary.get('records_per_sec', 0.0):.0f}件/秒)")
+    if summary.get("report"):
+        print(f"却下データレポート: {summary['report']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録データ検索モジュール
+品種・ロット番号・日付の条件で登録データを絞り込む
+
+結果は1件ずつ返すため、大量の結果でもメモリに載せずに扱える。
+"""
+
+# 検索条件として受け付ける項目
+QUERY_FIELDS = ["product_name", "lot_no", "lot_prefix", "date_from", "date_to"]
+
+
+def normalize_query(**conditions):
+    """検索条件を正規化する（空の条件を除き、前後の空白を取る）"""
+    query = {}
+    for key in QUERY_FIELDS:
+        value = conditions.get(key)
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            query[key] = value
+    return query
+
+
+def matches(record, query):
+    """登録データが検索条件に一致するか"""
+    if "product_name" in query and record.get("product_name") != query["product_name"]:
+        return False
+    lot_no = record.get("lot_no", "")
+    if "lot_no" in query and lot_no != query["lot_no"]:
+        return False
+    if "lot_prefix" in query and not lot_no.startswith(query["lot_prefix"]):
+        return False
+    entry_date = record.get("entry_date", "")
+    if "date_from" in query and entry_date < query["date_from"]:
+        return False
+    if "date_to" in query and entry_date > query["date_to"]:
+        return False
+    return True
+
+
+def iter_query(records, query, offset=0, limit=None):
+    """条件に一致する登録データを offset 件飛ばして最大 limit 件返す"""
+    skipped = 0
+    returned = 0
+    for record in records:
+        if not matches(record, query):
+            continue
+        if skipped < offset:
+            skipped += 1
+            continue
+        if limit is not None and returned >= limit:
+            return
+        yield record
+        returned += 1
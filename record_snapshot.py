@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録データのスナップショットモジュール
+「登録データ」タブの表示に使う列を、起動時にメモリマップで開けるバイナリファイルに保存する
+
+起動のたびに大きな入力データファイル(JSON)を解析すると履歴の件数に比例して時間がかかる。
+スナップショットを開くのは件数によらず一定時間で、各行は表示するときに初めて読み出す。
+スナップショットより後に追記されたデータだけを入力データファイルから読み込む。
+
+スナップショットより後に追記された編集・削除の記録（record_log.py）は、登録データのIDの索引で
+スナップショットの行を引き、その行を置き換える・除く形で重ねて表示する。追記分が多い場合と
+記録がある場合は、今のスナップショットで表示しながら別スレッドで作り直す。
+上書き登録・書庫への移動などでファイルが書き直された場合は作り直す。
+
+ファイルの構成:
+    MAGIC | 各行の項目（日付・品種・ロット番号・登録日時・登録データのJSON）|
+    項目の位置 (uint64, 行数×項目数+1) | IDを並べたもの | IDの位置 (uint64, 行数+1) | IDの行番号 (uint64, 行数) |
+    ヘッダー(JSON) | ヘッダーの長さ (uint64) | MAGIC
+IDは並べ替えて保存し、二分探索で行番号を引く。
+位置は作成したPCのバイト順で保存する（別のPCにコピーした場合は作り直される）。
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+
+from record_store import RecordStore
+from sharded_store import ShardedRecordStore, warn_unsupported
+from record_archive import get_archive, iter_all_records
+from record_codec import json_codec
+from compact_records import CompactRecordList
+
+MAGIC = b"EFSNAP02"
+
+# 1行に保存する項目（最後は詳細表示用の登録データ全体）
+COLUMNS = ["entry_date", "product_name", "lot_no", "registered_at"]
+_FIELDS_PER_ROW = len(COLUMNS) + 1
+
+# ファイルが書き直されていないか確認するために保存する末尾のバイト数
+_CHECK_BYTES = 64
+
+# スナップショットより後の追記がこの件数を超えたら（別スレッドで）作り直す
+REBUILD_THRESHOLD = 5000
+
+_UINT64 = struct.Struct("<Q")
+
+
+def snapshot_path(store):
+    return store.path + ".snap"
+
+
+def source_state(store, archive, position):
+    """入力データファイル・書庫の状態（position までを読み込んだ時点。追記以外の変更の検出に使う）"""
+    stat = os.stat(store.path)
+    with open(store.path, "rb") as f:
+        f.seek(max(0, position - _CHECK_BYTES))
+        tail = f.read(min(position, _CHECK_BYTES))
+    return {
+        "inode": stat.st_ino,
+        "position": position,
+        "tail": tail.hex(),
+        "archive": [os.path.basename(p) for p in archive.segment_paths()],
+    }
+
+
+def is_source_current(state, store, archive):
+    """source_state() で記録した時点から、入力データファイル・書庫に追記しかされていないか"""
+    position = state["position"]
+    try:
+        if os.path.getsize(store.path) < position:
+            return False
+        current = source_state(store, archive, position)
+    except OSError:
+        return False
+    return all(current[key] == state[key] for key in ("inode", "tail", "archive"))
+
+
+def write_snapshot(path, records, state):
+    """登録データのスナップショットを書き込む
+
+    開いている間は置き換えられない環境があるため、いったん .new に書き、次に開くときに置き換える。
+    """
+    from record_log import record_id
+
+    encode = json_codec().dumps
+    offsets = array("Q", [len(MAGIC)])
+    ids = []
+    new_path = path + ".new"
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        position = len(MAGIC)
+        for record in records:
+            fields = [str(record.get(key, "")).encode("utf-8") for key in COLUMNS]
+            fields.append(encode(record))
+            for data in fields:
+                f.write(data)
+                position += len(data)
+                offsets.append(position)
+            ids.append(record_id(record).encode("utf-8"))
+
+        # 位置の配列は8バイト境界から置く
+        padding = -position % 8
+        f.write(b"\0" * padding)
+        offsets_start = position + padding
+        f.write(offsets.tobytes())
+        position = offsets_start + len(offsets) * 8
+
+        # IDの索引（並べ替えたIDと、その行番号）
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        ids_start = position
+        id_offsets = array("Q", [0])
+        for row in order:
+            f.write(ids[row])
+            id_offsets.append(id_offsets[-1] + len(ids[row]))
+        position += id_offsets[-1]
+        padding = -position % 8
+        f.write(b"\0" * padding)
+        id_offsets_start = position + padding
+        f.write(id_offsets.tobytes())
+        f.write(array("Q", order).tobytes())
+
+        header = dict(state, count=len(ids), offsets_start=offsets_start,
+                      ids_start=ids_start, id_offsets_start=id_offsets_start)
+        header_data = json.dumps(header).encode("utf-8")
+        f.write(header_data)
+        f.write(_UINT64.pack(len(header_data)))
+        f.write(MAGIC)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, new_path)
+
+
+class RecordSnapshot:
+    """メモリマップで開いたスナップショット（行は参照したときに読み出す）"""
+
+    def __init__(self, path):
+        self._view = None
+        self._offsets = None
+        self._id_offsets = None
+        self._id_rows = None
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            mm = self._mmap
+            if len(mm) < len(MAGIC) * 2 + 8 or mm[:len(MAGIC)] != MAGIC or mm[-len(MAGIC):] != MAGIC:
+                raise ValueError(f"{path} はスナップショットではありません。")
+            header_end = len(mm) - len(MAGIC) - 8
+            (header_len,) = _UINT64.unpack(mm[header_end:header_end + 8])
+            self.header = json.loads(mm[header_end - header_len:header_end].decode("utf-8"))
+            start = self.header["offsets_start"]
+            self.count = self.header["count"]
+            self._view = memoryview(mm)
+            self._offsets = self._view[start:start + (self.count * _FIELDS_PER_ROW + 1) * 8].cast("Q")
+            self._ids_start = self.header["ids_start"]
+            start = self.header["id_offsets_start"]
+            self._id_offsets = self._view[start:start + (self.count + 1) * 8].cast("Q")
+            start += (self.count + 1) * 8
+            self._id_rows = self._view[start:start + self.count * 8].cast("Q")
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return self.count
+
+    def _field_bytes(self, index):
+        return self._mmap[self._offsets[index]:self._offsets[index + 1]]
+
+    def _field(self, index):
+        return self._field_bytes(index).decode("utf-8")
+
+    def row(self, i):
+        """表示用の項目 (日付, 品種, ロット番号, 登録日時)"""
+        base = i * _FIELDS_PER_ROW
+        return tuple(self._field(base + k) for k in range(len(COLUMNS)))
+
+    def record(self, i):
+        """登録データ全体"""
+        return json_codec().loads(self._field_bytes(i * _FIELDS_PER_ROW + len(COLUMNS)))
+
+    def _id(self, k):
+        start = self._ids_start
+        return self._mmap[start + self._id_offsets[k]:start + self._id_offsets[k + 1]]
+
+    def find(self, rid):
+        """登録データのIDの行番号（ない場合は None）"""
+        key = rid.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._id(lo) == key:
+            return self._id_rows[lo]
+        return None
+
+    def is_current(self, store, archive):
+        """入力データファイル・書庫がスナップショット作成後に追記しかされていないか"""
+        return is_source_current(self.header, store, archive)
+
+    def close(self):
+        for view in (self._id_rows, self._id_offsets, self._offsets, self._view):
+            if view is not None:
+                view.release()
+        self._id_rows = self._id_offsets = self._offsets = self._view = None
+        self._mmap.close()
+
+
+class RecordList:
+    """読み込み済みの登録データ（スナップショットを使わない場合）"""
+
+    def __init__(self, records):
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def row(self, i):
+        record = self.records[i]
+        return tuple(record.get(key, "") for key in COLUMNS)
+
+    def record(self, i):
+        return self.records[i]
+
+    def close(self):
+        pass
+
+
+class SnapshotRecords:
+    """スナップショットと、その後に追記された登録データを続けて扱う
+
+    スナップショットより後に編集された行は replaced の登録データに置き換え、削除された行は除く。
+    """
+
+    def __init__(self, snapshot, tail, replaced=None, removed=()):
+        self.snapshot = snapshot
+        self.tail = tail
+        self.replaced = replaced or {}  # スナップショットの行番号 → 編集後の登録データ
+        self.removed = sorted(removed)   # 削除されたスナップショットの行番号
+        self._visible = len(snapshot) - len(self.removed)
+
+    def __len__(self):
+        return self._visible + len(self.tail)
+
+    def _snapshot_row(self, i):
+        """表示の i 番目にあたるスナップショットの行番号（削除された行を飛ばす）"""
+        row = i
+        while True:
+            shifted = i + bisect_right(self.removed, row)
+            if shifted == row:
+                return row
+            row = shifted
+
+    def row(self, i):
+        if i < self._visible:
+            row = self._snapshot_row(i)
+            record = self.replaced.get(row)
+            if record is not None:
+                return tuple(record.get(key, "") for key in COLUMNS)
+            return self.snapshot.row(row)
+        return self.tail.row(i - self._visible)
+
+    def record(self, i):
+        if i < self._visible:
+            row = self._snapshot_row(i)
+            record = self.replaced.get(row)
+            if record is not None:
+                return record
+            return self.snapshot.record(row)
+        return self.tail.record(i - self._visible)
+
+    def close(self):
+        self.snapshot.close()
+
+
+def _overlay(snapshot, entries):
+    """スナップショットに、その後に追記された登録データと編集・削除の記録を重ねる"""
+    from record_log import OP_DELETE, collect_overrides, current_version, resolve
+
+    overrides = collect_overrides(entries)
+    replaced = {}
+    removed = []
+    for rid, latest in overrides.items():
+        row = snapshot.find(rid)
+        if row is None:
+            continue  # スナップショットより後に追記されたデータの記録（追記分の中で反映する）
+        if latest["revision"] <= snapshot.record(row).get("revision", 0):
+            continue
+        if latest["op"] == OP_DELETE:
+            removed.append(row)
+        else:
+            replaced[row] = current_version(latest)
+    tail = CompactRecordList(records=resolve(entries, overrides))
+    return SnapshotRecords(snapshot, tail, replaced, removed)
+
+
+def _promote_new_snapshot(path):
+    """書き終えたスナップショット (.new) があれば置き換える"""
+    new_path = path + ".new"
+    if os.path.exists(new_path):
+        try:
+            os.replace(new_path, path)
+        except OSError:
+            pass  # 他で開いている間は置き換えられないため次回に回す
+
+
+_build_lock = threading.Lock()
+
+
+def _build_in_background(store, records, state):
+    """スナップショットを別スレッドで作る（作成中なら何もしない）"""
+    if not _build_lock.acquire(blocking=False):
+        return
+
+    def build():
+        try:
+            write_snapshot(snapshot_path(store), records, state)
+        except (OSError, ValueError):
+            pass
+        finally:
+            _build_lock.release()
+    threading.Thread(target=build, name="snapshot-writer", daemon=True).start()
+
+
+def _rebuild_in_background(store, archive):
+    """入力データファイル・書庫から読み直してスナップショットを別スレッドで作り直す"""
+    from record_log import get_record_index
+
+    position = store.end_position()
+    if position is None:
+        return
+    state = source_state(store, archive, position)
+
+    def records():
+        index = get_record_index(store, archive)
+        yield from index.resolve(archive.iter_records())
+        yield from index.resolve(store.iter_records_until(position))
+    _build_in_background(store, records(), state)
+
+
+def open_records(store, archive=None):
+    """表示用の登録データ（書庫を含む）を開く
+
+    有効なスナップショットがあれば開いて追記分だけを読み込み、編集・削除の記録は重ねて反映する。
+    追記分が多い場合・記録がある場合は、次回のためにスナップショットを別スレッドで作り直す。
+    ない場合は全件を省スペースの形（compact_records.py）で読み込み、
+    次回のためにスナップショットを別スレッドで作る。
+    """
+    from record_log import get_record_index, is_log_entry
+
+    archive = archive or get_archive()
+    if not isinstance(store, RecordStore):
+        if isinstance(store, ShardedRecordStore):
+            warn_unsupported("snapshot")
+        return CompactRecordList(records=iter_all_records(store, archive=archive))
+
+    path = snapshot_path(store)
+    _promote_new_snapshot(path)
+    snapshot = None
+    if os.path.exists(path) and os.path.exists(store.path):
+        try:
+            snapshot = RecordSnapshot(path)
+        except (OSError, ValueError, KeyError):
+            snapshot = None
+    if snapshot is not None:
+        if snapshot.is_current(store, archive):
+            try:
+                entries, _ = store.load_records_after(snapshot.header["position"])
+                records = _overlay(snapshot, entries)
+            except Exception:
+                snapshot.close()
+                raise
+            if len(entries) > REBUILD_THRESHOLD or any(is_log_entry(e) for e in entries):
+                _rebuild_in_background(store, archive)
+            return records
+        snapshot.close()
+
+    index = get_record_index(store, archive)
+    records = CompactRecordList(records=index.resolve(archive.iter_records()))
+    position = store.end_position()
+    if position is not None:
+        records.extend(index.resolve(store.iter_records_until(position)))
+        _build_in_background(store, records, source_state(store, archive, position))
+    return records
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録データ保存モジュール
+入力データファイル(JSON配列)への読み書きを一元化する
+追記はファイル末尾の「]」以降だけを書き換えるため、既存データを読み直さない
+"""
+import io
+import json
+import os
+import re
+import threading
+import uuid
+
+import metrics
+from record_codec import json_codec, load_json_file, save_json_file
+
+CONFIG_FILE = "form_config.json"
+FORM_SETTINGS_FILE = "form_settings.json"
+DATA_FILE = "input_data.json"
+
+# 末尾の「]」を探すときに読み込むバイト数
+_TAIL_READ_SIZE = 4096
+
+# 1件ずつ読み込むときに一度に読む文字数
+_READ_CHUNK_SIZE = 1 << 20
+
+# 配列要素の間の空白と区切り
+_SEPARATOR = re.compile(r"[\s,]*")
+
+
+def load_form_config(path=CONFIG_FILE):
+    """フォーム設定を読み込む（未設定の場合は空リスト）"""
+    return load_json_file(path) or []
+
+
+def load_form_settings(path=FORM_SETTINGS_FILE):
+    """フォーム単位の設定（重複登録時の動作など）を読み込む"""
+    return load_json_file(path) or {}
+
+
+def save_form_settings(settings, path=FORM_SETTINGS_FILE):
+    """フォーム単位の設定を保存する"""
+    save_json_file(path, settings)
+
+
+def iter_json_array(f, chunk_size=_READ_CHUNK_SIZE):
+    """JSON配列のファイルを先頭から1要素ずつ読み込む（全体をメモリに載せない）"""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def refill():
+        nonlocal buf, pos, eof
+        more = f.read(chunk_size)
+        if not more:
+            eof = True
+            return False
+        buf = buf[pos:] + more
+        pos = 0
+        return True
+
+    # 配列の開始「[」を探す
+    while True:
+        pos = _SEPARATOR.match(buf, pos).end()
+        if pos < len(buf):
+            break
+        if not refill():
+            return
+    if buf[pos] != "[":
+        raise ValueError("JSON配列ではありません。")
+    pos += 1
+
+    while True:
+        pos = _SEPARATOR.match(buf, pos).end()
+        if pos >= len(buf):
+            if not refill():
+                raise ValueError("JSON配列が途中で終わっています。")
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # 要素がバッファの途中で切れているので続きを読む
+            if not refill():
+                raise
+            continue
+        if end >= len(buf) and not eof and refill():
+            continue  # 数値などが途中で切れている可能性があるため読み直す
+        yield item
+        pos = end
+
+
+def new_record_id():
+    """登録データのID（32桁の16進数）"""
+    return uuid.uuid4().hex
+
+
+def _format_record(record):
+    """json.dump(indent=2) で配列を書いたときと同じ形に1件を整形"""
+    text = json_codec().dumps_pretty(record).decode("utf-8")
+    return "\n".join("  " + line for line in text.splitlines())
+
+
+_default_store = None
+
+
+def get_store():
+    """アプリ全体で共有する保存先を取得（追記の通知もここから受け取る）
+
+    受付サーバーが設定されている場合 (ingest_config.json) はサーバー経由で読み書きする。
+    品種ごとのシャードに分けてある場合 (shards/shard_map.json) は品種別の保存先を使う。
+    """
+    global _default_store
+    if _default_store is None:
+        from ingest_client import load_ingest_config, RemoteRecordStore
+        from sharded_store import open_store
+
+        ingest_config = load_ingest_config()
+        if ingest_config:
+            _default_store = RemoteRecordStore(ingest_config.get("host", "127.0.0.1"), ingest_config["port"])
+        else:
+            _default_store = open_store()
+    return _default_store
+
+
+class RecordStore:
+    """登録データの保存先（JSON配列ファイル）"""
+
+    def __init__(self, path=DATA_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        # ファイル全体を書き直す処理（上書き登録・書庫への移動・整理）どうしを直列にする
+        self._rewrite_lock = threading.RLock()
+        self._listeners = []
+        self._write_hooks = []
+
+    def add_listener(self, callback):
+        """追記時に呼び出す関数を登録（追記したデータのリストが渡される）"""
+        self._listeners.append(callback)
+
+    def add_write_hook(self, callback):
+        """書き込みのロックの中で呼び出す関数を登録（変更フィードなど、書き込みと同じ順に記録するもの用）
+
+        callback(保存先, 書き込んだデータ, 書き込み前の終わりの位置, 書き込み後の終わりの位置, match) で呼ばれる。
+        ファイルを新しく作った場合、書き込み前の位置は None。上書き登録では追記通知と同じ
+        編集・削除の記録の形のデータと、置き換えた条件 match が渡される（追記では None）。
+        ロックを持ったまま呼ぶため、時間のかかる処理や保存先への書き込みはしない。
+        """
+        self._write_hooks.append(callback)
+
+    def remove_listener(self, callback):
+        """登録した関数を解除"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    @metrics.timed("store.load_records")
+    def load_records(self):
+        """全登録データを読み込む"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            return json_codec().loads(f.read())
+
+    def load_records_with_position(self, retries=3):
+        """全登録データと、読み込んだ時点の最後の要素の終わりの位置（バイト）を返す
+
+        位置より前の部分は追記では書き換わらないため、続きだけを iter_records_after() で読める。
+        """
+        if not os.path.exists(self.path):
+            return [], None
+        for attempt in range(retries):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            close_pos = data.rfind(b"]")
+            try:
+                if close_pos < 0:
+                    raise ValueError(f"{self.path} はJSON配列ではありません。")
+                records = json_codec().loads(data[:close_pos + 1])
+            except ValueError:
+                # 追記の途中を読んだ可能性があるため読み直す
+                if attempt == retries - 1:
+                    raise
+                continue
+            return records, len(data[:close_pos].rstrip())
+
+    def end_position(self):
+        """現在の最後の要素の終わりの位置（バイト。ファイルが無い場合は None）"""
+        if not os.path.exists(self.path):
+            return None
+        with self._lock:
+            return self._end_position_locked()
+
+    def _end_position_locked(self):
+        with open(self.path, "rb") as f:
+            position, _ = self._find_array_end(f)
+        return position
+
+    def iter_records_until(self, position):
+        """end_position() で得た位置までの登録データを1件ずつ返す（全件をメモリに載せない）"""
+        with open(self.path, "rb") as f:
+            data = f.read(position)
+        yield from iter_json_array(io.StringIO(data.decode("utf-8") + "]"))
+
+    def load_records_after(self, position):
+        """position より後に追記された登録データと、読み込んだ最後の要素の終わりの位置を返す"""
+        with open(self.path, "rb") as f:
+            f.seek(position)
+            rest = f.read()
+        close_pos = rest.rfind(b"]")
+        if close_pos < 0:
+            return [], position
+        body = rest[:close_pos].rstrip()
+        records = json_codec().loads(b"[" + body.lstrip().lstrip(b",") + b"]")
+        return records, position + len(body)
+
+    def iter_records_after(self, position):
+        """load_records_with_position() で得た位置より後に追記された登録データを返す"""
+        with open(self.path, "rb") as f:
+            f.seek(position)
+            rest = f.read().decode("utf-8").lstrip().lstrip(",")
+        yield from iter_json_array(io.StringIO("[" + rest))
+
+    def iter_records(self):
+        """登録データを1件ずつ読み込む（全件をメモリに載せない）"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            yield from iter_json_array(f)
+
+    def append_record(self, record):
+        """1件追記"""
+        self.append_records([record])
+
+    @metrics.timed("store.append_records")
+    def append_records(self, records):
+        """複数件をまとめて追記（配列末尾の「]」を書き換える）
+
+        IDのないデータには record_id を付ける（渡した辞書に追加される）。
+        """
+        if not records:
+            return
+        for record in records:
+            if not record.get("record_id"):
+                record["record_id"] = new_record_id()
+
+        body = ",\n".join(_format_record(r) for r in records).encode("utf-8")
+
+        with self._lock:
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                start, head = None, b"[\n"
+                with open(self.path, "wb") as f:
+                    f.write(head + body + b"\n]")
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                with open(self.path, "r+b") as f:
+                    start, is_empty = self._find_array_end(f)
+                    head = b"\n" if is_empty else b",\n"
+                    f.seek(start)
+                    f.write(head + body + b"\n]")
+                    f.truncate()
+                    f.flush()
+                    os.fsync(f.fileno())
+            end = (start or 0) + len(head) + len(body)
+            for hook in list(self._write_hooks):
+                hook(self, records, start, end, None)
+
+        metrics.count("records_appended", len(records))
+        for callback in list(self._listeners):
+            callback(records)
+
+    @metrics.timed("store.replace_records")
+    def replace_records(self, match, record):
+        """match の項目がすべて一致する登録データを record 1件に置き換える（上書き登録用）
+
+        match は {"product_name": ..., "lot_no": ...} のような項目名と値の辞書で、
+        編集・削除（record_log.py）を反映した最新の版と比べる。
+        ファイル全体を書き直すため、件数に比例した時間がかかる。
+        一致するデータがない場合は追記する。
+
+        最初に一致したデータの record_id を引き継いで版番号を上げ、残りの一致したデータは削除する。
+        追記通知には、置き換えを編集・削除の記録の形で渡す（一致しない場合は追記したデータ）。
+        通知した内容を返す。
+        """
+        from record_log import OP_UPDATE, collect_overrides, is_log_entry, record_id, resolve, tombstone
+
+        with self._rewrite_lock, self._lock:
+            records = self.load_records()
+            start = self._end_position_locked() if records else None
+            overrides = collect_overrides(records)
+            current = {}
+            for version in resolve(records, overrides):
+                if all(version.get(key) == value for key, value in match.items()):
+                    current[record_id(version)] = version
+            if not current:
+                # 一致するデータがない場合はロックを外して追記する
+                changes = None
+            else:
+                revisions = {}
+                for entry in records:
+                    rid = record_id(entry)
+                    if rid in current:
+                        revisions[rid] = max(revisions.get(rid, 0), entry.get("revision", 0))
+                kept = next(iter(current))
+                record["record_id"] = kept
+                record["revision"] = revisions[kept] + 1
+                replaced = []
+                placed = False
+                for entry in records:
+                    rid = record_id(entry)
+                    if rid not in current:
+                        replaced.append(entry)
+                    elif rid == kept and not is_log_entry(entry) and not placed:
+                        # 最初に一致した位置に新しいデータを置き、置き換えたデータの記録は除く
+                        replaced.append(record)
+                        placed = True
+                self._rewrite(replaced)
+                changes = [tombstone(current[rid], revisions[rid] + 1) for rid in current if rid != kept]
+                changes.append({"op": OP_UPDATE, **record})
+                end = self._end_position_locked()
+                for hook in list(self._write_hooks):
+                    hook(self, changes, start, end, match)
+        if changes is None:
+            self.append_record(record)
+            return [record]
+
+        for callback in list(self._listeners):
+            callback(changes)
+        return changes
+
+    @metrics.timed("store.extract_records")
+    def extract_records(self, predicate, handler):
+        """predicate に一致する登録データを取り出してファイルから削除する（書庫への移動用）
+
+        取り出したデータのリストを handler に渡し、handler が例外を出さなかった場合だけ削除する。
+        取り出した件数を返す。読み込みと handler の処理はロックの外で行い、ロックを持つのは
+        その間に追記された部分を写して置き換えるとき（rewrite_prefix）だけのため、登録を止めない。
+        """
+        with self._rewrite_lock:
+            position = self.end_position()
+            if position is None:
+                return 0
+            check = self._bytes_before(position)
+            extracted = []
+            remaining = []
+            for record in self.iter_records_until(position):
+                (extracted if predicate(record) else remaining).append(record)
+            if not extracted:
+                return 0
+            handler(extracted)
+            if not self.rewrite_prefix(position, remaining, check):
+                raise RuntimeError(
+                    f"{self.path} が他のプロセスで書き直されたため、取り出したデータを削除できませんでした。"
+                )
+        return len(extracted)
+
+    def _bytes_before(self, position, size=64):
+        """position 直前のバイト列（rewrite_prefix() の check に使う）"""
+        with open(self.path, "rb") as f:
+            f.seek(max(0, position - size))
+            return f.read(min(position, size))
+
+    @metrics.timed("store.rewrite_prefix")
+    def rewrite_prefix(self, position, records, check):
+        """ファイルの先頭から position までを records に置き換える（それより後の追記はそのまま残す）
+
+        records の書き込みはロックの外で行い、ロックを持つのは position より後の部分を
+        写して置き換える間だけのため、その間も追記を止めない。check は position 直前の
+        バイト列で、ファイルがその間に書き直されていた場合は置き換えずに False を返す。
+        """
+        body = ",\n".join(_format_record(r) for r in records).encode("utf-8")
+        tmp_path = self.path + ".prefix.tmp"
+        with self._rewrite_lock:
+            with open(tmp_path, "wb") as f:
+                f.write(b"[\n" + body if body else b"[")
+            with self._lock:
+                with open(self.path, "rb") as f:
+                    f.seek(max(0, position - len(check)))
+                    if f.read(len(check)) != check:
+                        os.remove(tmp_path)
+                        return False
+                    rest = f.read().lstrip()
+                with open(tmp_path, "ab") as f:
+                    if not body:
+                        f.write(rest.lstrip(b","))
+                    elif rest.startswith(b"]"):
+                        f.write(b"\n" + rest)
+                    else:
+                        f.write(rest)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+        return True
+
+    def _rewrite(self, records):
+        """ファイル全体を書き直す（書き込み途中のファイルを読まれないよう置き換える）"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json_codec().dumps_pretty(records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _find_array_end(self, f):
+        """配列末尾の書き込み位置と、配列が空かどうかを返す"""
+        size = f.seek(0, os.SEEK_END)
+        start = max(0, size - _TAIL_READ_SIZE)
+        f.seek(start)
+        tail = f.read()
+
+        close_pos = tail.rfind(b"]")
+        if close_pos < 0:
+            raise ValueError(f"{self.path} はJSON配列ではありません。")
+
+        # 「]」の直前の空白を飛ばして、最後の要素の終わりを探す
+        end = len(tail[:close_pos].rstrip())
+        if end == 0 and start > 0:
+            raise ValueError(f"{self.path} の末尾を解析できません。")
+        is_empty = end > 0 and tail[end - 1:end] == b"["
+        return start + end, is_empty
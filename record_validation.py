@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+入力規則チェックモジュール
+画面入力・一括インポートなどで共通の入力規則を適用する
+"""
+import json
+import math
+import re
+from datetime import datetime
+
+# 日付として受け付ける書式（ファイル取込時）
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%Y%m%d"]
+DATETIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M"]
+TIME_FORMATS = ["%H:%M", "%H:%M:%S"]
+
+
+def validate_value(field, value):
+    """入力規則に従って値をチェックし、エラーメッセージのリストを返す"""
+    label_name = field.get("label_name", "")
+    data_type = field.get("data_type", "文字列")
+    is_required = field.get("is_required", False)
+    errors = []
+
+    if data_type == "数値":
+        # 未入力(None)は下の必須チェックに任せる
+        if isinstance(value, float) and not math.isfinite(value):
+            errors.append(f"「{label_name}」は数値で入力してください。")
+            return errors
+        # 数値の範囲チェック
+        min_val = field.get("min_value")
+        max_val = field.get("max_value")
+        if value is not None and min_val is not None and value < min_val:
+            errors.append(f"「{label_name}」は{min_val}以上で入力してください。")
+        if value is not None and max_val is not None and value > max_val:
+            errors.append(f"「{label_name}」は{max_val}以下で入力してください。")
+
+    elif data_type == "表形式":
+        if is_required and not value:
+            errors.append(f"「{label_name}」は最低1行入力してください。")
+        return errors
+
+    elif data_type in ["文字列", "パスワード"]:
+        # 正規表現チェック
+        regex_pattern = field.get("regex_pattern", "")
+        if regex_pattern and value:
+            try:
+                if not re.match(regex_pattern, value):
+                    errors.append(f"「{label_name}」の形式が正しくありません。")
+            except re.error:
+                pass  # 正規表現のエラーは無視
+
+    # 必須チェック（数値の0は有効な値として扱う）
+    if is_required:
+        if value is None or (isinstance(value, str) and not value.strip()):
+            errors.append(f"「{label_name}」は必須項目です。")
+
+    return errors
+
+
+def _parse_with_formats(text, formats):
+    """いずれかの書式で解釈できた datetime を返す"""
+    for fmt in formats:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _finite_number(label_name, number):
+    """nan・inf を数値として受け付けない (値, エラー) を返す"""
+    if not math.isfinite(number):
+        return None, f"「{label_name}」は数値で入力してください。"
+    return number, None
+
+
+def convert_value(field, raw):
+    """文字列の入力値をデータ型に応じて変換する (値, エラー) を返す"""
+    label_name = field.get("label_name", "")
+    data_type = field.get("data_type", "文字列")
+
+    # APIなどから型付きの値で渡された場合はそのまま使う
+    if data_type == "表形式" and isinstance(raw, list):
+        return raw, None
+    if data_type == "数値" and isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        return _finite_number(label_name, float(raw))
+
+    text = "" if raw is None else str(raw).strip()
+
+    if data_type == "数値":
+        # 空欄は0ではなく未入力(None)として扱い、必須かどうかは validate_value で判定する
+        if not text:
+            return None, None
+        try:
+            number = float(text.replace(",", ""))
+        except ValueError:
+            return None, f"「{label_name}」は数値で入力してください。"
+        return _finite_number(label_name, number)
+
+    if data_type == "日付":
+        if not text:
+            return "", None
+        dt = _parse_with_formats(text, DATE_FORMATS)
+        if dt is None:
+            return None, f"「{label_name}」の日付形式が正しくありません。"
+        return dt.strftime("%Y-%m-%d"), None
+
+    if data_type == "日付時刻":
+        if not text:
+            return "", None
+        dt = _parse_with_formats(text, DATETIME_FORMATS)
+        if dt is None:
+            return None, f"「{label_name}」の日付時刻形式が正しくありません。"
+        return dt.strftime("%Y-%m-%d %H:%M:%S"), None
+
+    if data_type == "時刻":
+        if not text:
+            return "", None
+        dt = _parse_with_formats(text, TIME_FORMATS)
+        if dt is None:
+            return None, f"「{label_name}」の時刻形式が正しくありません。"
+        return dt.strftime("%H:%M"), None
+
+    if data_type == "表形式":
+        if not text:
+            return [], None
+        try:
+            rows = json.loads(text)
+        except ValueError:
+            return None, f"「{label_name}」はJSON配列で入力してください。"
+        if not isinstance(rows, list):
+            return None, f"「{label_name}」はJSON配列で入力してください。"
+        return rows, None
+
+    # 文字列またはパスワード
+    max_length = field.get("max_length", 255)
+    if max_length and len(text) > max_length:
+        return None, f"「{label_name}」は{max_length}文字以内で入力してください。"
+    return text, None
+
+
+def build_record(config, entry_date, product_name, lot_no, raw_details):
+    """文字列の入力値から登録データを組み立てる (データ, エラー一覧) を返す"""
+    errors = []
+    product_name = (product_name or "").strip()
+    lot_no = (lot_no or "").strip()
+    if not product_name or not lot_no:
+        errors.append("品種と製造ロット番号を入力してください。")
+
+    entry_date_text = (entry_date or "").strip()
+    dt = _parse_with_formats(entry_date_text, DATE_FORMATS) if entry_date_text else None
+    if dt is None:
+        errors.append("日付の形式が正しくありません。")
+
+    detail_values = {}
+    for field in config:
+        label_name = field.get("label_name", "")
+        value, error = convert_value(field, raw_details.get(label_name))
+        if error:
+            errors.append(error)
+            continue
+        errors.extend(validate_value(field, value))
+        detail_values[label_name] = value
+
+    if errors:
+        return None, errors
+
+    return {
+        "entry_date": dt.strftime("%Y-%m-%d"),
+        "product_name": product_name,
+        "lot_no": lot_no,
+        "details": detail_values,
+        "registered_at": datetime.now().isoformat()
+    }, []
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+レポート作成ダイアログ (PySide6版)
+種類・対象の絞り込み・出力形式を選んで日報・検査成績書を作成する（作成は report_generator.py）
+"""
+import os
+
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLabel, QLineEdit, QPushButton,
+    QComboBox, QFileDialog, QMessageBox, QProgressBar, QDateEdit, QCheckBox
+)
+from PySide6.QtCore import QThread, Signal, QDate, QUrl
+from PySide6.QtGui import QDesktopServices
+
+from report_generator import REPORT_TYPES, FORMATS, REPORT_DIR, generate_reports
+
+
+class ReportWorker(QThread):
+    """バックグラウンドでレポートを作成するスレッド"""
+
+    progressed = Signal(int, int)
+    finished_reports = Signal(dict)
+    failed = Signal(str)
+
+    def __init__(self, kind, output_format, output_dir, conditions, parent=None):
+        super().__init__(parent)
+        self.kind = kind
+        self.output_format = output_format
+        self.output_dir = output_dir
+        self.conditions = conditions
+        self._cancelled = False
+
+    def cancel(self):
+        """作成を中断（作成中のレポートは完了する）"""
+        self._cancelled = True
+
+    def run(self):
+        try:
+            summary = generate_reports(
+                self.kind, output_format=self.output_format, output_dir=self.output_dir,
+                progress=self.progressed.emit, cancelled=lambda: self._cancelled, **self.conditions
+            )
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.finished_reports.emit(summary)
+
+
+class ReportDialog(QDialog):
+    """日報・検査成績書の作成ダイアログ"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.worker = None
+        self.init_ui()
+
+    def init_ui(self):
+        """UIの初期化"""
+        self.setWindowTitle("レポート作成")
+        self.setModal(True)
+        self.resize(520, 380)
+
+        layout = QVBoxLayout()
+        form = QFormLayout()
+
+        self.kind_combo = QComboBox()
+        for key, name in REPORT_TYPES.items():
+            self.kind_combo.addItem(name, key)
+        form.addRow("種類:", self.kind_combo)
+
+        # 期間（日付で絞り込まない場合は全期間）
+        date_layout = QHBoxLayout()
+        self.date_check = QCheckBox("期間を指定")
+        self.date_check.setChecked(True)
+        date_layout.addWidget(self.date_check)
+        today = QDate.currentDate()
+        self.date_from_edit = QDateEdit(today.addDays(-7))
+        self.date_to_edit = QDateEdit(today)
+        for edit in (self.date_from_edit, self.date_to_edit):
+            edit.setCalendarPopup(True)
+            edit.setDisplayFormat("yyyy-MM-dd")
+            self.date_check.toggled.connect(edit.setEnabled)
+        date_layout.addWidget(self.date_from_edit)
+        date_layout.addWidget(QLabel("〜"))
+        date_layout.addWidget(self.date_to_edit)
+        form.addRow("期間:", date_layout)
+
+        self.product_input = QLineEdit()
+        self.product_input.setPlaceholderText("空欄ですべての品種")
+        form.addRow("品種:", self.product_input)
+
+        self.lot_prefix_input = QLineEdit()
+        self.lot_prefix_input.setPlaceholderText("ロット番号の先頭（空欄ですべて）")
+        form.addRow("ロット番号:", self.lot_prefix_input)
+
+        self.format_combo = QComboBox()
+        self.format_combo.addItems([f.upper() for f in FORMATS])
+        form.addRow("出力形式:", self.format_combo)
+
+        dir_layout = QHBoxLayout()
+        self.dir_input = QLineEdit(os.path.abspath(REPORT_DIR))
+        dir_layout.addWidget(self.dir_input)
+        browse_btn = QPushButton("📂 参照")
+        browse_btn.clicked.connect(self.select_directory)
+        dir_layout.addWidget(browse_btn)
+        form.addRow("出力先:", dir_layout)
+        layout.addLayout(form)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        button_layout = QHBoxLayout()
+        self.create_btn = QPushButton("📄 作成開始")
+        self.create_btn.setStyleSheet("background-color: #4CAF50; color: white; padding: 10px; font-size: 14px;")
+        self.create_btn.clicked.connect(self.start_reports)
+        button_layout.addWidget(self.create_btn)
+
+        self.open_btn = QPushButton("📂 出力先を開く")
+        self.open_btn.clicked.connect(self.open_output_dir)
+        button_layout.addWidget(self.open_btn)
+
+        self.close_btn = QPushButton("閉じる")
+        self.close_btn.clicked.connect(self.close_dialog)
+        button_layout.addWidget(self.close_btn)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+    def select_directory(self):
+        """出力先フォルダを選択"""
+        path = QFileDialog.getExistingDirectory(self, "出力先を選択", self.dir_input.text())
+        if path:
+            self.dir_input.setText(path)
+
+    def current_conditions(self):
+        """入力された絞り込み条件"""
+        conditions = {
+            "product_name": self.product_input.text(),
+            "lot_prefix": self.lot_prefix_input.text(),
+        }
+        if self.date_check.isChecked():
+            conditions["date_from"] = self.date_from_edit.date().toString("yyyy-MM-dd")
+            conditions["date_to"] = self.date_to_edit.date().toString("yyyy-MM-dd")
+        return conditions
+
+    def start_reports(self):
+        """作成を開始"""
+        self.create_btn.setEnabled(False)
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setVisible(True)
+        self.status_label.setText("作成中...")
+
+        self.worker = ReportWorker(
+            self.kind_combo.currentData(), self.format_combo.currentText().lower(),
+            self.dir_input.text(), self.current_conditions(), self
+        )
+        self.worker.progressed.connect(self.on_progress)
+        self.worker.finished_reports.connect(self.on_finished)
+        self.worker.failed.connect(self.on_failed)
+        self.worker.start()
+
+    def on_progress(self, done, total):
+        """進捗表示を更新"""
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        self.status_label.setText(f"作成済み: {done}/{total}件")
+
+    def on_finished(self, summary):
+        """作成完了"""
+        self.progress_bar.setVisible(False)
+        self.create_btn.setEnabled(True)
+        message = f"作成: {summary['generated']}件 / 変更なし: {summary['skipped']}件"
+        self.status_label.setText(message)
+        if not summary["generated"] and not summary["skipped"]:
+            message = "条件に一致する登録データがありません。"
+        QMessageBox.information(self, "作成完了", message)
+
+    def on_failed(self, message):
+        """作成失敗"""
+        self.progress_bar.setVisible(False)
+        self.create_btn.setEnabled(True)
+        self.status_label.setText("")
+        QMessageBox.warning(self, "作成エラー", f"レポートを作成できませんでした。\n{message}")
+
+    def open_output_dir(self):
+        """出力先フォルダを開く"""
+        path = os.path.join(self.dir_input.text(), self.kind_combo.currentData())
+        if not os.path.isdir(path):
+            path = self.dir_input.text()
+        QDesktopServices.openUrl(QUrl.fromLocalFile(path))
+
+    def close_dialog(self):
+        """作成中の場合は中断してから閉じる"""
+        if self.worker and self.worker.isRunning():
+            self.worker.cancel()
+            self.worker.wait()
+        self.accept()
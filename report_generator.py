@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+レポート作成モジュール
+登録データとフォーム設定から、品種ごとの日報とロットごとの検査成績書をHTML/PDFで作成する
+
+- 日報 (daily)      : 日付・品種ごとに1ファイル。その日のロットごとの測定値と集計
+- 成績書 (lot)      : 品種・ロット番号ごとに1ファイル。測定値・集計と規格（最小値・最大値）の判定
+
+レポートはロットごとの部分（断片）を組み合わせて作る。断片は内容（フォーム設定と登録データ）の
+ハッシュをキーにキャッシュし、変更のないロットは作り直さない。出力済みのファイルも内容が同じなら
+書き直さない。作成するファイルが多い場合はプロセスプールで並列に作成する。
+
+使い方:
+    python report_generator.py daily --date-from 2024-04-01 --date-to 2024-04-30
+    python report_generator.py lot --product 製品A --format pdf
+"""
+import argparse
+import hashlib
+import html
+import math
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from record_store import get_store, load_form_config
+from record_query import normalize_query
+from query_cache import get_query_cache
+from record_codec import json_codec, load_json_file, save_json_file
+
+REPORT_DIR = "reports"
+CACHE_DIR_NAME = ".cache"
+OUTPUTS_FILE = "outputs.json"
+
+REPORT_TYPES = {
+    "daily": "日報",
+    "lot": "検査成績書",
+}
+FORMATS = ["html", "pdf"]
+
+# テンプレートを変更したら上げる（キャッシュした断片を使わなくなる）
+TEMPLATE_VERSION = 1
+# この件数以上のファイルを作成するときはプロセスプールを使う
+PARALLEL_THRESHOLD = 8
+
+_STYLE = """
+@page { size: A4; margin: 15mm; }
+body { font-family: "Yu Gothic", "Meiryo", "Noto Sans CJK JP", sans-serif; font-size: 10pt; color: #222; }
+h1 { font-size: 16pt; border-bottom: 2px solid #333; padding-bottom: 4px; }
+h2 { font-size: 12pt; margin-top: 18px; }
+table { border-collapse: collapse; width: 100%; margin: 6px 0 12px; }
+th, td { border: 1px solid #999; padding: 3px 6px; text-align: left; }
+th { background: #eee; }
+td.num { text-align: right; }
+.ng { color: #c62828; font-weight: bold; }
+.meta { color: #555; }
+section { page-break-inside: avoid; }
+"""
+
+
+def _load_weasyprint():
+    """PDF出力用ライブラリを読み込む"""
+    try:
+        import weasyprint
+    except ImportError:
+        raise RuntimeError("PDF出力には weasyprint が必要です。(pip install weasyprint)")
+    return weasyprint
+
+
+def _escape(value):
+    return html.escape("" if value is None else str(value))
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    if isinstance(value, list):
+        return " / ".join(_format_value(v) for v in value)
+    return "" if value is None else str(value)
+
+
+def _safe_name(text):
+    """ファイル名に使えない文字を置き換える"""
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", str(text)).strip("_") or "_"
+
+
+def _numeric(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return None
+
+
+def _spec(field):
+    """数値項目の規格 (最小値, 最大値)（未設定は None）"""
+    return field.get("min_value"), field.get("max_value")
+
+
+def _in_spec(value, spec):
+    low, high = spec
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def fragment_key(kind, config, title, records):
+    """断片のキャッシュキー（テンプレートの版・フォーム設定・登録データから求める）"""
+    data = json_codec().dumps([TEMPLATE_VERSION, kind, config, title, records])
+    return hashlib.sha1(data).hexdigest()
+
+
+def render_lot_fragment(kind, config, title, records):
+    """ロット1つ分の断片（測定値の表と数値項目の集計）"""
+    labels = [field.get("label_name", "") for field in config]
+    units = {field.get("label_name", ""): field.get("unit", "") for field in config}
+    numeric_fields = [field for field in config if field.get("data_type") == "数値"]
+
+    parts = [f"<section><h2>{_escape(title)}</h2>"]
+
+    # 測定値
+    parts.append("<table><tr><th>日付</th><th>登録日時</th>")
+    for label in labels:
+        unit = f" ({units[label]})" if units[label] else ""
+        parts.append(f"<th>{_escape(label + unit)}</th>")
+    parts.append("</tr>")
+    for record in records:
+        details = record.get("details") or {}
+        parts.append(f"<tr><td>{_escape(record.get('entry_date'))}</td>"
+                     f"<td>{_escape(str(record.get('registered_at') or '')[:19])}</td>")
+        for field in config:
+            value = details.get(field.get("label_name", ""))
+            number = _numeric(value)
+            if number is not None:
+                css = "num" if _in_spec(number, _spec(field)) else "num ng"
+                parts.append(f'<td class="{css}">{_escape(_format_value(value))}</td>')
+            else:
+                parts.append(f"<td>{_escape(_format_value(value))}</td>")
+        parts.append("</tr>")
+    parts.append("</table>")
+
+    # 数値項目の集計（成績書は規格と判定も表示）
+    if numeric_fields:
+        spec_columns = "<th>規格</th><th>判定</th>" if kind == "lot" else ""
+        parts.append(f"<table><tr><th>項目</th><th>件数</th><th>平均</th><th>最小</th><th>最大</th>"
+                     f"<th>標準偏差</th>{spec_columns}</tr>")
+        for field in numeric_fields:
+            label = field.get("label_name", "")
+            values = [v for v in (_numeric((r.get("details") or {}).get(label)) for r in records) if v is not None]
+            parts.append(f"<tr><td>{_escape(label)}</td><td class=\"num\">{len(values)}</td>")
+            if values:
+                mean = math.fsum(values) / len(values)
+                sd = math.sqrt(math.fsum((v - mean) ** 2 for v in values) / (len(values) - 1)) if len(values) > 1 else 0.0
+                for stat in (mean, min(values), max(values), sd):
+                    parts.append(f'<td class="num">{_format_value(stat)}</td>')
+            else:
+                parts.append("<td></td>" * 4)
+            if kind == "lot":
+                low, high = _spec(field)
+                spec_text = f"{'' if low is None else low} 〜 {'' if high is None else high}" \
+                    if low is not None or high is not None else "-"
+                ok = all(_in_spec(v, (low, high)) for v in values)
+                verdict = "合格" if ok else '<span class="ng">不合格</span>'
+                parts.append(f"<td>{_escape(spec_text)}</td><td>{verdict}</td>")
+            parts.append("</tr>")
+        parts.append("</table>")
+
+    parts.append("</section>")
+    return "".join(parts)
+
+
+def render_document(title, subtitle, fragments):
+    """断片をまとめてHTML文書にする"""
+    return (
+        '<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8">'
+        f"<title>{_escape(title)}</title><style>{_STYLE}</style></head><body>"
+        f"<h1>{_escape(title)}</h1><p class=\"meta\">{_escape(subtitle)}</p>"
+        + "".join(fragments)
+        + "</body></html>"
+    )
+
+
+class FragmentCache:
+    """レンダリング済みの断片のキャッシュ（キーごとに1ファイル）"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".html")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key, fragment):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(fragment)
+        os.replace(tmp_path, path)
+
+
+def plan_reports(kind, records, config):
+    """作成するレポートの一覧 [(ファイル名, 表題, 副題, [(断片の表題, 登録データ), ...]), ...]"""
+    groups = OrderedDict()
+    if kind == "daily":
+        for record in records:
+            key = (record.get("entry_date", ""), record.get("product_name", ""))
+            groups.setdefault(key, OrderedDict()).setdefault(record.get("lot_no", ""), []).append(record)
+        plans = []
+        for (entry_date, product), lots in sorted(groups.items()):
+            count = sum(len(r) for r in lots.values())
+            plans.append((
+                f"{_safe_name(entry_date)}_{_safe_name(product)}",
+                f"{REPORT_TYPES['daily']} {entry_date} {product}",
+                f"ロット数: {len(lots)} / 登録件数: {count}",
+                [(f"ロット番号: {lot}", lot_records) for lot, lot_records in lots.items()],
+            ))
+        return plans
+
+    for record in records:
+        key = (record.get("product_name", ""), record.get("lot_no", ""))
+        groups.setdefault(key, []).append(record)
+    plans = []
+    for (product, lot), lot_records in sorted(groups.items()):
+        dates = sorted({r.get("entry_date", "") for r in lot_records})
+        period = dates[0] if len(dates) == 1 else f"{dates[0]} 〜 {dates[-1]}"
+        plans.append((
+            f"{_safe_name(product)}_{_safe_name(lot)}",
+            f"{REPORT_TYPES['lot']} {product} ロット {lot}",
+            f"製造日: {period} / 登録件数: {len(lot_records)}",
+            [(f"品種: {product} / ロット番号: {lot}", lot_records)],
+        ))
+    return plans
+
+
+def build_report(kind, config, cache_dir, output_path, output_format, title, subtitle, sections):
+    """レポート1件を作成する（プロセスプールで実行）
+
+    sections は [(断片のキー, 断片の表題, 登録データ), ...]。キャッシュにない断片だけをレンダリングする。
+    戻り値は (出力先, レンダリングした断片の数)。
+    """
+    cache = FragmentCache(cache_dir)
+    fragments = []
+    rendered = 0
+    for key, section_title, records in sections:
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = render_lot_fragment(kind, config, section_title, records)
+            cache.put(key, fragment)
+            rendered += 1
+        fragments.append(fragment)
+
+    document = render_document(title, subtitle, fragments)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    if output_format == "pdf":
+        _load_weasyprint().HTML(string=document).write_pdf(tmp_path)
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(document)
+    os.replace(tmp_path, output_path)
+    return output_path, rendered
+
+
+def generate_reports(kind, store=None, config=None, output_format="html", output_dir=REPORT_DIR,
+                     workers=None, progress=None, cancelled=None, **conditions):
+    """レポートを作成し、結果の集計を返す
+
+    conditions: 対象の絞り込み（product_name, lot_no, lot_prefix, date_from, date_to）
+    progress: レポート1件ごとに (処理済み件数, 全件数) で呼ばれる
+    cancelled: True を返すと残りのレポートを作成せずに終了する
+    """
+    if kind not in REPORT_TYPES:
+        raise ValueError(f"未対応のレポートです: {kind}")
+    if output_format not in FORMATS:
+        raise ValueError(f"未対応の出力形式です: {output_format}")
+    if output_format == "pdf":
+        _load_weasyprint()
+
+    store = store or get_store()
+    config = load_form_config() if config is None else config
+    query = normalize_query(**conditions)
+    started = time.perf_counter()
+
+    records = get_query_cache(store).query(query)
+    cache_dir = os.path.join(output_dir, CACHE_DIR_NAME)
+    outputs_path = os.path.join(cache_dir, OUTPUTS_FILE)
+    outputs = load_json_file(outputs_path, {})
+
+    # 内容が変わっていないレポートは作り直さない
+    jobs = []
+    skipped = 0
+    for name, title, subtitle, sections in plan_reports(kind, records, config):
+        keyed = [(fragment_key(kind, config, t, rs), t, rs) for t, rs in sections]
+        output_path = os.path.join(output_dir, kind, f"{name}.{output_format}")
+        digest = hashlib.sha1("".join([title, subtitle] + [k for k, _, _ in keyed]).encode("utf-8")).hexdigest()
+        if outputs.get(output_path) == digest and os.path.exists(output_path):
+            skipped += 1
+            continue
+        jobs.append((digest, (kind, config, cache_dir, output_path, output_format, title, subtitle, keyed)))
+
+    summary = {"generated": 0, "skipped": skipped, "fragments": 0, "outputs": [], "elapsed": 0.0}
+    total = len(jobs) + skipped
+    done = skipped
+
+    def collect(digest, result):
+        nonlocal done
+        output_path, rendered = result
+        outputs[output_path] = digest
+        summary["generated"] += 1
+        summary["fragments"] += rendered
+        summary["outputs"].append(output_path)
+        done += 1
+        if progress:
+            progress(done, total)
+
+    try:
+        if len(jobs) < PARALLEL_THRESHOLD or workers == 1:
+            for digest, args in jobs:
+                if cancelled and cancelled():
+                    break
+                collect(digest, build_report(*args))
+        else:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+                futures = [(digest, executor.submit(build_report, *args)) for digest, args in jobs]
+                for digest, future in futures:
+                    if cancelled and cancelled():
+                        for _, f in futures:
+                            f.cancel()
+                        break
+                    collect(digest, future.result())
+    finally:
+        os.makedirs(cache_dir, exist_ok=True)
+        save_json_file(outputs_path, outputs)
+
+    summary["elapsed"] = time.perf_counter() - started
+    return summary
+
+
+def main(argv=None):
+    """コマンドラインからレポートを作成"""
+    parser = argparse.ArgumentParser(description="登録データから日報・検査成績書を作成します。")
+    parser.add_argument("kind", choices=list(REPORT_TYPES), help="daily: 日報 / lot: 検査成績書")
+    parser.add_argument("--format", choices=FORMATS, default="html", help="出力形式（pdf は weasyprint が必要）")
+    parser.add_argument("--output-dir", default=REPORT_DIR, help="出力先フォルダ")
+    parser.add_argument("--product", default=None, help="品種")
+    parser.add_argument("--lot", default=None, help="ロット番号")
+    parser.add_argument("--lot-prefix", default=None, help="ロット番号の先頭")
+    parser.add_argument("--date-from", default=None, help="開始日 (YYYY-MM-DD)")
+    parser.add_argument("--date-to", default=None, help="終了日 (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=None, help="作成に使うプロセス数")
+    args = parser.parse_args(argv)
+
+    def report_progress(done, total):
+        print(f"\r作成済み: {done}/{total}件", end="", flush=True)
+
+    try:
+        summary = generate_reports(
+            args.kind, output_format=args.format, output_dir=args.output_dir, workers=args.workers,
+            progress=report_progress, product_name=args.product, lot_no=args.lot,
+            lot_prefix=args.lot_prefix, date_from=args.date_from, date_to=args.date_to,
+        )
+    except (RuntimeError, ValueError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    print()
+    print(f"作成: {summary['generated']}件 / 変更なし: {summary['skipped']}件 "
+          f"({summary['elapsed']:.1f}秒)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
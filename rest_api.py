@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録データAPI
+画面を使わずに登録データの一括登録と検索を行うHTTPサーバー
+
+MES・PLCゲートウェイなどから検査データを送るために使う。
+登録データは現在のフォーム設定の入力規則でチェックし、入力画面と同じ保存先に書き込む。
+検索結果は1行1件のJSON (NDJSON) で少しずつ返すため、件数が多くても全件をメモリに載せない。
+
+    POST /records                登録（JSON配列、{"records": [...]}、またはNDJSON）
+                                 ?atomic=1 で1件でもエラーがあれば1件も登録しない
+    GET  /records?product=&lot=&lot_prefix=&date_from=&date_to=&offset=&limit=
+                                 検索（NDJSON）
+    GET  /form                   現在のフォーム設定
+    GET  /health                 動作確認
+
+登録データの形式:
+    {"entry_date": "2024-01-15", "product_name": "製品A", "lot_no": "LOT001",
+     "details": {"温度": 25.3, "備考": "..."}}
+
+使い方:
+    python rest_api.py --port 8080
+"""
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from record_store import CONFIG_FILE, get_store, load_form_config
+from record_validation import build_record
+from record_query import normalize_query, iter_query
+from query_cache import get_query_cache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# 1回の要求で受け付ける最大サイズ（バイト）
+MAX_BODY_SIZE = 64 * 1024 * 1024
+# 検索結果の1回の送信にまとめる件数
+STREAM_BATCH_SIZE = 500
+
+
+class ApiError(Exception):
+    """要求の誤り（HTTPステータスとメッセージを持つ）"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def parse_records_body(body, content_type):
+    """要求本文から登録データのリストを取り出す"""
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise ApiError(400, "UTF-8で送ってください。")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        try:
+            return [json.loads(line) for line in text.splitlines() if line.strip()]
+        except ValueError:
+            raise ApiError(400, "NDJSONとして解釈できません。")
+
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        raise ApiError(400, "JSONとして解釈できません。")
+    if isinstance(payload, dict):
+        payload = payload.get("records")
+    if not isinstance(payload, list):
+        raise ApiError(400, "登録データの配列を送ってください。")
+    return payload
+
+
+def validate_records(config, items):
+    """登録データを入力規則でチェックする (登録するデータ, エラー一覧) を返す"""
+    records = []
+    rejected = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            rejected.append({"index": index, "errors": ["登録データはオブジェクトで送ってください。"]})
+            continue
+        details = item.get("details") or {}
+        if not isinstance(details, dict):
+            rejected.append({"index": index, "errors": ["details はオブジェクトで送ってください。"]})
+            continue
+        record, errors = build_record(
+            config,
+            str(item.get("entry_date") or ""),
+            str(item.get("product_name") or ""),
+            str(item.get("lot_no") or ""),
+            details,
+        )
+        if errors:
+            rejected.append({"index": index, "errors": errors})
+        else:
+            records.append(record)
+    return records, rejected
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """登録データAPIの要求処理"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "EFormAPI/1.0"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            if url.path == "/records":
+                self.stream_records(parse_qs(url.query))
+            elif url.path == "/form":
+                self.send_json(200, load_form_config(self.server.config_file))
+            elif url.path == "/health":
+                self.send_json(200, {"ok": True})
+            else:
+                raise ApiError(404, "見つかりません。")
+        except ApiError as e:
+            self.send_json(e.status, {"error": e.message})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            if url.path != "/records":
+                raise ApiError(404, "見つかりません。")
+            self.post_records(parse_qs(url.query))
+        except ApiError as e:
+            self.send_json(e.status, {"error": e.message})
+
+    def post_records(self, params):
+        """登録データを一括で登録"""
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            raise ApiError(400, "Content-Length が正しくありません。")
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            raise ApiError(413, "送信データが大きすぎます。")
+        body = self.rfile.read(length)
+        items = parse_records_body(body, self.headers.get("Content-Type", ""))
+
+        config = load_form_config(self.server.config_file)
+        records, rejected = validate_records(config, items)
+        atomic = params.get("atomic", ["0"])[0] not in ("", "0")
+        if atomic and rejected:
+            self.send_json(422, {"accepted": 0, "rejected": rejected})
+            return
+
+        if records:
+            try:
+                self.server.store.append_records(records)
+            except Exception as e:
+                raise ApiError(500, f"データの保存に失敗しました: {e}")
+        self.send_json(200, {"accepted": len(records), "rejected": rejected})
+
+    def stream_records(self, params):
+        """検索結果をNDJSONで少しずつ返す"""
+        def first(name):
+            values = params.get(name)
+            return values[0] if values else None
+
+        query = normalize_query(
+            product_name=first("product"),
+            lot_no=first("lot"),
+            lot_prefix=first("lot_prefix"),
+            date_from=first("date_from"),
+            date_to=first("date_to"),
+        )
+        try:
+            offset = int(first("offset") or 0)
+            limit = int(first("limit")) if first("limit") else None
+        except ValueError:
+            raise ApiError(400, "offset と limit は整数で指定してください。")
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ApiError(400, "offset と limit は0以上で指定してください。")
+
+        # 書庫へ移した古いデータも合わせて検索（同じ条件の検索結果はキャッシュから返し、
+        # キャッシュにない場合は全件をメモリに載せずに読みながら返す）
+        records = get_query_cache(self.server.store).iter_records(query)
+        results = iter_query(records, query, offset, limit)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        lines = []
+        try:
+            for record in results:
+                lines.append(json.dumps(record, ensure_ascii=False))
+                if len(lines) >= STREAM_BATCH_SIZE:
+                    self.write_chunk("\n".join(lines) + "\n")
+                    lines = []
+            if lines:
+                self.write_chunk("\n".join(lines) + "\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (ConnectionError, ValueError):
+            # 途中で切断された、または読み込み中にファイルが壊れていた
+            self.close_connection = True
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ApiServer(ThreadingHTTPServer):
+    """登録データAPIサーバー（入力画面と同じ保存先を使う）"""
+
+    daemon_threads = True
+
+    def __init__(self, address, store=None, config_file=CONFIG_FILE, verbose=False):
+        super().__init__(address, ApiHandler)
+        self.store = store or get_store()
+        self.config_file = config_file
+        self.verbose = verbose
+
+
+def main(argv=None):
+    """登録データAPIサーバーを起動"""
+    parser = argparse.ArgumentParser(description="登録データの一括登録・検索用のHTTPサーバーを起動します。")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="待ち受けるアドレス（他のPCから使う場合は 0.0.0.0）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="待ち受けるポート番号")
+    parser.add_argument("--verbose", action="store_true", help="要求ごとにログを表示")
+    args = parser.parse_args(argv)
+
+    server = ApiServer((args.host, args.port), verbose=args.verbose)
+    print(f"登録データAPIを起動しました (http://{args.host}:{args.port})。Ctrl+C で終了します。")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
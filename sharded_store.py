@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+品種別の保存先（シャーディング）モジュール
+登録データを品種ごとのファイル（シャード）に分けて保存し、書き込みと品種ごとの検索を分散する
+
+多くの品種を別々のラインで生産する工場では、1つの入力データファイルに全ラインの登録が集中し、
+品種を指定した表示・検索でも全件をたどることになる。シャードごとに RecordStore を持つため、
+別の品種の登録は別のファイル・別のロックに書き込まれ、品種を指定した検索はそのシャードだけを読む。
+品種を指定しない検索は、複数のシャードをプロセスプールで並列に検索する。各プロセスはシャードを
+1件ずつたどり、結果を一定件数ずつ一時ファイルに書き出すため、シャードの大きさや結果の件数が
+増えてもメモリとプロセス間の受け渡しは一定で済む（結果は一時ファイルから1件ずつ読んで並べる）。
+
+品種とシャードのファイルの対応はシャードマップ (shards/shard_map.json) に記録する。
+シャードマップがあると get_store() がこの保存先を返す。
+シャードのファイル名は品種名から求めるため、複数の端末が同じ品種のシャードを同時に作っても
+同じファイルになる。シャードマップへの追加はロックファイルで端末間でも1つずつ行い、
+書き込む直前にファイルから読み直して他の端末が追加した品種を消さないようにする。
+
+編集・削除の記録（record_log.py）は元のデータと同じシャードに書き込む。
+品種を変更する編集は、元のシャードへの削除の記録と、新しいシャードへの次の版の登録として書き込む。
+
+品種別の保存先では、入力データファイル1つを前提にした次の高速化は使われない（使うときに1回だけ警告する）。
+    - 「登録データ」タブのスナップショット（record_snapshot.py）: 表示のたびに全シャードを読み込む
+    - 数値項目の列ストア（column_store.py）: 傾向グラフは全件をたどって値を集める
+
+使い方:
+    python sharded_store.py --split     # input_data.json を品種ごとのシャードに分ける
+    python sharded_store.py             # シャードごとの件数を表示
+"""
+import argparse
+import hashlib
+import heapq
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from record_store import DATA_FILE, RecordStore, new_record_id
+from record_codec import load_json_file, save_json_file
+from record_query import matches
+
+SHARDS_DIR = "shards"
+SHARD_MAP_FILE = "shard_map.json"
+
+# 品種を指定しない検索をプロセスプールで並列に行うシャード数の下限
+PARALLEL_THRESHOLD = 2
+
+# シャードに分けるときにまとめて書き込む件数
+SPLIT_CHUNK_SIZE = 20000
+
+# シャードマップのロックファイルを、異常終了で残ったものとみなすまでの時間（秒）
+MAP_LOCK_STALE_SECONDS = 30
+
+# シャードごとの検索結果を一時ファイルに書き出す件数の単位
+QUERY_SPOOL_CHUNK = 1000
+
+# 品種別の保存先で使われない高速化（警告は機能ごとに1回だけ表示する）
+UNSUPPORTED_FEATURES = {
+    "snapshot": "「登録データ」タブのスナップショットは使われず、表示のたびに全シャードを読み込みます。",
+    "column_store": "数値項目の列ストアは使われず、傾向グラフは全件をたどって値を集めます。",
+}
+_warned = set()
+
+
+def shard_map_path(directory=SHARDS_DIR):
+    return os.path.join(directory, SHARD_MAP_FILE)
+
+
+def shard_name(product_name):
+    """品種のシャードのファイル名（品種名から求めるため、どの端末で作っても同じ）"""
+    digest = hashlib.sha1((product_name or "").encode("utf-8")).hexdigest()[:16]
+    return f"shard-{digest}.json"
+
+
+class _MapLock:
+    """シャードマップを書き換える間の、端末（プロセス）間のロック（ロックファイルを作れた側が持つ）"""
+
+    def __init__(self, directory):
+        self.path = shard_map_path(directory) + ".lock"
+        self._fd = None
+
+    def __enter__(self):
+        while True:
+            try:
+                self._fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > MAP_LOCK_STALE_SECONDS:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    continue  # 他の端末が解放した
+                time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        os.close(self._fd)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _registered_order(record):
+    """シャードをまたいで登録順に並べるキー"""
+    return record.get("registered_at") or ""
+
+
+def warn_unsupported(feature):
+    """品種別の保存先で使われない高速化を標準エラー出力に1回だけ知らせる"""
+    if feature in _warned:
+        return
+    _warned.add(feature)
+    print(f"品種別の保存先（{SHARDS_DIR}/）を使用中のため、{UNSUPPORTED_FEATURES[feature]}", file=sys.stderr)
+
+
+def _query_shard(path, query, overrides, spool_dir):
+    """シャード1つを検索し、結果を書き出した一時ファイルのパスを返す（プロセスプールで実行）
+
+    シャード全体を読み込まずに1件ずつたどり、結果は QUERY_SPOOL_CHUNK 件ずつ書き出す。
+    """
+    from record_log import resolve
+
+    fd, spool_path = tempfile.mkstemp(prefix="query-", suffix=".pickle", dir=spool_dir)
+    with os.fdopen(fd, "wb") as f:
+        chunk = []
+        for record in resolve(RecordStore(path).iter_records(), overrides):
+            if matches(record, query):
+                chunk.append(record)
+                if len(chunk) >= QUERY_SPOOL_CHUNK:
+                    pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    chunk = []
+        if chunk:
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return spool_path
+
+
+def _iter_spool(path):
+    """_query_shard() が書き出した結果を1件ずつ返す"""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+
+class ShardedRecordStore:
+    """品種ごとのシャードに分けた保存先（RecordStore と同じ使い方）"""
+
+    def __init__(self, directory=SHARDS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._write_hooks = []
+        self._shards = {}
+        self._map = {"products": {}}
+        self._map_mtime = None
+        self._refresh_map()
+
+    def add_listener(self, callback):
+        """追記時に呼び出す関数を登録（追記したデータのリストが渡される）"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """登録した関数を解除"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def add_write_hook(self, callback):
+        """各シャードの書き込みのロックの中で呼び出す関数を登録（RecordStore.add_write_hook() と同じ。後から作るシャードにも登録する）"""
+        with self._lock:
+            self._write_hooks.append(callback)
+            for store in self._shards.values():
+                store.add_write_hook(callback)
+
+    # --- シャード ---
+
+    def _store(self, name):
+        store = self._shards.get(name)
+        if store is None:
+            with self._lock:
+                store = self._shards.get(name)
+                if store is None:
+                    store = RecordStore(os.path.join(self.directory, name))
+                    for hook in self._write_hooks:
+                        store.add_write_hook(hook)
+                    self._shards[name] = store
+        return store
+
+    def shard_for(self, product_name, create=False):
+        """品種のシャード（create でない場合、シャードがなければ None）"""
+        product_name = product_name or ""
+        name = self._map["products"].get(product_name)
+        if name is None:
+            # 他の端末が追加していないか読み直す
+            self._refresh_map()
+            name = self._map["products"].get(product_name)
+        if name is None:
+            if not create:
+                return None
+            name = self._add_product(product_name)
+        return self._store(name)
+
+    def store_for(self, record):
+        """登録データが保存されているシャード"""
+        return self.shard_for(record.get("product_name"))
+
+    def shards(self):
+        """すべてのシャード"""
+        self._refresh_map()
+        return [self._store(name) for name in sorted(set(self._map["products"].values()))]
+
+    def products(self):
+        """シャードのある品種"""
+        self._refresh_map()
+        return sorted(self._map["products"])
+
+    def _refresh_map(self):
+        """シャードマップが更新されていれば読み直す（他の端末が追加した品種を取り込む）"""
+        path = shard_map_path(self.directory)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._map_mtime:
+            shard_map = load_json_file(path)
+            if shard_map:
+                self._map, self._map_mtime = shard_map, mtime
+
+    def _add_product(self, product_name):
+        """品種をシャードマップに追加し、シャードのファイル名を返す
+
+        書き込む直前にロックを持ってファイルから読み直すため、他の端末が同時に追加した品種も残る。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = shard_map_path(self.directory)
+        with self._lock, _MapLock(self.directory):
+            shard_map = load_json_file(path) or {"products": {}}
+            name = shard_map["products"].get(product_name)
+            if name is None:
+                name = shard_name(product_name)
+                shard_map = {"products": dict(shard_map["products"], **{product_name: name})}
+                # 書き込み途中のファイルを読まれないよう置き換える
+                save_json_file(path + ".tmp", shard_map)
+                os.replace(path + ".tmp", path)
+            self._map, self._map_mtime = shard_map, os.stat(path).st_mtime_ns
+        return name
+
+    # --- 書き込み ---
+
+    def append_record(self, record):
+        """1件追記"""
+        self.append_records([record])
+
+    def append_records(self, records):
+        """複数件をまとめて追記（品種ごとのシャードに分けて書き込む）"""
+        if not records:
+            return
+        groups = {}
+        for record in records:
+            if not record.get("record_id"):
+                record["record_id"] = new_record_id()
+            groups.setdefault(record.get("product_name") or "", []).append(record)
+        for product_name, group in groups.items():
+            self.shard_for(product_name, create=True).append_records(group)
+        for callback in list(self._listeners):
+            callback(records)
+
+    def replace_records(self, match, record):
+        """match の項目がすべて一致する登録データを record 1件に置き換える（上書き登録用）
+
+        追記通知・戻り値は RecordStore.replace_records() と同じ（置き換えを編集・削除の記録の形で渡す）。
+        品種が変わる場合、元のシャードの一致したデータには削除の記録を追記する。
+        """
+        from record_log import collect_overrides, record_id, resolve, tombstone
+
+        target = self.shard_for(record.get("product_name"), create=True)
+        source = self.shard_for(match.get("product_name", record.get("product_name")))
+        changes = []
+        if source is not None and source is not target:
+            entries = source.load_records()
+            revisions = {}
+            for entry in entries:
+                rid = record_id(entry)
+                revisions[rid] = max(revisions.get(rid, 0), entry.get("revision", 0))
+            changes = [
+                tombstone(version, revisions[record_id(version)] + 1)
+                for version in resolve(entries, collect_overrides(entries))
+                if all(version.get(k) == v for k, v in match.items())
+            ]
+            source.append_records(changes)
+        changes.extend(target.replace_records(match, record))
+        for callback in list(self._listeners):
+            callback(changes)
+        return changes
+
+    def extract_records(self, predicate, handler):
+        """predicate に一致する登録データをシャードごとに取り出して削除する（書庫への移動用）"""
+        return sum(shard.extract_records(predicate, handler) for shard in self.shards())
+
+    # --- 読み込み ---
+
+    def load_records(self):
+        """全シャードの登録データを読み込む（シャードは並列に読み込み、登録順に並べる）"""
+        shards = self.shards()
+        if not shards:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(shards), os.cpu_count() or 1)) as executor:
+            parts = list(executor.map(lambda shard: shard.load_records(), shards))
+        return list(heapq.merge(*parts, key=_registered_order))
+
+    def iter_records(self):
+        """全シャードの登録データを登録順に1件ずつ返す"""
+        return heapq.merge(*(shard.iter_records() for shard in self.shards()), key=_registered_order)
+
+    def iter_resolved(self, archive, query=None):
+        """書庫とシャードから、編集・削除を反映した登録データを返す
+
+        品種を指定した場合はそのシャードだけを読む。指定しない場合は、条件があれば
+        シャードごとの検索をプロセスプールで並列に行う。
+        """
+        from record_log import archive_overrides, get_record_index, resolve
+
+        query = query or {}
+        if "product_name" in query:
+            shard = self.shard_for(query["product_name"])
+            shards = [shard] if shard is not None else []
+        else:
+            shards = self.shards()
+
+        # シャードの記録は書庫の記録も含むため、シャードごとの検索にはそのシャードの分だけを渡す
+        overrides = {} if shards else archive_overrides(archive)
+        shard_overrides = {}
+        for shard in shards:
+            index = get_record_index(shard, archive)
+            index.sync()
+            shard_overrides[shard.path] = dict(index.overrides)
+            for rid, entry in shard_overrides[shard.path].items():
+                latest = overrides.get(rid)
+                if latest is None or latest["revision"] < entry["revision"]:
+                    overrides[rid] = entry
+
+        yield from resolve(archive.iter_records(query), overrides)
+        if query and len(shards) >= PARALLEL_THRESHOLD:
+            workers = min(len(shards), os.cpu_count() or 1)
+            with tempfile.TemporaryDirectory(prefix="shard-query-") as spool_dir:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(_query_shard, shard.path, query, shard_overrides[shard.path], spool_dir)
+                        for shard in shards
+                    ]
+                    paths = [future.result() for future in futures]
+                yield from heapq.merge(*(_iter_spool(path) for path in paths), key=_registered_order)
+            return
+        parts = [resolve(shard.iter_records(), overrides) for shard in shards]
+        yield from heapq.merge(*parts, key=_registered_order)
+
+
+def open_store(data_path=DATA_FILE, directory=SHARDS_DIR):
+    """入力データを直接扱う保存先（シャードマップがあれば品種別の保存先）"""
+    if os.path.exists(shard_map_path(directory)):
+        return ShardedRecordStore(directory)
+    return RecordStore(data_path)
+
+
+def split_into_shards(source, directory=SHARDS_DIR, chunk_size=SPLIT_CHUNK_SIZE):
+    """入力データファイルを品種ごとのシャードに分け、分けた件数を返す
+
+    シャードを書き終えてからシャードマップを書くため、途中で中断した場合は
+    元のファイルが使われ続ける（シャードのフォルダを削除してやり直せる）。
+    """
+    if os.path.exists(shard_map_path(directory)):
+        raise ValueError(f"{directory} はすでにシャードに分けられています。")
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.startswith("shard-"):
+            os.remove(os.path.join(directory, name))
+
+    products = {}
+    groups = {}
+    count = 0
+
+    def flush():
+        for product_name, group in groups.items():
+            RecordStore(os.path.join(directory, products[product_name])).append_records(group)
+        groups.clear()
+
+    pending = 0
+    for record in RecordStore(source).iter_records():
+        product_name = record.get("product_name") or ""
+        if product_name not in products:
+            products[product_name] = shard_name(product_name)
+        groups.setdefault(product_name, []).append(record)
+        pending += 1
+        count += 1
+        if pending >= chunk_size:
+            flush()
+            pending = 0
+    flush()
+
+    save_json_file(shard_map_path(directory) + ".tmp", {"products": products})
+    os.replace(shard_map_path(directory) + ".tmp", shard_map_path(directory))
+    return count
+
+
+def main(argv=None):
+    """品種別の保存先の作成・確認"""
+    parser = argparse.ArgumentParser(description="登録データを品種ごとのシャードに分けて保存します。")
+    parser.add_argument("--split", action="store_true", help="入力データファイルを品種ごとのシャードに分ける")
+    parser.add_argument("--data", default=DATA_FILE, help="入力データファイル")
+    parser.add_argument("--shards-dir", default=SHARDS_DIR, help="シャードのフォルダ")
+    args = parser.parse_args(argv)
+
+    if args.split:
+        if not os.path.exists(args.data):
+            parser.error(f"入力データファイルがありません: {args.data}")
+        try:
+            count = split_into_shards(args.data, args.shards_dir)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        os.replace(args.data, args.data + ".unsharded")
+        print(f"{count}件を品種ごとのシャードに分けました（元のファイルは {args.data}.unsharded に残しました）。")
+        return 0
+
+    if not os.path.exists(shard_map_path(args.shards_dir)):
+        print("シャードに分けられていません（python sharded_store.py --split で分けられます）。")
+        return 0
+    store = ShardedRecordStore(args.shards_dir)
+    for product_name in store.products():
+        shard = store.shard_for(product_name)
+        size = os.path.getsize(shard.path) if os.path.exists(shard.path) else 0
+        print(f"{product_name or '（品種なし）'}: {os.path.basename(shard.path)} ({size / 1e6:.1f}MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+テスト共通設定
+リポジトリ直下のモジュールを import できるようにする
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """入力データファイル・書庫などを置く一時フォルダで実行する"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+入力補完用インデックスのテスト
+一度に多くの値を追加しても、追加した直後から候補に含まれ、別スレッドで本体に統合される
+"""
+import time
+
+from autocomplete_index import PrefixIndex
+
+
+def _wait_merged(index, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while index._lists[1] or index._merging:
+        assert time.monotonic() < deadline, "統合が終わらない"
+        time.sleep(0.01)
+
+
+def test_large_batch_is_searchable_before_and_after_merge():
+    index = PrefixIndex([f"L{i:04d}" for i in range(0, 1000, 2)])
+    index.update([f"L{i:04d}" for i in range(1, 1000, 2)])
+    index.add("L0999X")
+
+    expected = [f"L{i:04d}" for i in range(100, 120)]
+    assert index.search("L01") == expected
+    assert index.search("L0999") == ["L0999", "L0999X"]
+    _wait_merged(index)
+    assert index.search("L01") == expected
+    assert len(index) == 1001
+    assert index._lists[0] == sorted(index._lists[0])
+
+
+def test_small_update_is_inserted_directly():
+    index = PrefixIndex(["B", "D"])
+    index.update(["C", "A"])
+    assert index._lists == (["A", "B", "C", "D"], [])
+    assert not index._merging
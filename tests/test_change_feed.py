@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+変更フィードのテスト
+変更の書き込みの途中で停止しても、再起動後に変更が抜けたり二重に記録されたりしない
+"""
+import pytest
+
+from change_feed import ChangeFeed
+from record_log import delete_record, update_record
+from record_store import RecordStore
+
+
+class Crash(Exception):
+    pass
+
+
+def _record(lot):
+    return {"entry_date": "2024-05-01", "product_name": "A", "lot_no": lot,
+            "details": {}, "registered_at": "2024-05-01T00:00:00"}
+
+
+def _restart():
+    """プロセスを起動し直した状態（保存先もフィードも開き直す）"""
+    store = RecordStore("input_data.json")
+    feed = ChangeFeed()
+    feed.attach(store)
+    return store, feed
+
+
+def _changes(feed):
+    return [(c["op"], c["record"]["lot_no"] if c["record"] else None) for c in feed.read(0, limit=1000)]
+
+
+@pytest.fixture
+def running(workdir):
+    store, feed = _restart()
+    store.append_records([_record("L0")])
+    return store, feed
+
+
+def test_crash_before_changes_are_written(running, monkeypatch):
+    store, feed = running
+
+    def crash(first_seq, lines):
+        with open(feed.segment_paths()[-1], "ab") as f:
+            f.write(lines[0][:10])  # 書きかけの行を残して停止
+        raise Crash()
+    monkeypatch.setattr(feed, "_append_lines", crash)
+    store.append_records([_record("L1")])
+    assert isinstance(feed.last_error, Crash)
+
+    store, feed = _restart()
+    store.append_records([_record("L2")])
+    assert _changes(feed) == [("insert", "L0"), ("insert", "L1"), ("insert", "L2")]
+    assert [c["seq"] for c in feed.read(0)] == [1, 2, 3]
+
+
+def test_crash_before_commit(running, monkeypatch):
+    store, feed = running
+    record = store.load_records()[0]
+    save_state = feed._save_state
+
+    def crash_on_commit(state):
+        if not state.get("pending"):
+            raise Crash()
+        save_state(state)
+    monkeypatch.setattr(feed, "_save_state", crash_on_commit)
+    update_record(store, record, {"lot_no": "L0-R"})
+    assert isinstance(feed.last_error, Crash)
+
+    store, feed = _restart()
+    delete_record(store, store.load_records()[-1])
+    assert _changes(feed) == [("insert", "L0"), ("update", "L0-R"), ("delete", "L0-R")]
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列ストアのテスト
+編集・削除・上書き登録を作り直さずに反映する
+"""
+import json
+
+import pytest
+
+from column_store import ColumnStore
+from record_log import delete_record, update_record
+from record_store import RecordStore
+
+
+@pytest.fixture
+def store(workdir):
+    with open("form_config.json", "w", encoding="utf-8") as f:
+        json.dump([{"label_name": "電圧", "data_type": "数値"}], f)
+    store = RecordStore("input_data.json")
+    store.append_records([_record(f"L{i}", float(i), i) for i in range(5)])
+    return store
+
+
+def _record(lot, value, second):
+    return {"entry_date": "2024-05-01", "product_name": "A", "lot_no": lot,
+            "details": {"電圧": value}, "registered_at": f"2024-05-01T00:00:{second:02d}"}
+
+
+def _attached(store, monkeypatch):
+    column_store = ColumnStore("columns")
+    column_store.attach(store, background=False)
+
+    def no_rebuild():
+        raise AssertionError("作り直さずに反映できるはず")
+    monkeypatch.setattr(column_store, "rebuild", no_rebuild)
+    return column_store
+
+
+def _values(column_store):
+    return [value for _, value in column_store.points("電圧")]
+
+
+def test_edit_and_delete_are_applied_incrementally(store, monkeypatch):
+    column_store = _attached(store, monkeypatch)
+    records = store.load_records()
+    update_record(store, records[1], {"details": {"電圧": 10.0}})
+    delete_record(store, records[3])
+    column_store.sync()
+    assert _values(column_store) == [0.0, 10.0, 2.0, 4.0]
+
+    # 行の表はファイルから読み直しても同じように使える
+    reopened = _attached(store, monkeypatch)
+    delete_record(store, records[0])
+    reopened.sync()
+    assert _values(reopened) == [10.0, 2.0, 4.0]
+
+
+def test_overwrite_is_applied_without_rebuild(store, monkeypatch):
+    column_store = _attached(store, monkeypatch)
+    store.replace_records({"lot_no": "L2"}, _record("L2", 20.0, 2))
+    store.append_records([_record("L5", 5.0, 5)])
+    column_store.sync()
+    assert _values(column_store) == [0.0, 1.0, 20.0, 3.0, 4.0, 5.0]
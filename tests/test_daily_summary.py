@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日次集計のテスト
+登録・編集・削除を追記ファイルへの差分で反映し、全件から集計した結果と一致する
+"""
+import json
+import os
+
+import pytest
+
+import daily_summary
+from daily_summary import DailySummary, summarize
+from record_log import delete_record, resolve_records, update_record
+from record_store import RecordStore
+
+
+@pytest.fixture
+def store(workdir):
+    with open("form_config.json", "w", encoding="utf-8") as f:
+        json.dump([{"label_name": "電圧", "data_type": "数値", "min_value": 0, "max_value": 10}], f)
+    store = RecordStore("input_data.json")
+    store.append_records([_record(f"L{i}", float(i)) for i in range(5)])
+    return store
+
+
+def _record(lot, value, day="2024-05-01"):
+    return {"entry_date": day, "product_name": "A", "lot_no": lot,
+            "details": {"電圧": value}, "registered_at": f"{day}T00:00:00"}
+
+
+def _attached(store, monkeypatch):
+    summary = DailySummary()
+    summary.attach(store, background=False)
+
+    def no_rebuild():
+        raise AssertionError("作り直さずに反映できるはず")
+    monkeypatch.setattr(summary, "rebuild", no_rebuild)
+    return summary
+
+
+def _expected(store):
+    return summarize(resolve_records(list(store.iter_records())))
+
+
+def _reloaded():
+    summary = DailySummary()
+    return summary._load()["days"]
+
+
+def test_append_writes_delta_without_rewriting_summary(store, monkeypatch):
+    summary = _attached(store, monkeypatch)
+    saved = os.stat(summary.path).st_mtime_ns
+    store.append_records([_record("L9", 11.0, "2024-05-02")])
+
+    assert os.stat(summary.path).st_mtime_ns == saved
+    with open(summary.journal_path, "rb") as f:
+        assert len(f.readlines()) == 1
+    assert summary._data["days"] == _expected(store)
+    assert _reloaded() == _expected(store)
+
+
+def test_edit_and_delete_subtract_previous_version(store, monkeypatch):
+    summary = _attached(store, monkeypatch)
+    records = list(store.iter_records())
+    update_record(store, records[2], {"details": {"電圧": 20.0}})
+    delete_record(store, records[4])  # 最大値を削除する
+    update_record(store, records[0], {"entry_date": "2024-05-03"})
+    assert summary.sync(apply_log_entries=True)
+
+    expected = _expected(store)
+    assert summary._data["days"] == expected
+    assert expected["2024-05-01"]["A"]["fields"]["電圧"][4] == 20.0
+    assert _reloaded() == expected
+
+
+def test_previous_version_found_without_recent_records(store, monkeypatch):
+    summary = _attached(store, monkeypatch)
+    summary._recent.clear()
+    delete_record(store, list(store.iter_records())[1])
+    assert summary.sync(apply_log_entries=True)
+    assert summary._data["days"] == _expected(store)
+
+
+def test_journal_is_compacted(store, monkeypatch):
+    monkeypatch.setattr(daily_summary, "COMPACT_LINES", 2)
+    summary = _attached(store, monkeypatch)
+    for i in range(3):
+        store.append_records([_record(f"M{i}", 1.0)])
+
+    assert os.path.getsize(summary.journal_path) == 0
+    assert _reloaded() == _expected(store)
+
+
+def test_torn_journal_line_is_ignored(store, monkeypatch):
+    summary = _attached(store, monkeypatch)
+    store.append_records([_record("L9", 3.0)])
+    with open(summary.journal_path, "ab") as f:
+        f.write(b'{"generation":')
+
+    reloaded = DailySummary()
+    reloaded.attach(store, background=False)
+    assert reloaded._data["days"] == _expected(store)
+    assert os.path.getsize(reloaded.journal_path) == 0
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+測定器受信サービスのテスト
+保存中に停止された場合の二重保存
+"""
+import asyncio
+import threading
+
+from device_ingest import DeviceIngestService
+
+FIELD = {"label_name": "電圧", "data_type": "数値"}
+DEVICE = {"name": "meter", "field": "電圧", "product_name": "A", "lot_no": "L1"}
+
+
+class SlowStore:
+    """保存の完了を release まで待たせる入力データファイルの代わり"""
+
+    def __init__(self, fail_first=False):
+        self.saved = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.fail_first = fail_first
+
+    def append_records(self, records):
+        self.started.set()
+        self.release.wait(5)
+        if self.fail_first:
+            self.fail_first = False
+            raise OSError("disk full")
+        self.saved.append([record["details"]["電圧"] for record in records])
+
+
+def _run_and_cancel_during_save(store):
+    async def scenario():
+        service = DeviceIngestService([], store=store, config=[FIELD], batch_size=2, batch_interval=0.01)
+        task = asyncio.create_task(service.run())
+        await asyncio.sleep(0)
+        await service._put(DEVICE, "1.0")
+        await service._put(DEVICE, "2.0")
+        while not store.started.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        asyncio.get_running_loop().call_later(0.05, store.release.set)
+        await task
+
+    asyncio.run(scenario())
+
+
+def test_cancel_during_save_does_not_save_twice():
+    store = SlowStore()
+    _run_and_cancel_during_save(store)
+    assert store.saved == [[1.0, 2.0]]
+
+
+def test_cancel_during_failed_save_saves_on_stop():
+    store = SlowStore(fail_first=True)
+    _run_and_cancel_during_save(store)
+    assert store.saved == [[1.0, 2.0]]
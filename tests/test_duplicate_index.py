@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重複登録チェックのテスト
+編集でキーが変わった場合・削除・上書き登録の後の判定
+"""
+from duplicate_index import RecordKeyIndex
+from record_log import delete_record, update_record
+from record_store import RecordStore
+
+
+def _record(lot, entry_date="2024-05-01"):
+    return {"entry_date": entry_date, "product_name": "A", "lot_no": lot,
+            "details": {}, "registered_at": f"{entry_date}T00:00:00"}
+
+
+def _attached(store):
+    index = RecordKeyIndex()
+    index.attach(store, background=False)
+    return index
+
+
+def test_edit_that_changes_key_discards_old_key(workdir):
+    store = RecordStore("input_data.json")
+    record = _record("L1")
+    store.append_records([record])
+    index = _attached(store)
+
+    update_record(store, record, {"lot_no": "L2"})
+    assert index.contains(_record("L1")) is False
+    assert index.contains(_record("L2")) is True
+
+    # 作り直した索引でも同じ結果になる
+    rebuilt = _attached(RecordStore("input_data.json"))
+    assert rebuilt.contains(_record("L1")) is False
+    assert rebuilt.contains(_record("L2")) is True
+
+
+def test_key_stays_while_another_record_has_it(workdir):
+    store = RecordStore("input_data.json")
+    first, second = _record("L1"), _record("L1")
+    second["registered_at"] = "2024-05-01T00:00:01"
+    store.append_records([first, second])
+    index = _attached(store)
+
+    delete_record(store, first)
+    assert index.contains(_record("L1")) is True
+    update_record(store, second, {"entry_date": "2024-05-02"})
+    assert index.contains(_record("L1")) is False
+    assert index.contains(_record("L1", "2024-05-02")) is True
+
+
+def test_replace_keeps_single_key(workdir):
+    store = RecordStore("input_data.json")
+    store.append_records([_record("L1"), _record("L2")])
+    index = _attached(store)
+    store.replace_records({"product_name": "A", "lot_no": "L2", "entry_date": "2024-05-01"}, _record("L2"))
+    assert index.contains(_record("L2")) is True
+    assert index.contains(_record("L1")) is True
+
+
+def test_contains_does_not_wait_for_history():
+    index = RecordKeyIndex()
+    assert index.contains(_record("L1")) is None
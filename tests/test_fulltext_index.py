@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文検索インデックスのテスト
+他の保存先オブジェクトが追記した分の反映と、表示順の行番号
+"""
+import time
+
+from fulltext_index import FullTextIndex, hit_key
+from record_log import delete_record, update_record
+from record_snapshot import open_records
+from record_store import RecordStore
+
+
+def _record(lot, note):
+    return {"entry_date": "2024-05-01", "product_name": "A", "lot_no": lot,
+            "details": {"備考": note}, "registered_at": f"2024-05-01T00:00:{lot}"}
+
+
+def test_appends_by_another_store_are_indexed(workdir):
+    store = RecordStore("input_data.json")
+    store.append_records([_record("01", "キズあり")])
+    index = FullTextIndex(["備考"])
+    index.attach(store, background=False)
+
+    # 別プロセスと同じく、通知の届かない別の保存先オブジェクトから追記する
+    other = RecordStore("input_data.json")
+    other.append_records([_record("02", "きず・汚れ")])
+    assert [key[2] for key in index.search("キズ")] == ["02", "01"]
+
+    other.append_records([_record("03", "汚れ")])
+    assert [key[2] for key in index.search("汚れ")] == ["03", "02"]
+
+
+def test_index_created_before_data_file_picks_up_appends(workdir):
+    store = RecordStore("input_data.json")
+    index = FullTextIndex(["備考"])
+    index.attach(store, background=False)
+    RecordStore("input_data.json").append_records([_record("01", "キズ")])
+    index.search("キズ")  # ファイルができたことを検出して別スレッドで作り直す
+    deadline = time.monotonic() + 5
+    while index._pending is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [key[2] for key in index.search("キズ")] == ["01"]
+
+
+def test_rows_follow_display_order_after_edit_and_delete(workdir):
+    store = RecordStore("input_data.json")
+    records = [_record(f"{i:02d}", "キズ" if i % 2 else "なし") for i in range(10)]
+    store.append_records(records)
+    index = FullTextIndex(["備考"])
+    index.attach(store, background=False)
+
+    delete_record(store, records[1])
+    update_record(store, records[4], {"details": {"備考": "キズ（再検査）"}})
+    delete_record(store, records[6])
+
+    shown = open_records(store)
+    try:
+        hits = index.search_rows("キズ")
+        assert [key[2] for _, key in hits] == ["04", "09", "07", "05", "03"]
+        for row, key in hits:
+            assert shown.row(row) == key
+            assert hit_key(shown.record(row)) == key
+    finally:
+        shown.close()
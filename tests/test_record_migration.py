@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+旧形式の入力データファイルの移行のテスト
+中断した移行を再実行すると続きから移し、記録前に書き込まれていたデータを二重に登録しない
+"""
+import json
+
+import pytest
+
+import record_migration
+from record_archive import RecordArchive
+from record_log import record_id
+from record_migration import migrate
+from record_store import RecordStore
+
+CONFIG = [{"label_name": "電圧", "data_type": "数値"}]
+
+
+@pytest.fixture
+def source(workdir):
+    legacy = [{"entry_date": "2024/05/01", "product_name": "A", "lot_no": f"L{i}", "電圧": str(i),
+               "registered_at": f"2024-05-01T00:00:{i:02d}"} for i in range(10)]
+    legacy.append(dict(legacy[0]))  # 同じ内容の古いデータ
+    with open("old_data.json", "w", encoding="utf-8") as f:
+        json.dump(legacy, f, ensure_ascii=False)
+    return "old_data.json"
+
+
+def _migrate(source, store, **kwargs):
+    return migrate(source, store, RecordArchive("archive"), config=CONFIG, chunk_size=3, **kwargs)
+
+
+def _lots(store):
+    return sorted(r["lot_no"] for r in store.iter_records())
+
+
+def test_resume_after_crash_before_checkpoint(source, monkeypatch):
+    store = RecordStore("input_data.json")
+    save_state = record_migration._save_state
+    calls = []
+
+    def crash_on_second_checkpoint(path, state):
+        calls.append(path)
+        if len(calls) == 2:
+            raise KeyboardInterrupt  # 2つ目のチャンクを書き込んだ後、記録する前に中断
+        save_state(path, state)
+    monkeypatch.setattr(record_migration, "_save_state", crash_on_second_checkpoint)
+    with pytest.raises(KeyboardInterrupt):
+        _migrate(source, store)
+    assert len(store.load_records()) == 6
+
+    monkeypatch.setattr(record_migration, "_save_state", save_state)
+    summary = _migrate(source, store)
+
+    assert summary["completed"]
+    assert summary["skipped"] == 3
+    assert summary["imported"] + summary["skipped"] == 11
+    records = store.load_records()
+    assert len({record_id(r) for r in records}) == 11
+    assert _lots(store) == sorted([f"L{i}" for i in range(10)] + ["L0"])
+    assert records[0]["details"]["電圧"] == 0.0
+
+
+def test_resume_after_cancel(source):
+    store = RecordStore("input_data.json")
+    checks = iter([False, True])
+    summary = _migrate(source, store, cancelled=lambda: next(checks, False))
+    assert not summary["completed"]
+    assert len(store.load_records()) == 3
+
+    summary = _migrate(source, store)
+    assert summary["completed"]
+    assert summary["skipped"] == 0
+    assert len(store.load_records()) == 11
+    assert _migrate(source, store)["resumed"]
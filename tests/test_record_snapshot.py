@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登録データのスナップショットのテスト
+スナップショットより後の編集・削除を重ねて表示する
+"""
+from record_archive import get_archive, iter_all_records
+from record_log import delete_record, update_record
+from record_snapshot import (
+    COLUMNS, SnapshotRecords, open_records, snapshot_path, source_state, write_snapshot,
+)
+from record_store import RecordStore
+
+
+def _record(lot, second):
+    return {"entry_date": "2024-05-01", "product_name": "A", "lot_no": lot,
+            "details": {}, "registered_at": f"2024-05-01T00:00:{second:02d}"}
+
+
+def _rows(records):
+    return [records.row(i) for i in range(len(records))]
+
+
+def test_edits_after_snapshot_are_overlaid(workdir):
+    store = RecordStore("input_data.json")
+    records = [_record(f"L{i}", i) for i in range(8)]
+    store.append_records(records)
+    write_snapshot(snapshot_path(store), store.load_records(),
+                   source_state(store, get_archive(), store.end_position()))
+
+    delete_record(store, records[0])
+    delete_record(store, records[5])
+    update_record(store, records[3], {"lot_no": "L3-R"})
+    later = _record("L8", 8)
+    store.append_records([later])
+    update_record(store, later, {"lot_no": "L8-R"})
+    delete_record(store, records[6])
+
+    expected = [tuple(r.get(key, "") for key in COLUMNS) for r in iter_all_records(store)]
+    shown = open_records(store)
+    try:
+        assert isinstance(shown, SnapshotRecords)
+        assert _rows(shown) == expected
+        assert [r[2] for r in expected] == ["L1", "L2", "L3-R", "L4", "L7", "L8-R"]
+        assert shown.record(2)["lot_no"] == "L3-R"
+        assert shown.snapshot.find(records[4]["record_id"]) == 4
+        assert shown.snapshot.find("no-such-id") is None
+    finally:
+        shown.close()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+入力規則チェックのテスト
+数値項目の空欄・nan・inf の扱い
+"""
+import math
+
+import pytest
+
+from record_migration import map_record
+from record_validation import build_record, convert_value
+
+VOLTAGE = {"label_name": "電圧", "data_type": "数値", "is_required": True}
+CURRENT = {"label_name": "電流", "data_type": "数値", "is_required": False}
+
+
+def _build(details):
+    return build_record([VOLTAGE, CURRENT], "2024-05-01", "A", "L1", details)
+
+
+def test_blank_required_number_is_error():
+    record, errors = _build({"電圧": "", "電流": "1.5"})
+    assert record is None
+    assert errors == ["「電圧」は必須項目です。"]
+
+
+def test_blank_optional_number_is_none():
+    record, errors = _build({"電圧": "3.3", "電流": "  "})
+    assert errors == []
+    assert record["details"] == {"電圧": 3.3, "電流": None}
+
+
+@pytest.mark.parametrize("raw", ["nan", "NaN", "inf", "-inf", "1e999", float("nan"), float("inf")])
+def test_non_finite_number_is_rejected(raw):
+    value, error = convert_value(VOLTAGE, raw)
+    assert value is None
+    assert error == "「電圧」は数値で入力してください。"
+    record, errors = _build({"電圧": raw})
+    assert record is None
+    assert "「電圧」は数値で入力してください。" in errors
+
+
+def test_typed_number_is_accepted():
+    assert convert_value(VOLTAGE, 3) == (3.0, None)
+    assert convert_value(VOLTAGE, "1,234.5") == (1234.5, None)
+
+
+def test_migration_keeps_blank_as_missing_and_rejects_nan():
+    legacy = {"entry_date": "2024-05-01", "product_name": "A", "lot_no": "L1",
+              "details": {"電圧": "", "電流": 2}}
+    record, errors = map_record([VOLTAGE, CURRENT], legacy, 0)
+    assert errors == []
+    assert record["details"]["電圧"] is None
+    assert record["details"]["電流"] == 2.0
+
+    legacy["details"]["電圧"] = math.nan
+    record, errors = map_record([VOLTAGE, CURRENT], legacy, 0)
+    assert record is None
+    assert errors == ["「電圧」は数値で入力してください。"]
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+品種別の保存先のテスト
+品種を指定しない検索（シャードごとの並列検索）の結果
+"""
+from record_archive import get_archive
+from record_log import delete_record, update_record
+from sharded_store import ShardedRecordStore
+
+
+def _record(product, lot, second):
+    return {"entry_date": "2024-05-01", "product_name": product, "lot_no": lot,
+            "details": {"電圧": float(second)}, "registered_at": f"2024-05-01T00:00:{second:02d}"}
+
+
+def test_cross_shard_query_is_resolved_and_in_registered_order(workdir):
+    store = ShardedRecordStore("shards")
+    records = [_record(product, f"L{i}", i) for i, product in enumerate("ABCABCABC")]
+    store.append_records(records)
+    delete_record(store, records[1])
+    update_record(store, records[3], {"lot_no": "L3-R"})
+
+    results = list(store.iter_resolved(get_archive(), {"date_from": "2024-05-01"}))
+    assert [(r["product_name"], r["lot_no"]) for r in results] == [
+        ("A", "L0"), ("C", "L2"), ("A", "L3-R"), ("B", "L4"), ("C", "L5"),
+        ("A", "L6"), ("B", "L7"), ("C", "L8"),
+    ]
+    assert list(store.iter_resolved(get_archive(), {"lot_no": "L9"})) == []